@@ -1,50 +1,255 @@
+"""Volcengine Ark image generation client.
+
+:class:`ArkImageClient` shares one ``httpx.AsyncClient`` (connection pool with
+keep-alive) across calls, retries transient failures with exponential backoff
+and full jitter, bounds every call by a deadline and stops calling Ark for a
+while once a circuit breaker has seen too many consecutive failures.
+"""
 from __future__ import annotations
 
+import asyncio
+import random
 import time
-from typing import Any
+from typing import Any, Callable
 
 import httpx
 
-from .config import get_settings
+from .config import Settings, get_settings
+
+# 网络错误、限流与服务端错误值得重试；其余 4xx 说明请求本身有问题，重试无意义。
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
 
 
 class ArkImageError(RuntimeError):
     pass
 
 
-def generate_image(prompt: str, *, retries: int = 3, delay_seconds: float = 2.0) -> str:
-    """Call Volcengine Ark to generate an image and return the first URL."""
+class ArkCircuitOpenError(ArkImageError):
+    """Raised without calling Ark while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one trial call) -> closed."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            # 冷却结束后只放行一个试探请求，其余请求继续快速失败。
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._trial_in_flight or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+        self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Give back a half-open trial slot without counting a success or a failure."""
+
+        self._trial_in_flight = False
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (self._clock() - self._opened_at))
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: random.Random | None = None) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2 ** (attempt - 1)))."""
+
+    return (rng or random).uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def _retry_after_seconds(response: httpx.Response) -> float | None:
+    try:
+        return max(0.0, float(response.headers["retry-after"]))
+    except (KeyError, ValueError):
+        return None
+
+
+class ArkImageClient:
+    """Async Ark client; create once per event loop and reuse it for every call."""
+
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        *,
+        transport: httpx.AsyncBaseTransport | None = None,
+        rng: random.Random | None = None,
+    ) -> None:
+        self.settings = settings or get_settings()
+        self.breaker = CircuitBreaker(
+            self.settings.ark_breaker_failure_threshold, self.settings.ark_breaker_reset_seconds
+        )
+        self._rng = rng or random.Random()
+        self._http = httpx.AsyncClient(
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=self.settings.ark_max_connections,
+                max_keepalive_connections=self.settings.ark_max_connections,
+                keepalive_expiry=self.settings.ark_keepalive_seconds,
+            ),
+            timeout=httpx.Timeout(self.settings.ark_attempt_timeout_seconds, connect=5.0),
+        )
 
-    settings = get_settings()
-    if not settings.ark_api_key:
-        raise ArkImageError("ARK_API_KEY 尚未配置，无法生成图片")
+    async def aclose(self) -> None:
+        await self._http.aclose()
 
-    # 通过环境变量读取 key，并在此处实现带重试的调用逻辑，避免把敏感信息写入仓库。
-    payload: dict[str, Any] = {
-        "model": settings.ark_model,
-        "prompt": prompt,
-        "sequential_image_generation": settings.ark_sequential_mode,
-        "response_format": settings.ark_response_format,
-        "size": settings.ark_image_size,
-        "stream": settings.ark_stream,
-        "watermark": settings.ark_watermark,
-    }
+    async def __aenter__(self) -> ArkImageClient:
+        return self
 
-    headers = {
-        "Authorization": f"Bearer {settings.ark_api_key}",
-        "Content-Type": "application/json",
-    }
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+    def _payload(self, prompt: str) -> dict[str, Any]:
+        settings = self.settings
+        return {
+            "model": settings.ark_model,
+            "prompt": prompt,
+            "sequential_image_generation": settings.ark_sequential_mode,
+            "response_format": settings.ark_response_format,
+            "size": settings.ark_image_size,
+            "stream": settings.ark_stream,
+            "watermark": settings.ark_watermark,
+        }
+
+    async def generate_image(self, prompt: str, *, deadline_seconds: float | None = None) -> str:
+        """Generate an image and return the first URL, giving up after ``deadline_seconds``."""
+
+        settings = self.settings
+        if not settings.ark_api_key:
+            raise ArkImageError("ARK_API_KEY 尚未配置，无法生成图片")
+
+        # 通过环境变量读取 key，避免把敏感信息写入仓库。
+        headers = {"Authorization": f"Bearer {settings.ark_api_key}"}
+        payload = self._payload(prompt)
+        budget = settings.ark_deadline_seconds if deadline_seconds is None else deadline_seconds
+        deadline = time.monotonic() + budget
+        last_error: str = "未发出请求"
+
+        for attempt in range(1, settings.ark_max_retries + 1):
+            # 先检查剩余时间再领取试探名额，领到名额后的每条出口都要记录结果。
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                raise ArkCircuitOpenError(
+                    f"Ark 连续失败，熔断中（约 {self.breaker.retry_after():.0f} 秒后重试）: {last_error}"
+                )
+
+            retry_after: float | None = None
+            try:
+                # 单次请求的超时不能超过本次调用剩余的时间。
+                response = await self._http.post(
+                    settings.ark_base_url,
+                    json=payload,
+                    headers=headers,
+                    timeout=min(settings.ark_attempt_timeout_seconds, remaining),
+                )
+            except httpx.TransportError as exc:
+                last_error = f"{type(exc).__name__}: {exc}"
+            except BaseException:
+                # 被取消（客户端断开、同步包装里 wait_for 超时）或本地异常：不是 Ark 的故障，不计失败，
+                # 但要归还半开状态的试探名额，否则之后的请求永远被拒。
+                self.breaker.release_trial()
+                raise
+            else:
+                if response.status_code < 400:
+                    try:
+                        url = response.json()["data"][0]["url"]
+                    except (ValueError, KeyError, IndexError, TypeError) as exc:
+                        # 服务正常但返回内容不对，不算作 Ark 故障。
+                        self.breaker.record_success()
+                        raise ArkImageError(f"Ark 返回格式异常: {exc!r}") from exc
+                    self.breaker.record_success()
+                    return url
+                last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRYABLE_STATUS:
+                    self.breaker.record_success()
+                    raise ArkImageError(f"生成图片失败: {last_error}")
+                retry_after = _retry_after_seconds(response)
+
+            self.breaker.record_failure()
+            if attempt == settings.ark_max_retries:
+                break
+            delay = backoff_delay(
+                attempt, settings.ark_backoff_base_seconds, settings.ark_backoff_max_seconds, self._rng
+            )
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if time.monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+
+        if time.monotonic() >= deadline:
+            raise ArkImageError(f"生成图片超时（{budget:g} 秒）: {last_error}")
+        raise ArkImageError(f"生成图片失败: {last_error}")
+
+    async def download(self, url: str) -> bytes:
+        """Fetch a generated image over the shared connection pool."""
 
-    last_error: Exception | None = None
-    for attempt in range(1, retries + 1):
         try:
-            response = httpx.post(settings.ark_base_url, json=payload, headers=headers, timeout=60)
+            response = await self._http.get(url, timeout=self.settings.ark_attempt_timeout_seconds)
             response.raise_for_status()
-            data = response.json()
-            url = data["data"][0]["url"]
-            return url
-        except Exception as exc:  # pragma: no cover - network errors can't be reproduced in tests
-            last_error = exc
-            if attempt < retries:
-                time.sleep(delay_seconds)
-    raise ArkImageError(f"生成图片失败: {last_error}")
+        except httpx.HTTPError as exc:
+            raise ArkImageError(f"下载图片失败: {exc}") from exc
+        return response.content
+
+
+_client: ArkImageClient | None = None
+
+
+def get_ark_client() -> ArkImageClient:
+    """Process-wide client, created lazily inside the running event loop."""
+
+    global _client
+    if _client is None:
+        _client = ArkImageClient()
+    return _client
+
+
+async def close_ark_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def generate_image(prompt: str, *, deadline_seconds: float | None = None) -> str:
+    """Blocking wrapper for scripts; request handlers should await ``get_ark_client()``."""
+
+    async def run() -> str:
+        async with ArkImageClient() as client:
+            return await client.generate_image(prompt, deadline_seconds=deadline_seconds)
+
+    return asyncio.run(run())
@@ -0,0 +1,358 @@
+"""Simulate a classroom of students running the real practice flow.
+
+Each simulated student logs in, then repeatedly generates a question, answers it
+up to three times (right with ``--correct-rate`` probability, otherwise a wrong
+but well-formed expression), buys food when affordable and polls summary and
+history, pausing for a random think time between steps.
+
+Usage::
+
+    python -m backend.benchmarks.classroom --students 40 --duration 60 --workers 2
+    python -m backend.benchmarks.classroom --students 80 --think-time 1,5 \\
+        --topics add_sub=3,poly_ops=2,factorization=1 --difficulties basic=2,intermediate=1
+    python -m backend.benchmarks.classroom --base-url http://127.0.0.1:8000   # 压测已启动的服务
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+import httpx
+from sqlalchemy import create_engine
+
+from ..database import Base
+from ..migrations import run_migrations
+from ..services import MAX_ATTEMPTS_PER_QUESTION, normalize_expr
+
+TOPICS = ("add_sub", "mul_div", "poly_ops", "factorization", "mixed_ops")
+DIFFICULTIES = ("basic", "intermediate", "advanced")
+PERCENTILES = (50, 90, 95, 99)
+
+
+@dataclass
+class ClassroomConfig:
+    students: int = 30
+    duration: float = 60.0
+    think_time: tuple[float, float] = (2.0, 8.0)
+    correct_rate: float = 0.7
+    buy_rate: float = 0.3
+    topics: dict[str, float] = field(default_factory=lambda: dict.fromkeys(TOPICS, 1.0))
+    difficulties: dict[str, float] = field(default_factory=lambda: dict.fromkeys(DIFFICULTIES, 1.0))
+    class_name: str = "LOAD"
+    seed: int | None = None
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def percentile(self, pct: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+@dataclass
+class LoadReport:
+    elapsed: float
+    endpoints: dict[str, EndpointStats]
+
+    @property
+    def total_requests(self) -> int:
+        return sum(len(stats.latencies) for stats in self.endpoints.values())
+
+    @property
+    def total_errors(self) -> int:
+        return sum(stats.errors for stats in self.endpoints.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "elapsed_s": round(self.elapsed, 3),
+            "requests": self.total_requests,
+            "errors": self.total_errors,
+            "throughput_rps": round(self.total_requests / self.elapsed, 2) if self.elapsed else 0.0,
+            "endpoints": {
+                name: {
+                    "count": len(stats.latencies),
+                    "errors": stats.errors,
+                    "error_rate": round(stats.errors / len(stats.latencies), 4) if stats.latencies else 0.0,
+                    **{f"p{pct}_ms": round(stats.percentile(pct) * 1000, 2) for pct in PERCENTILES},
+                    "max_ms": round(max(stats.latencies, default=0.0) * 1000, 2),
+                }
+                for name, stats in sorted(self.endpoints.items())
+            },
+        }
+
+    def format_table(self) -> str:
+        data = self.as_dict()
+        lines = [
+            f"{'endpoint':<38}{'count':>7}{'err%':>7}"
+            + "".join(f"{f'p{pct}':>9}" for pct in PERCENTILES)
+            + f"{'max':>9}"
+        ]
+        for name, row in data["endpoints"].items():
+            lines.append(
+                f"{name:<38}{row['count']:>7}{row['error_rate'] * 100:>6.1f}%"
+                + "".join(f"{row[f'p{pct}_ms']:>9.1f}" for pct in PERCENTILES)
+                + f"{row['max_ms']:>9.1f}"
+            )
+        lines.append(
+            f"{data['requests']} requests, {data['errors']} errors in {data['elapsed_s']}s "
+            f"-> {data['throughput_rps']} req/s (latencies in ms)"
+        )
+        return "\n".join(lines)
+
+
+def expected_answer(expression_text: str) -> str:
+    """The answer a student who solved the question would type."""
+
+    return str(normalize_expr(expression_text))
+
+
+class Student:
+    def __init__(self, index: int, client: httpx.AsyncClient, config: ClassroomConfig, rng: random.Random,
+                 stats: dict[str, EndpointStats], deadline: float, foods: list[dict]) -> None:
+        self.index = index
+        self.client = client
+        self.config = config
+        self.rng = rng
+        self.stats = stats
+        self.deadline = deadline
+        self.foods = foods
+        self.user_id: int | None = None
+        self.score = 0
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> dict | list | None:
+        start = time.perf_counter()
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.stats[name].latencies.append(time.perf_counter() - start)
+            self.stats[name].errors += 1
+            return None
+        self.stats[name].latencies.append(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            self.stats[name].errors += 1
+            return None
+        return resp.json()
+
+    async def think(self) -> None:
+        low, high = self.config.think_time
+        await asyncio.sleep(self.rng.uniform(low, high))
+
+    def _pick(self, weights: dict[str, float]) -> str:
+        return self.rng.choices(list(weights), weights=list(weights.values()))[0]
+
+    async def run(self) -> None:
+        login = await self.request(
+            "POST /api/login",
+            "POST",
+            "/api/login",
+            json={
+                "chinese_name": f"压测{self.index}",
+                "english_name": f"Student{self.index}",
+                "class_name": self.config.class_name,
+            },
+        )
+        if not login:
+            return
+        self.user_id = login["userId"]
+        self.score = login["total_score"]
+        while time.monotonic() < self.deadline:
+            await self.practice_once()
+
+    async def practice_once(self) -> None:
+        question = await self.request(
+            "POST /api/generate_question",
+            "POST",
+            "/api/generate_question",
+            json={
+                "userId": self.user_id,
+                "topic": self._pick(self.config.topics),
+                "difficultyLevel": self._pick(self.config.difficulties),
+            },
+        )
+        if not question:
+            await self.think()
+            return
+
+        # 学生的计算不计入服务端耗时，放到线程里避免阻塞其他模拟学生的请求。
+        correct = await asyncio.to_thread(expected_answer, question["expressionText"])
+        for _ in range(MAX_ATTEMPTS_PER_QUESTION):
+            await self.think()
+            right = self.rng.random() < self.config.correct_rate
+            result = await self.request(
+                "POST /api/check_answer",
+                "POST",
+                "/api/check_answer",
+                json={
+                    "userId": self.user_id,
+                    "questionId": question["questionId"],
+                    "expressionText": question["expressionText"],
+                    "topic": question["topic"],
+                    "difficultyLevel": question["difficultyLevel"],
+                    "userAnswer": correct if right else f"{correct}+{self.rng.randint(1, 9)}",
+                },
+            )
+            if not result:
+                break
+            self.score = result["newTotalScore"]
+            if result["isCorrect"]:
+                break
+
+        affordable = [food for food in self.foods if food["price"] <= self.score]
+        if affordable and self.rng.random() < self.config.buy_rate:
+            food = self.rng.choice(affordable)
+            bought = await self.request(
+                "POST /api/buy_food",
+                "POST",
+                "/api/buy_food",
+                json={"userId": self.user_id, "foodId": food["foodId"]},
+            )
+            if bought:
+                self.score = bought["newTotalScore"]
+
+        await self.request("GET /api/users/{id}/summary", "GET", f"/api/users/{self.user_id}/summary")
+        await self.request("GET /api/history", "GET", "/api/history", params={"user_id": self.user_id})
+        await self.think()
+
+
+async def run_classroom(
+    base_url: str, config: ClassroomConfig, transport: httpx.AsyncBaseTransport | None = None
+) -> LoadReport:
+    rng = random.Random(config.seed)
+    stats: dict[str, EndpointStats] = defaultdict(EndpointStats)
+    limits = httpx.Limits(max_connections=config.students, max_keepalive_connections=config.students)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=60) as client:
+        foods = (await client.get("/api/foods")).json()["foods"]
+        start = time.perf_counter()
+        deadline = time.monotonic() + config.duration
+        students = [
+            Student(i, client, config, random.Random(rng.random()), stats, deadline, foods)
+            for i in range(config.students)
+        ]
+        await asyncio.gather(*(student.run() for student in students))
+        elapsed = time.perf_counter() - start
+    return LoadReport(elapsed=elapsed, endpoints=dict(stats))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_server(workers: int, env: dict[str, str]) -> Iterator[str]:
+    """Start uvicorn on a free port against a throwaway database."""
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=Path(__file__).resolve().parents[2],
+        env={**os.environ, **env},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            try:
+                if httpx.get(f"{base_url}/api/foods", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            time.sleep(0.1)
+        else:
+            raise RuntimeError("uvicorn did not become ready")
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def _weights(text: str, allowed: tuple[str, ...]) -> dict[str, float]:
+    weights = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in allowed:
+            raise argparse.ArgumentTypeError(f"unknown value {name!r}; choose from {', '.join(allowed)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def _range(text: str) -> tuple[float, float]:
+    low, _, high = text.partition(",")
+    return float(low), float(high or low)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of practice per student")
+    parser.add_argument("--think-time", type=_range, default=(2.0, 8.0), help="min,max seconds between steps")
+    parser.add_argument("--correct-rate", type=float, default=0.7)
+    parser.add_argument("--buy-rate", type=float, default=0.3)
+    parser.add_argument("--topics", type=lambda s: _weights(s, TOPICS), default=None)
+    parser.add_argument("--difficulties", type=lambda s: _weights(s, DIFFICULTIES), default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--base-url", default=None, help="target a running server instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    parser.add_argument("--journal-mode", default="WAL")
+    parser.add_argument("--synchronous", default="NORMAL")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    config = ClassroomConfig(
+        students=args.students,
+        duration=args.duration,
+        think_time=args.think_time,
+        correct_rate=args.correct_rate,
+        buy_rate=args.buy_rate,
+        seed=args.seed,
+    )
+    if args.topics:
+        config.topics = args.topics
+    if args.difficulties:
+        config.difficulties = args.difficulties
+
+    if args.base_url:
+        report = asyncio.run(run_classroom(args.base_url, config))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = f"sqlite:///{Path(tmp) / 'classroom.db'}"
+            # 先建好表，避免多个 worker 同时在空库上执行 create_all / 迁移。
+            engine = create_engine(database_url)
+            Base.metadata.create_all(bind=engine)
+            run_migrations(engine)
+            engine.dispose()
+            env = {
+                "DATABASE_URL": database_url,
+                "SQLITE_JOURNAL_MODE": args.journal_mode,
+                "SQLITE_SYNCHRONOUS": args.synchronous,
+            }
+            with local_server(args.workers, env) as base_url:
+                report = asyncio.run(run_classroom(base_url, config))
+
+    print(json.dumps(report.as_dict(), indent=2) if args.json else report.format_table())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Time every read path in ``services.py`` against a seeded database.
+
+Students are sampled from the heavy, median and light end of the activity
+distribution, since index and pagination changes mostly matter for the heavy
+end. ``--explain`` prints SQLite's query plan for each statement a path runs.
+
+Usage::
+
+    python -m backend.benchmarks.seed --database /tmp/bench.db --questions 2000000
+    python -m backend.benchmarks.queries --database /tmp/bench.db --iterations 200 --explain
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..models import Question, QuestionAttempt, User
+from ..schemas import HistoryCreate
+from ..services import (
+    create_history_entry,
+    get_cat_score,
+    get_history_entries,
+    get_recent_questions,
+)
+from ..user_cache import UserCache
+
+DEEP_PAGE_OFFSET = 1000
+
+
+@dataclass
+class PathResult:
+    name: str
+    tier: str
+    timings: list[float] = field(default_factory=list)
+    statements: int = 0
+    plans: list[str] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.timings)
+        return {
+            "path": self.name,
+            "tier": self.tier,
+            "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+            "statements": self.statements,
+        }
+
+
+def sample_users(db: Session) -> dict[str, int]:
+    """Pick the most active, median and least active students (by attempts)."""
+
+    counts = db.execute(
+        select(QuestionAttempt.user_id, func.count().label("n"))
+        .group_by(QuestionAttempt.user_id)
+        .order_by(func.count().desc())
+    ).all()
+    if not counts:
+        raise ValueError("数据库里没有答题记录，请先运行 backend.benchmarks.seed")
+    return {"heavy": counts[0][0], "median": counts[len(counts) // 2][0], "light": counts[-1][0]}
+
+
+def read_paths(db: Session, user_id: int) -> dict[str, Callable[[], object]]:
+    latest = db.execute(
+        select(QuestionAttempt).where(QuestionAttempt.user_id == user_id)
+        .order_by(QuestionAttempt.created_at.desc()).limit(1)
+    ).scalar_one()
+    question_id = db.scalar(select(Question.question_id).where(Question.user_id == user_id).limit(1))
+    oldest = latest.created_at - timedelta(days=30)
+    duplicate = HistoryCreate(
+        user_id=user_id,
+        question_text=latest.expression_text,
+        user_answer=latest.user_answer,
+        score=latest.score_change,
+    )
+    # 种子数据都在去重窗口之外：先提交一次，之后的重复提交只走去重查询，不再写库。
+    create_history_entry(db, duplicate)
+    uncached = UserCache(ttl=0)
+
+    return {
+        "user_lookup": lambda: uncached.get(db, user_id),
+        "state_version": lambda: uncached.current_version(db, user_id),
+        "question_lookup": lambda: db.execute(
+            select(Question).where(Question.question_id == question_id, Question.user_id == user_id)
+        ).first(),
+        "cat_score": lambda: get_cat_score(db, user_id),
+        "recent_questions": lambda: get_recent_questions(db, user_id),
+        "history_first_page": lambda: get_history_entries(db, user_id),
+        "history_deep_page": lambda: get_history_entries(db, user_id, limit=20, offset=DEEP_PAGE_OFFSET),
+        "history_min_score": lambda: get_history_entries(db, user_id, min_score=1),
+        "history_date_range": lambda: get_history_entries(
+            db, user_id, date_from=oldest, date_to=latest.created_at
+        ),
+        "history_dedupe": lambda: create_history_entry(db, duplicate),
+    }
+
+
+def capture_statements(target: Engine, func: Callable[[], object]) -> list[tuple[str, object]]:
+    """Run ``func`` once and return every (statement, parameters) it issued."""
+
+    captured: list[tuple[str, object]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(target, "before_cursor_execute", record)
+    try:
+        func()
+    finally:
+        event.remove(target, "before_cursor_execute", record)
+    return captured
+
+
+def query_plans(target: Engine, statements: list[tuple[str, object]]) -> list[str]:
+    plans = []
+    with target.connect() as conn:
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            plans.append(" ".join(statement.split())[:70] + " -> " + "; ".join(row[-1] for row in rows))
+    return plans
+
+
+def run_benchmark(target: Engine, iterations: int = 100, with_plans: bool = False) -> list[PathResult]:
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=target)
+    results = []
+    with factory() as db:
+        for tier, user_id in sample_users(db).items():
+            for name, func in read_paths(db, user_id).items():
+                statements = capture_statements(target, func)
+                result = PathResult(name=name, tier=tier, statements=len(statements))
+                if with_plans and tier == "heavy":
+                    result.plans = query_plans(target, statements)
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    func()
+                    result.timings.append(time.perf_counter() - start)
+                results.append(result)
+            db.rollback()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", type=Path, required=True)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--explain", action="store_true", help="print query plans for the heavy student")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{args.database}")
+    with engine.connect() as conn:
+        users = conn.scalar(select(func.count()).select_from(User))
+        attempts = conn.scalar(select(func.count()).select_from(QuestionAttempt))
+    results = run_benchmark(engine, args.iterations, with_plans=args.explain)
+    engine.dispose()
+
+    if args.json:
+        print(json.dumps([result.summary() for result in results], indent=2))
+        return
+    print(f"{users} users, {attempts} attempts, {args.iterations} iterations per path")
+    print(f"{'path':<22}{'tier':<8}{'mean':>9}{'p50':>9}{'p95':>9}{'stmts':>7}")
+    for result in results:
+        row = result.summary()
+        print(
+            f"{row['path']:<22}{row['tier']:<8}{row['mean_ms']:>9.3f}{row['p50_ms']:>9.3f}"
+            f"{row['p95_ms']:>9.3f}{row['statements']:>7}"
+        )
+    if args.explain:
+        print("\nquery plans (heavy student):")
+        for result in results:
+            if result.tier == "heavy":
+                for plan in result.plans:
+                    print(f"  {result.name}: {plan}")
+
+
+if __name__ == "__main__":
+    main()
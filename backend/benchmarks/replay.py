@@ -0,0 +1,247 @@
+"""Replay a recorded request log and compare latency between builds.
+
+Each recorded student's requests are replayed in order at their original
+offsets (divided by ``--speed``; ``--speed 0`` sends as fast as possible),
+students in parallel. Student and question ids are remapped from the recorded
+responses onto the fresh database, so real answer strings still reach
+``normalize_expr`` even though the questions themselves are regenerated.
+
+Usage::
+
+    python -m backend.benchmarks.replay run requests.jsonl.gz --speed 5 --output before.json
+    git checkout feature && python -m backend.benchmarks.replay run requests.jsonl.gz --speed 5 --output after.json
+    python -m backend.benchmarks.replay diff before.json after.json
+    python -m backend.benchmarks.replay run requests.jsonl --base-url http://127.0.0.1:8000   # 已启动的服务
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import re
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+from sqlalchemy import create_engine
+
+from ..database import Base
+from ..migrations import run_migrations
+from ..request_log import read_log
+from .classroom import PERCENTILES, EndpointStats, LoadReport, local_server
+
+USER_PATH = re.compile(r"^/api/users/(\d+)/")
+USER_KEYS = ("userId", "user_id")
+
+
+class IdMap:
+    """Recorded id -> id on the replay target, with waiters for ids not created yet."""
+
+    def __init__(self) -> None:
+        self._values: dict[str, dict[Any, Any]] = defaultdict(dict)
+        self._events: dict[tuple[str, Any], asyncio.Event] = {}
+
+    def _event(self, kind: str, old: Any) -> asyncio.Event:
+        return self._events.setdefault((kind, old), asyncio.Event())
+
+    def set(self, kind: str, old: Any, new: Any) -> None:
+        self._values[kind][old] = new
+        self._event(kind, old).set()
+
+    async def get(self, kind: str, old: Any, timeout: float = 30.0) -> Any:
+        if old in self._values[kind]:
+            return self._values[kind][old]
+        try:
+            await asyncio.wait_for(self._event(kind, old).wait(), timeout)
+        except asyncio.TimeoutError:
+            # 日志里没有该学生的登录记录（例如开始录制前就已登录）：原样发送。
+            return old
+        return self._values[kind][old]
+
+
+def recorded_user(record: dict[str, Any]) -> Any:
+    """The recorded student a request belongs to, or ``None`` for anonymous requests."""
+
+    if record["r"] == "/api/login":
+        return record.get("ids", {}).get("userId")
+    match = USER_PATH.match(record["p"])
+    if match:
+        return int(match.group(1))
+    for key, value in parse_qsl(record["q"]):
+        if key in USER_KEYS:
+            return int(value)
+    if record["b"]:
+        try:
+            body = json.loads(record["b"])
+        except ValueError:
+            return None
+        if isinstance(body, dict):
+            return next((body[key] for key in USER_KEYS if key in body), None)
+    return None
+
+
+async def _rewrite(record: dict[str, Any], ids: IdMap) -> tuple[str, dict[str, str], bytes | None]:
+    path = record["p"]
+    match = USER_PATH.match(path)
+    if match:
+        new_user = await ids.get("user", int(match.group(1)))
+        path = f"/api/users/{new_user}/" + path[match.end():]
+
+    params = dict(parse_qsl(record["q"]))
+    for key in USER_KEYS:
+        if key in params:
+            params[key] = str(await ids.get("user", int(params[key])))
+
+    body = None
+    if record["b"]:
+        try:
+            data = json.loads(record["b"])
+        except ValueError:
+            return path, params, record["b"].encode()
+        if isinstance(data, dict):
+            for key in USER_KEYS:
+                if key in data:
+                    data[key] = await ids.get("user", data[key])
+            if "questionId" in data:
+                data["questionId"] = await ids.get("question", data["questionId"])
+        body = json.dumps(data, ensure_ascii=False).encode()
+    return path, params, body
+
+
+async def replay(
+    records: list[dict[str, Any]],
+    base_url: str,
+    speed: float = 1.0,
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> LoadReport:
+    records = sorted((r for r in records if r.get("r")), key=lambda r: r["t"])
+    if not records:
+        return LoadReport(elapsed=0.0, endpoints={})
+    origin = records[0]["t"]
+    ids = IdMap()
+    stats: dict[str, EndpointStats] = defaultdict(EndpointStats)
+
+    lanes: dict[Any, list[dict[str, Any]]] = defaultdict(list)
+    for index, record in enumerate(records):
+        user = recorded_user(record)
+        # 匿名请求互不依赖，各自一条通道。
+        lanes[("user", user) if user is not None else ("anon", index)].append(record)
+
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=60) as client:
+        start = time.perf_counter()
+
+        async def send(record: dict[str, Any]) -> None:
+            if speed > 0:
+                delay = (record["t"] - origin) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            path, params, body = await _rewrite(record, ids)
+            name = f"{record['m']} {record['r']}"
+            sent = time.perf_counter()
+            try:
+                resp = await client.request(
+                    record["m"], path, params=urlencode(params) or None, content=body,
+                    headers={"content-type": "application/json"} if body is not None else None,
+                )
+            except httpx.HTTPError:
+                stats[name].latencies.append(time.perf_counter() - sent)
+                stats[name].errors += 1
+                return
+            stats[name].latencies.append(time.perf_counter() - sent)
+            if resp.status_code >= 400 and record["s"] < 400:
+                stats[name].errors += 1
+            recorded_ids = record.get("ids", {})
+            if recorded_ids and resp.status_code < 400:
+                data = resp.json()
+                if "userId" in recorded_ids and record["r"] == "/api/login":
+                    ids.set("user", recorded_ids["userId"], data["userId"])
+                if "questionId" in recorded_ids and "questionId" in data:
+                    ids.set("question", recorded_ids["questionId"], data["questionId"])
+
+        async def run_lane(lane: list[dict[str, Any]]) -> None:
+            for record in lane:
+                await send(record)
+
+        await asyncio.gather(*(run_lane(lane) for lane in lanes.values()))
+        elapsed = time.perf_counter() - start
+    return LoadReport(elapsed=elapsed, endpoints=dict(stats))
+
+
+def diff_reports(before: dict[str, Any], after: dict[str, Any]) -> list[dict[str, Any]]:
+    rows = []
+    for name in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        old, new = before["endpoints"].get(name), after["endpoints"].get(name)
+        row: dict[str, Any] = {"endpoint": name}
+        for pct in PERCENTILES:
+            key = f"p{pct}_ms"
+            if old and new and old[key]:
+                row[key] = (old[key], new[key], round((new[key] - old[key]) / old[key] * 100, 1))
+            else:
+                row[key] = (old and old[key], new and new[key], None)
+        rows.append(row)
+    return rows
+
+
+def _format_diff(rows: list[dict[str, Any]]) -> str:
+    lines = [f"{'endpoint':<38}" + "".join(f"{f'p{pct} before→after (Δ%)':>30}" for pct in PERCENTILES)]
+    for row in rows:
+        cells = []
+        for pct in PERCENTILES:
+            old, new, change = row[f"p{pct}_ms"]
+            delta = "n/a" if change is None else f"{change:+.1f}%"
+            cells.append(f"{old or 0:>9.1f} → {new or 0:>8.1f} ({delta:>7})")
+        lines.append(f"{row['endpoint']:<38}" + "".join(f"{cell:>30}" for cell in cells))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="replay a log and write a latency report")
+    run.add_argument("log", type=Path)
+    run.add_argument("--speed", type=float, default=1.0, help="pace multiplier; 0 = as fast as possible")
+    run.add_argument("--base-url", default=None, help="target a running server instead of starting one")
+    run.add_argument("--workers", type=int, default=1)
+    run.add_argument("--output", type=Path, default=None, help="write the report JSON here")
+    diff = commands.add_parser("diff", help="compare two reports written by 'run'")
+    diff.add_argument("before", type=Path)
+    diff.add_argument("after", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        before = json.loads(args.before.read_text())
+        after = json.loads(args.after.read_text())
+        print(_format_diff(diff_reports(before, after)))
+        return
+
+    records = list(read_log(args.log))
+    if args.base_url:
+        report = asyncio.run(replay(records, args.base_url, args.speed))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = f"sqlite:///{Path(tmp) / 'replay.db'}"
+            engine = create_engine(database_url)
+            Base.metadata.create_all(bind=engine)
+            run_migrations(engine)
+            engine.dispose()
+            env = {
+                "DATABASE_URL": database_url,
+                "SQLITE_JOURNAL_MODE": "WAL",
+                "SQLITE_SYNCHRONOUS": "NORMAL",
+                # 回放目标本身不再录制。
+                "REQUEST_LOG_PATH": "",
+            }
+            with local_server(args.workers, env) as base_url:
+                report = asyncio.run(replay(records, base_url, args.speed))
+
+    print(report.format_table())
+    if args.output:
+        args.output.write_text(json.dumps(report.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
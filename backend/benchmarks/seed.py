@@ -0,0 +1,280 @@
+"""Bulk-seed a SQLite database with a realistic multi-year classroom history.
+
+Question texts come from a pool built with the real generator; activity per
+student follows a Zipf-like distribution so a few students own most rows, as in
+production. Secondary indexes are dropped during the load and rebuilt at the end.
+
+Usage::
+
+    python -m backend.benchmarks.seed --database /tmp/bench.db --users 3000 --questions 2000000
+    python -m backend.benchmarks.seed --database /tmp/bench.db --skew 1.2 --years 4 --batch-size 20000 --force
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+from sqlalchemy import Index, bindparam, create_engine, insert
+from sqlalchemy.engine import Engine
+
+from ..database import Base, configure_sqlite_pragmas
+from ..foods import FOODS
+from ..migrations import run_migrations
+from ..models import FoodPurchase, Question, QuestionAttempt, User
+from ..question_generator import GeneratedQuestion, generate_question
+from ..services import MAX_ATTEMPTS_PER_QUESTION, get_score_change
+
+TOPICS = ("add_sub", "mul_div", "poly_ops", "factorization", "mixed_ops")
+DIFFICULTIES = ("basic", "intermediate", "advanced")
+SEEDED_TABLES = (User.__table__, Question.__table__, QuestionAttempt.__table__, FoodPurchase.__table__)
+# 每道题第 1/2/3 次作答答对的概率，其余为答错。
+CORRECT_PROBABILITY = (0.55, 0.45, 0.35)
+
+
+@dataclass
+class SeedReport:
+    users: int = 0
+    questions: int = 0
+    attempts: int = 0
+    purchases: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        total = self.users + self.questions + self.attempts + self.purchases
+        return total / self.elapsed if self.elapsed else 0.0
+
+
+def _generate_one(job: tuple[float, str, str]) -> GeneratedQuestion:
+    # generate_question 使用全局 random，每个任务单独播种以便复现。
+    seed, topic, difficulty_level = job
+    random.seed(seed)
+    return generate_question(topic, difficulty_level)  # type: ignore[arg-type]
+
+
+def question_pool(size: int, rng: random.Random) -> list[GeneratedQuestion]:
+    """Generate ``size`` real questions once (in parallel); seeded rows sample from them."""
+
+    jobs = [(rng.random(), rng.choice(TOPICS), rng.choice(DIFFICULTIES)) for _ in range(size)]
+    # 生成一道题要做多次 sympy 化简，是整个灌数据过程里最慢的一步。
+    with ProcessPoolExecutor() as pool:
+        return list(pool.map(_generate_one, jobs))
+
+
+def zipf_cum_weights(count: int, skew: float) -> list[float]:
+    return list(accumulate(1 / rank**skew for rank in range(1, count + 1)))
+
+
+def _secondary_indexes() -> list[Index]:
+    return [index for table in SEEDED_TABLES for index in table.indexes if not index.unique]
+
+
+def _wrong_answer(solution: str, rng: random.Random) -> str:
+    return rng.choice([f"{solution}+{rng.randint(1, 9)}", f"-({solution})", "0", f"2*({solution})"])
+
+
+def seed_database(
+    target: Engine,
+    *,
+    users: int,
+    questions: int,
+    purchases_per_user: float = 4.0,
+    years: float = 3.0,
+    skew: float = 1.1,
+    batch_size: int = 10_000,
+    pool_size: int = 100,
+    pool: list[GeneratedQuestion] | None = None,
+    seed: int | None = None,
+    now: datetime | None = None,
+) -> SeedReport:
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    span_seconds = int(years * 365 * 86400)
+    report = SeedReport()
+    start = time.perf_counter()
+
+    Base.metadata.create_all(bind=target)
+    run_migrations(target)
+    indexes = _secondary_indexes()
+    # 先删二级索引、灌完数据再重建，比逐行维护索引快得多。
+    for index in indexes:
+        index.drop(bind=target, checkfirst=True)
+
+    pool = pool or question_pool(pool_size, rng)
+    user_weights = zipf_cum_weights(users, skew)
+    # 打乱 id 与活跃度的对应关系，热点学生不会都集中在最小的 id 上。
+    user_ids = list(range(1, users + 1))
+    rng.shuffle(user_ids)
+    scores = dict.fromkeys(user_ids, 0)
+
+    with target.begin() as conn:
+        conn.execute(
+            insert(User),
+            [
+                dict(
+                    id=user_id,
+                    chinese_name=f"学生{user_id}",
+                    english_name=f"Student{user_id}",
+                    class_name=f"Class{user_id % 40 + 1}",
+                    total_score=0,
+                    state_version=0,
+                    created_at=now - timedelta(seconds=span_seconds),
+                    updated_at=now,
+                )
+                for user_id in range(1, users + 1)
+            ],
+        )
+    report.users = users
+
+    remaining = questions
+    while remaining > 0:
+        count = min(batch_size, remaining)
+        remaining -= count
+        owners = rng.choices(user_ids, cum_weights=user_weights, k=count)
+        question_rows, attempt_rows = [], []
+        for owner in owners:
+            template = rng.choice(pool)
+            created_at = now - timedelta(seconds=rng.randrange(span_seconds))
+            question_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            solved, attempts_used = False, 0
+            # 约一成的题目出完后从未作答。
+            if rng.random() >= 0.1:
+                for attempt_index in range(1, MAX_ATTEMPTS_PER_QUESTION + 1):
+                    attempts_used = attempt_index
+                    solved = rng.random() < CORRECT_PROBABILITY[attempt_index - 1]
+                    last = attempt_index == MAX_ATTEMPTS_PER_QUESTION
+                    score_change = get_score_change(template.difficulty_level, solved) if solved or last else 0
+                    scores[owner] = max(scores[owner] + score_change, 0)
+                    attempt_rows.append(
+                        dict(
+                            question_id=question_id,
+                            user_id=owner,
+                            expression_text=template.expression_text,
+                            topic=template.topic,
+                            difficulty_level=template.difficulty_level,
+                            difficulty_score=template.difficulty_score,
+                            user_answer=template.solution_expression if solved
+                            else _wrong_answer(template.solution_expression, rng),
+                            is_correct=solved,
+                            score_change=score_change,
+                            attempt_index=attempt_index,
+                            correct_answer=template.solution_expression if last and not solved else None,
+                            created_at=created_at + timedelta(seconds=20 * attempt_index),
+                        )
+                    )
+                    if solved:
+                        break
+            question_rows.append(
+                dict(
+                    question_id=question_id,
+                    user_id=owner,
+                    expression_text=template.expression_text,
+                    solution_expression=template.solution_expression,
+                    topic=template.topic,
+                    difficulty_level=template.difficulty_level,
+                    difficulty_score=template.difficulty_score,
+                    attempts_used=attempts_used,
+                    is_solved=solved,
+                    created_at=created_at,
+                )
+            )
+        # 每批一个事务，executemany 批量插入。
+        with target.begin() as conn:
+            conn.execute(insert(Question), question_rows)
+            if attempt_rows:
+                conn.execute(insert(QuestionAttempt), attempt_rows)
+        report.questions += len(question_rows)
+        report.attempts += len(attempt_rows)
+
+    purchase_owners = rng.choices(user_ids, cum_weights=user_weights, k=int(users * purchases_per_user))
+    for offset in range(0, len(purchase_owners), batch_size):
+        purchase_rows = []
+        for owner in purchase_owners[offset:offset + batch_size]:
+            affordable = [food for food in FOODS if food.price <= scores[owner]]
+            if not affordable:
+                continue
+            food = rng.choice(affordable)
+            scores[owner] -= food.price
+            purchase_rows.append(
+                dict(
+                    user_id=owner,
+                    food_id=food.food_id,
+                    food_name=food.name,
+                    cost=food.price,
+                    created_at=now - timedelta(seconds=rng.randrange(span_seconds)),
+                )
+            )
+        if purchase_rows:
+            with target.begin() as conn:
+                conn.execute(insert(FoodPurchase), purchase_rows)
+            report.purchases += len(purchase_rows)
+
+    users_table = User.__table__
+    with target.begin() as conn:
+        conn.execute(
+            users_table.update()
+            .where(users_table.c.id == bindparam("uid"))
+            .values(total_score=bindparam("score")),
+            [{"uid": user_id, "score": score} for user_id, score in scores.items()],
+        )
+
+    for index in indexes:
+        index.create(bind=target, checkfirst=True)
+    with target.connect() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database", type=Path, required=True, help="SQLite file to create; must not exist unless --force is given"
+    )
+    parser.add_argument("--force", action="store_true", help="delete an existing --database file and seed afresh")
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--questions", type=int, default=1_000_000)
+    parser.add_argument("--purchases-per-user", type=float, default=4.0)
+    parser.add_argument("--years", type=float, default=3.0)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of per-student activity")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--pool-size", type=int, default=100, help="distinct generated question texts")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.database.exists():
+        if not args.force:
+            parser.error(f"{args.database} already exists; pass --force to replace it")
+        # 学生编号从 1 开始显式写入，不能在已有数据上追加：整个文件连同日志一起删除。
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            Path(f"{args.database}{suffix}").unlink(missing_ok=True)
+    engine = create_engine(f"sqlite:///{args.database}")
+    # 灌数据时不需要崩溃安全，关闭日志与 fsync。
+    configure_sqlite_pragmas(engine, journal_mode="OFF", synchronous="OFF")
+    report = seed_database(
+        engine,
+        users=args.users,
+        questions=args.questions,
+        purchases_per_user=args.purchases_per_user,
+        years=args.years,
+        skew=args.skew,
+        batch_size=args.batch_size,
+        pool_size=args.pool_size,
+        seed=args.seed,
+    )
+    engine.dispose()
+    print(
+        f"users={report.users} questions={report.questions} attempts={report.attempts} "
+        f"purchases={report.purchases} in {report.elapsed:.1f}s ({report.rows_per_second:,.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Per-request CPU and bytes on the wire for the list endpoints' response path.
+
+Compares the previous path (per-row ``model_validate`` + FastAPI's
+``jsonable_encoder`` + ``json.dumps``) with the current one (``TypeAdapter``
+bulk validation over row tuples + Rust ``dump_json`` + negotiated compression).
+
+Usage::
+
+    python -m backend.benchmarks.serialization --rows 100 --iterations 2000
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Callable
+
+import brotli
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from ..responses import DYNAMIC_BROTLI_QUALITY, DYNAMIC_GZIP_LEVEL
+from ..schemas import HistoryResponse, HistoryResponseList
+
+HistoryRow = namedtuple(
+    "HistoryRow", "id user_id question_text user_answer score correct_answer created_at"
+)
+
+
+def _rows(count: int) -> list[HistoryRow]:
+    start = datetime(2025, 3, 1, 8, 0, 0)
+    return [
+        HistoryRow(
+            id=i,
+            user_id=1,
+            question_text=f"(3x^2 + {i}xy - 5) - (x^2 - {i % 7}xy + 2)",
+            user_answer="2x^2 + 4xy - 7" if i % 3 else "0",
+            score=(1, 0, -1)[i % 3],
+            correct_answer="2*x**2 + 4*x*y - 7" if i % 3 == 2 else None,
+            created_at=start + timedelta(seconds=37 * i, microseconds=1234 * i),
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_path(rows: list[HistoryRow]) -> bytes:
+    orm_like = [SimpleNamespace(**row._asdict()) for row in rows]
+    items = [HistoryResponse.model_validate(obj, from_attributes=True) for obj in orm_like]
+    return JSONResponse(jsonable_encoder(items)).body
+
+
+def optimized_path(rows: list[HistoryRow]) -> bytes:
+    return HistoryResponseList.dump_json(HistoryResponseList.validate_python(rows, from_attributes=True))
+
+
+def _cpu_per_call(func: Callable[[], object], iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = _rows(args.rows)
+    legacy_body = legacy_path(rows)
+    optimized_body = optimized_path(rows)
+
+    cases: list[tuple[str, Callable[[], object], bytes]] = [
+        ("legacy json", lambda: legacy_path(rows), legacy_body),
+        ("typeadapter json", lambda: optimized_path(rows), optimized_body),
+        (
+            "typeadapter + gzip",
+            lambda: gzip.compress(optimized_path(rows), compresslevel=DYNAMIC_GZIP_LEVEL),
+            gzip.compress(optimized_body, compresslevel=DYNAMIC_GZIP_LEVEL),
+        ),
+        (
+            "typeadapter + br",
+            lambda: brotli.compress(optimized_path(rows), quality=DYNAMIC_BROTLI_QUALITY),
+            brotli.compress(optimized_body, quality=DYNAMIC_BROTLI_QUALITY),
+        ),
+    ]
+
+    print(f"{args.rows} history rows, {args.iterations} iterations")
+    for name, func, body in cases:
+        cpu = _cpu_per_call(func, args.iterations)
+        print(f"{name:>20}: {cpu * 1e6:9.1f} µs CPU/request  {len(body):7d} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compare per-request commits with the write-behind queue for answer logs.
+
+Usage::
+
+    python -m backend.benchmarks.write_behind --rows 5000 --threads 8
+    python -m backend.benchmarks.write_behind --journal-mode WAL --synchronous NORMAL
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base, configure_sqlite_pragmas
+from ..models import QuestionAttempt
+from ..write_behind import WriteBehindQueue
+
+
+def _attempt_values(i: int) -> dict:
+    return dict(
+        question_id=f"bench-{i // 3}",
+        user_id=1 + i % 40,
+        expression_text="(2x+3) - (x-1)",
+        topic="add_sub",
+        difficulty_level="basic",
+        difficulty_score=12,
+        user_answer="x+4",
+        is_correct=i % 3 == 0,
+        score_change=1 if i % 3 == 0 else 0,
+        attempt_index=1 + i % 3,
+        created_at=datetime.utcnow(),
+    )
+
+
+def _make_factory(path: Path, journal_mode: str | None, synchronous: str | None):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False, "timeout": 60},
+    )
+    configure_sqlite_pragmas(engine, journal_mode, synchronous)
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def bench_per_request_commit(factory, rows: int, threads: int) -> float:
+    def insert_one(i: int) -> None:
+        with factory() as db:
+            db.add(QuestionAttempt(**_attempt_values(i)))
+            db.commit()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(insert_one, range(rows)))
+    return time.perf_counter() - start
+
+
+def bench_write_behind(factory, rows: int, threads: int, batch_size: int, interval_ms: int) -> float:
+    writer = WriteBehindQueue(
+        factory,
+        max_queue=rows,
+        batch_size=batch_size,
+        flush_interval=interval_ms / 1000,
+    )
+    writer.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda i: writer.submit(QuestionAttempt, _attempt_values(i)), range(rows)))
+    # 计时到所有记录真正提交为止，才能与逐条提交公平比较。
+    writer.stop()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--interval-ms", type=int, default=50)
+    parser.add_argument("--journal-mode", default=None)
+    parser.add_argument("--synchronous", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name in ("per_request_commit", "write_behind"):
+            engine, factory = _make_factory(Path(tmp) / f"{name}.db", args.journal_mode, args.synchronous)
+            if name == "per_request_commit":
+                elapsed = bench_per_request_commit(factory, args.rows, args.threads)
+            else:
+                elapsed = bench_write_behind(factory, args.rows, args.threads, args.batch_size, args.interval_ms)
+            with factory() as db:
+                stored = db.scalar(select(func.count(QuestionAttempt.id)))
+            engine.dispose()
+            assert stored == args.rows, f"{name}: expected {args.rows} rows, found {stored}"
+            results[name] = args.rows / elapsed
+            print(f"{name:>20}: {elapsed:8.3f}s  {results[name]:10.1f} inserts/s")
+
+        print(f"{'speedup':>20}: {results['write_behind'] / results['per_request_commit']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Class-wide question sets: generated once, worked by every student in the class.
+
+A set is identified by (class, difficulty, seed) and stored in
+``class_set_items``. Each student gets their own ``Question`` rows, so attempts
+and scores stay per student, copying the shared text and pointing back through
+``class_item_id``. Every student in the set grades against the same solution
+strings, which :func:`services.normalized_solution` parses once per process.
+"""
+from __future__ import annotations
+
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .metrics import time_component
+from .models import ClassSetItem, Question
+from .question_generator import GeneratedQuestion, generate_question, seeded
+from .services import bump_state_version
+from .user_cache import get_user_cache
+
+TOPICS = ("add_sub", "mul_div", "poly_ops", "factorization", "mixed_ops")
+
+SetKey = tuple[str, str, int]
+
+
+@dataclass(frozen=True)
+class SharedQuestion:
+    id: int
+    position: int
+    topic: str
+    difficulty_level: str
+    expression_text: str
+    expression_latex: str
+    solution_expression: str
+    difficulty_score: int
+
+
+def default_seed(today: date | None = None) -> int:
+    # 不指定种子时按日期：同一班级当天拿到同一套题，第二天换一套。
+    return int((today or date.today()).strftime("%Y%m%d"))
+
+
+def generate_class_set(class_name: str, difficulty_level: str, seed: int, size: int) -> list[GeneratedQuestion]:
+    """The same questions for the same key on every call; topics rotate so a set covers all of them."""
+
+    questions = []
+    with seeded(f"{class_name}:{difficulty_level}:{seed}"):
+        for position in range(size):
+            with time_component("sympy_generate"):
+                questions.append(generate_question(TOPICS[position % len(TOPICS)], difficulty_level))  # type: ignore[arg-type]
+    return questions
+
+
+class ClassSetStore:
+    """Per-process LRU of class sets; the database row set is the source of truth across workers."""
+
+    def __init__(self, size: int = 10, max_entries: int = 256) -> None:
+        self.size = size
+        self.max_entries = max_entries
+        self._sets: OrderedDict[SetKey, tuple[SharedQuestion, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: dict[SetKey, threading.Lock] = {}
+        self.hits = 0
+        self.loaded = 0
+        self.generated = 0
+
+    def get(self, db: Session, class_name: str, difficulty_level: str, seed: int) -> tuple[SharedQuestion, ...]:
+        key = (class_name, difficulty_level, seed)
+        with self._lock:
+            cached = self._sets.get(key)
+            if cached is not None:
+                self._sets.move_to_end(key)
+                self.hits += 1
+                return cached
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # 同一进程里全班同时进入时只有一个线程生成，其余等它写完直接用。
+        with key_lock:
+            with self._lock:
+                cached = self._sets.get(key)
+            if cached is None:
+                cached = self._load(db, key) or self._create(db, key)
+                with self._lock:
+                    self._sets[key] = cached
+                    while len(self._sets) > self.max_entries:
+                        self._sets.popitem(last=False)
+                    self._key_locks.pop(key, None)
+        return cached
+
+    def _load(self, db: Session, key: SetKey) -> tuple[SharedQuestion, ...]:
+        class_name, difficulty_level, seed = key
+        rows = db.execute(
+            select(
+                ClassSetItem.id,
+                ClassSetItem.position,
+                ClassSetItem.topic,
+                ClassSetItem.difficulty_level,
+                ClassSetItem.expression_text,
+                ClassSetItem.expression_latex,
+                ClassSetItem.solution_expression,
+                ClassSetItem.difficulty_score,
+            )
+            .where(
+                ClassSetItem.class_name == class_name,
+                ClassSetItem.difficulty_level == difficulty_level,
+                ClassSetItem.seed == seed,
+            )
+            .order_by(ClassSetItem.position)
+        ).all()
+        if rows:
+            self.loaded += 1
+        return tuple(SharedQuestion(*row) for row in rows)
+
+    def _create(self, db: Session, key: SetKey) -> tuple[SharedQuestion, ...]:
+        class_name, difficulty_level, seed = key
+        questions = generate_class_set(class_name, difficulty_level, seed, self.size)
+        try:
+            db.execute(
+                insert(ClassSetItem),
+                [
+                    {
+                        "class_name": class_name,
+                        "difficulty_level": difficulty_level,
+                        "seed": seed,
+                        "position": position,
+                        "topic": question.topic,
+                        "expression_text": question.expression_text,
+                        "expression_latex": question.expression_latex,
+                        "solution_expression": question.solution_expression,
+                        "difficulty_score": question.difficulty_score,
+                    }
+                    for position, question in enumerate(questions)
+                ],
+            )
+            db.commit()
+        except IntegrityError:
+            # 另一个 worker 进程先写入了同一套题：放弃本次结果，读它写的那份。
+            db.rollback()
+        else:
+            self.generated += 1
+        return self._load(db, key)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"sets": len(self._sets), "hits": self.hits, "loaded": self.loaded, "generated": self.generated}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sets.clear()
+
+
+def assign_class_set(
+    db: Session, user_id: int, items: tuple[SharedQuestion, ...]
+) -> list[tuple[str, SharedQuestion]]:
+    """Give the student their own question rows for ``items``; repeated calls return the same rows."""
+
+    lookup = select(Question.class_item_id, Question.question_id).where(
+        Question.user_id == user_id,
+        Question.class_item_id.in_([item.id for item in items]),
+    )
+    existing = dict(db.execute(lookup).all())
+    missing = [item for item in items if item.id not in existing]
+    if missing:
+        rows = [
+            {
+                "question_id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "expression_text": item.expression_text,
+                "solution_expression": item.solution_expression,
+                "topic": item.topic,
+                "difficulty_level": item.difficulty_level,
+                "difficulty_score": item.difficulty_score,
+                "class_item_id": item.id,
+            }
+            for item in missing
+        ]
+        # 同一学生的并发请求可能已经写入了其中一部分：跳过这些行，再读回实际的题目编号。
+        stmt = sqlite_insert(Question).on_conflict_do_nothing(
+            index_elements=[Question.user_id, Question.class_item_id],
+            index_where=Question.class_item_id.isnot(None),
+        )
+        db.execute(stmt, rows)
+        bump_state_version(db, user_id)
+        db.commit()
+        get_user_cache().invalidate(user_id)
+        existing = dict(db.execute(lookup).all())
+    return [(existing[item.id], item) for item in items]
+
+
+@lru_cache
+def get_class_set_store() -> ClassSetStore:
+    settings = get_settings()
+    return ClassSetStore(size=settings.class_set_size, max_entries=settings.class_set_cache_entries)
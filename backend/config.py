@@ -7,6 +7,57 @@ class Settings(BaseSettings):
     """Runtime configuration for the FastAPI service."""
 
     database_url: str = f"sqlite:///{Path(__file__).parent / 'data.db'}"
+    # SQLite 持久化参数：为空时沿用 SQLite 默认值（journal_mode=DELETE, synchronous=FULL）。
+    sqlite_journal_mode: str | None = None
+    sqlite_synchronous: str | None = None
+    # 答题记录/历史记录的异步批量写入（write-behind），默认关闭。
+    write_behind_enabled: bool = False
+    write_behind_max_queue: int = 10_000
+    write_behind_batch_size: int = 200
+    write_behind_flush_interval_ms: int = 50
+    # 列表接口响应体超过该字节数时按 Accept-Encoding 压缩。
+    response_compression_min_bytes: int = 1024
+    # 进程内学生缓存：TTL 只约束存在性检查，读取积分时会按 state_version 校验。
+    user_cache_ttl_seconds: float = 30.0
+    user_cache_max_entries: int = 10_000
+    # 数据保留策略（python -m backend.retention）：超过期限的题目压缩归档，从未作答的题目直接清理。
+    retention_archive_after_days: int = 180
+    retention_abandon_after_days: int = 30
+    retention_attempts_after_days: int | None = None
+    retention_batch_size: int = 1000
+    # 请求追踪：按比例抽样，超过 trace_slow_ms 的请求总是保留；trace_export_path 为空时只保存在内存环形缓冲区。
+    trace_sample_rate: float = 0.01
+    trace_slow_ms: float = 500.0
+    trace_buffer_size: int = 200
+    trace_export_path: str | None = None
+    # 单请求采样分析：配置密钥后，带 X-Profile: <密钥> 头的请求会被采样并保存到 profile_dir。
+    profile_secret: str | None = None
+    profile_dir: str = str(Path(__file__).parent / "profiles")
+    profile_interval_ms: float = 1.0
+    # 请求录制（供 python -m backend.benchmarks.replay 回放）：路径以 .gz 结尾则压缩，{pid} 替换为进程号。
+    request_log_path: str | None = None
+    request_log_sample_rate: float = 1.0
+    # 练习接口预取：出题/判题时在后台线程提前生成该学生的下一题；workers 为 0 时关闭。
+    practice_prefetch_workers: int = 2
+    practice_prefetch_max_entries: int = 1000
+    practice_prefetch_ttl_seconds: float = 600.0
+    # 班级共享题：每套题目数，以及每个进程缓存的题套数（按 LRU 淘汰）。
+    class_set_size: int = 10
+    class_set_cache_entries: int = 256
+    # Idempotency-Key：已完成响应的保存时间；重复请求等待首个请求完成的最长时间。
+    idempotency_ttl_seconds: float = 86_400.0
+    idempotency_wait_seconds: float = 10.0
+    # 令牌桶限流：按学生与客户端 IP 分别计数，状态存在独立的 SQLite 文件里供所有 worker 共享。
+    # 同一班级通常共用一个出口 IP，IP 的额度为学生额度乘以 rate_limit_ip_multiplier。
+    rate_limit_enabled: bool = False
+    rate_limit_db_path: str = str(Path(__file__).parent / "rate_limit.db")
+    rate_limit_generate_burst: int = 20
+    rate_limit_generate_per_minute: float = 30.0
+    rate_limit_check_burst: int = 30
+    rate_limit_check_per_minute: float = 60.0
+    rate_limit_image_burst: int = 5
+    rate_limit_image_per_minute: float = 2.0
+    rate_limit_ip_multiplier: float = 40.0
     ark_api_key: str | None = None
     ark_model: str = "doubao-seedream-4-0-250828"
     ark_base_url: str = "https://ark.cn-beijing.volces.com/api/v3/images/generations"
@@ -15,6 +66,36 @@ class Settings(BaseSettings):
     ark_sequential_mode: str = "disabled"
     ark_stream: bool = False
     ark_watermark: bool = True
+    # Ark 客户端：共享连接池；单次调用的总时限包含所有重试与退避等待。
+    ark_max_connections: int = 10
+    ark_keepalive_seconds: float = 30.0
+    ark_attempt_timeout_seconds: float = 20.0
+    ark_deadline_seconds: float = 45.0
+    ark_max_retries: int = 3
+    ark_backoff_base_seconds: float = 0.5
+    ark_backoff_max_seconds: float = 8.0
+    # 连续失败达到阈值后熔断，冷却期内直接报错，之后放行一个试探请求。
+    ark_breaker_failure_threshold: int = 5
+    ark_breaker_reset_seconds: float = 30.0
+    # 生成图片缓存：按提示词与模型/尺寸/水印的哈希寻址；只存 URL 的条目超过 TTL 后重新生成（远端链接会过期）。
+    image_cache_dir: str = str(Path(__file__).parent / "image_cache")
+    image_cache_max_entries: int = 500
+    image_cache_store_bytes: bool = False
+    image_cache_url_ttl_seconds: float | None = 86_400.0
+    # 后台图片任务队列（存于 SQLite 的 image_jobs 表），默认关闭；并发数即每个进程的 worker 协程数。
+    image_jobs_enabled: bool = False
+    image_job_concurrency: int = 2
+    image_job_max_queue: int = 100
+    image_job_max_attempts: int = 3
+    image_job_retry_backoff_seconds: float = 5.0
+    image_job_poll_interval_seconds: float = 1.0
+    image_job_stale_after_seconds: float = 300.0
+    # 本地图片镜像：任务完成后下载原图并生成缩略图/webp（需要 Pillow），由 /api/images/{digest}/{variant} 提供。
+    image_mirror_enabled: bool = True
+    image_mirror_dir: str = str(Path(__file__).parent / "image_mirror")
+    image_thumbnail_size: int = 256
+    image_web_size: int = 1024
+    image_webp_quality: int = 80
 
     class Config:
         env_file = ".env"
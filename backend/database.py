@@ -1,9 +1,12 @@
 from __future__ import annotations
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from .config import get_settings
+from .metrics import OPEN_SESSIONS, instrument_engine
+from .tracing import trace_engine
 
 settings = get_settings()
 connect_args = {}
@@ -14,11 +17,45 @@ engine = create_engine(settings.database_url, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SQLITE_SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def configure_sqlite_pragmas(
+    target: Engine,
+    journal_mode: str | None = None,
+    synchronous: str | None = None,
+) -> None:
+    """Apply durability pragmas to every new SQLite connection of ``target``."""
+
+    if target.dialect.name != "sqlite" or not (journal_mode or synchronous):
+        return
+    if journal_mode and journal_mode.upper() not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"不支持的 journal_mode: {journal_mode}")
+    if synchronous and synchronous.upper() not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f"不支持的 synchronous: {synchronous}")
+
+    @event.listens_for(target, "connect")
+    def _set_pragmas(dbapi_connection, _record) -> None:
+        cursor = dbapi_connection.cursor()
+        if journal_mode:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        if synchronous:
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.close()
+
+
+configure_sqlite_pragmas(engine, settings.sqlite_journal_mode, settings.sqlite_synchronous)
+instrument_engine(engine)
+trace_engine(engine)
+
 
 def get_db():
     from sqlalchemy.orm import Session
     db: Session = SessionLocal()
+    OPEN_SESSIONS.inc()
     try:
         yield db
     finally:
         db.close()
+        OPEN_SESSIONS.dec()
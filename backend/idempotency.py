@@ -0,0 +1,177 @@
+"""Replay stored responses for retried requests that carry an ``Idempotency-Key``.
+
+The first request with a key inserts a pending row in ``idempotency_keys`` and
+runs; its response is stored for ``ttl`` seconds in the same transaction as the
+request's own changes, so either both are committed or neither is. A retry
+gets the stored response without running the handler again. A duplicate that arrives while the
+first is still running waits for it: on a local event in the same process, by
+polling the row across workers. Rows live in SQLite, so every uvicorn worker
+sees the same keys.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .models import IdempotencyRecord
+
+MAX_KEY_LENGTH = 255
+# 首个请求进行中时的占位有效期：进程崩溃留下的占位超过这段时间后可被重新领取。
+PENDING_TIMEOUT_SECONDS = 60.0
+# 每领取这么多次清理一次过期记录。
+PURGE_EVERY = 200
+
+
+class IdempotencyMismatchError(ValueError):
+    """The key was already used for a different request body."""
+
+
+class IdempotencyInProgressError(RuntimeError):
+    """The first request with this key has not finished within the wait timeout."""
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    body: bytes
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: float = 86_400.0, wait_timeout: float = 10.0, poll_interval: float = 0.05) -> None:
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._events: dict[str, threading.Event] = {}
+        # 本进程领取的占位及其 created_at：完成或放弃时只改动自己的那一条。
+        self._claimed_at: dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._claims = 0
+        self.replayed = 0
+        self.waited = 0
+
+    def begin(self, db: Session, key: str, fingerprint: str) -> StoredResponse | None:
+        """Claim ``key`` (returns None: the caller runs the request) or return the stored response."""
+
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            if self._claim(db, key, fingerprint):
+                return None
+            row = db.execute(
+                select(IdempotencyRecord.fingerprint, IdempotencyRecord.status_code, IdempotencyRecord.body).where(
+                    IdempotencyRecord.key == key
+                )
+            ).first()
+            db.rollback()
+            if row is None:
+                # 首个请求失败并释放了占位：重新领取。
+                continue
+            if row.fingerprint != fingerprint:
+                raise IdempotencyMismatchError("Idempotency-Key 已用于另一个请求")
+            if row.status_code is not None:
+                self.replayed += 1
+                return StoredResponse(row.status_code, row.body)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IdempotencyInProgressError("相同的请求正在处理，请稍后重试")
+            if not waited:
+                waited = True
+                self.waited += 1
+            event = self._events.get(key)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                # 首个请求在另一个 worker 进程：轮询数据库。
+                time.sleep(min(self.poll_interval, remaining))
+
+    def _claim(self, db: Session, key: str, fingerprint: str) -> bool:
+        now = datetime.utcnow()
+        stmt = sqlite_insert(IdempotencyRecord).values(
+            key=key,
+            fingerprint=fingerprint,
+            created_at=now,
+            expires_at=now + timedelta(seconds=PENDING_TIMEOUT_SECONDS),
+        )
+        # 只有过期的记录（已完成超过 ttl，或崩溃遗留的占位）可以被覆盖。
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IdempotencyRecord.key],
+            set_={
+                "fingerprint": stmt.excluded.fingerprint,
+                "status_code": None,
+                "body": None,
+                "created_at": stmt.excluded.created_at,
+                "expires_at": stmt.excluded.expires_at,
+            },
+            where=IdempotencyRecord.expires_at < now,
+        ).returning(IdempotencyRecord.key)
+        claimed = db.execute(stmt).first() is not None
+        if claimed and self._should_purge():
+            db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.expires_at < now))
+        db.commit()
+        if claimed:
+            with self._lock:
+                self._events[key] = threading.Event()
+                self._claimed_at[key] = now
+        return claimed
+
+    def _should_purge(self) -> bool:
+        with self._lock:
+            self._claims += 1
+            return self._claims % PURGE_EVERY == 0
+
+    def complete(self, db: Session, key: str, status_code: int, body: bytes) -> None:
+        """Store the response and commit it together with the changes already made in ``db``.
+
+        Raises :class:`IdempotencyInProgressError` (after rolling back) when the
+        claim expired and another request took the key over in the meantime.
+        """
+
+        stored = db.execute(
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key, self._own_claim(key))
+            .values(status_code=status_code, body=body, expires_at=datetime.utcnow() + timedelta(seconds=self.ttl))
+        ).rowcount
+        if not stored:
+            # 占位已超时被重试请求重新领取：不能再提交这次的修改，否则会执行两次。
+            db.rollback()
+            self._release(key)
+            raise IdempotencyInProgressError("相同的请求正在处理，请稍后重试")
+        db.commit()
+        self._release(key)
+
+    def abandon(self, db: Session, key: str) -> None:
+        """Drop the claim so a retry runs the request again (used for server errors)."""
+
+        db.rollback()
+        db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.key == key, self._own_claim(key)))
+        db.commit()
+        self._release(key)
+
+    def _own_claim(self, key: str):
+        with self._lock:
+            claimed_at = self._claimed_at.get(key)
+        return (IdempotencyRecord.status_code.is_(None)) & (IdempotencyRecord.created_at == claimed_at)
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            event = self._events.pop(key, None)
+            self._claimed_at.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def stats(self) -> dict[str, int]:
+        return {"in_flight": len(self._events), "replayed": self.replayed, "waited": self.waited}
+
+
+@lru_cache
+def get_idempotency_store() -> IdempotencyStore:
+    settings = get_settings()
+    return IdempotencyStore(ttl=settings.idempotency_ttl_seconds, wait_timeout=settings.idempotency_wait_seconds)
@@ -0,0 +1,168 @@
+"""Content-addressed on-disk cache for generated images.
+
+The key is a SHA-256 of the prompt plus the ``Settings`` fields that change the
+output (model, size, watermark). Each entry is ``<key>.json`` holding the URL
+Ark returned and, when ``store_bytes`` is on, ``<key>.bin`` with the image
+itself. Concurrent callers for the same key share one in-flight generation.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from .ark_client import ArkImageClient
+from .config import Settings, get_settings
+
+
+def image_cache_key(prompt: str, settings: Settings) -> str:
+    material = json.dumps(
+        {
+            "prompt": prompt,
+            "model": settings.ark_model,
+            "size": settings.ark_image_size,
+            "watermark": settings.ark_watermark,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    key: str
+    url: str
+    created_at: float
+    path: Path | None = None
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    # 先写临时文件再改名：多个 worker 共享目录时不会读到写了一半的文件。
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class ImageCache:
+    """LRU-bounded disk cache; recency survives restarts through file mtimes."""
+
+    def __init__(
+        self,
+        directory: str | Path,
+        max_entries: int = 500,
+        store_bytes: bool = False,
+        url_ttl: float | None = 86_400.0,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.store_bytes = store_bytes
+        self.url_ttl = url_ttl
+        self._lock = threading.Lock()
+        self._order: OrderedDict[str, None] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future[CachedImage]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        entries = sorted(self.directory.glob("*.json"), key=lambda path: path.stat().st_mtime)
+        for path in entries:
+            self._order[path.stem] = None
+        self._evict()
+
+    def _meta_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _bytes_path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def get(self, key: str) -> CachedImage | None:
+        try:
+            meta = json.loads(self._meta_path(key).read_bytes())
+        except (OSError, ValueError):
+            with self._lock:
+                self._order.pop(key, None)
+            return None
+        data_path = self._bytes_path(key)
+        path = data_path if data_path.exists() else None
+        # 远端 URL 会过期；只有 URL、没有本地副本的条目超过 url_ttl 后视为未命中。
+        if path is None and self.url_ttl is not None and time.time() - meta["created_at"] > self.url_ttl:
+            return None
+        with self._lock:
+            self._order[key] = None
+            self._order.move_to_end(key)
+        try:
+            os.utime(self._meta_path(key))
+        except OSError:
+            pass
+        return CachedImage(key=key, url=meta["url"], created_at=meta["created_at"], path=path)
+
+    def put(self, key: str, url: str, data: bytes | None = None) -> CachedImage:
+        created_at = time.time()
+        path = None
+        if data is not None:
+            path = self._bytes_path(key)
+            write_atomic(path, data)
+        write_atomic(self._meta_path(key), json.dumps({"url": url, "created_at": created_at}).encode())
+        with self._lock:
+            self._order[key] = None
+            self._order.move_to_end(key)
+        self._evict()
+        return CachedImage(key=key, url=url, created_at=created_at, path=path)
+
+    def _evict(self) -> None:
+        with self._lock:
+            victims = []
+            while len(self._order) > self.max_entries:
+                victims.append(self._order.popitem(last=False)[0])
+            self.evictions += len(victims)
+        for key in victims:
+            self._meta_path(key).unlink(missing_ok=True)
+            self._bytes_path(key).unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    async def generate(self, client: ArkImageClient, prompt: str) -> CachedImage:
+        """Return the cached image for ``prompt``, generating it at most once at a time."""
+
+        key = image_cache_key(prompt, client.settings)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(self._fill(client, key, prompt))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield：某个等待者被取消时，不影响其他人共享的这次生成。
+        return await asyncio.shield(future)
+
+    async def _fill(self, client: ArkImageClient, key: str, prompt: str) -> CachedImage:
+        url = await client.generate_image(prompt)
+        data = await client.download(url) if self.store_bytes else None
+        return self.put(key, url, data)
+
+
+@lru_cache
+def get_image_cache() -> ImageCache:
+    settings = get_settings()
+    return ImageCache(
+        settings.image_cache_dir,
+        max_entries=settings.image_cache_max_entries,
+        store_bytes=settings.image_cache_store_bytes,
+        url_ttl=settings.image_cache_url_ttl_seconds,
+    )
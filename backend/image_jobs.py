@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from .ark_client import get_ark_client
+from .config import Settings, get_settings
+from .image_cache import get_image_cache
+from .image_mirror import get_image_mirror
+from .models import ImageJob
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+# 生成函数返回 (图片 URL, 缓存键)。
+GenerateFunc = Callable[[str], Awaitable[tuple[str, str | None]]]
+
+
+class ImageQueueFullError(RuntimeError):
+    pass
+
+
+async def generate_cached(prompt: str) -> tuple[str, str | None]:
+    client = get_ark_client()
+    image = await get_image_cache().generate(client, prompt)
+    if not get_settings().image_mirror_enabled:
+        return image.url, image.key
+    # 远端链接会过期：下载一次存到本地，返回本地地址。
+    if image.path is not None:
+        data = await asyncio.to_thread(image.path.read_bytes)
+    else:
+        data = await client.download(image.url)
+    mirrored = await get_image_mirror().mirror(data)
+    return mirrored.url(), image.key
+
+
+class ImageJobQueue:
+    """SQLite-backed image generation queue drained by asyncio worker tasks.
+
+    Jobs survive restarts: a job is claimed with a single ``UPDATE ...
+    RETURNING``, so several uvicorn workers can share the table, and a job left
+    ``running`` longer than ``stale_after`` (its process died) is claimed again.
+    Database calls run in threads; only the generation itself is awaited on
+    the event loop, so a slow Ark call never holds a threadpool worker.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        generate: GenerateFunc = generate_cached,
+        *,
+        concurrency: int = 2,
+        max_queue: int = 100,
+        max_attempts: int = 3,
+        retry_backoff: float = 5.0,
+        poll_interval: float = 1.0,
+        stale_after: float = 300.0,
+    ) -> None:
+        self._session_factory = session_factory
+        self._generate = generate
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._wake = asyncio.Event()
+        self._finished: dict[str, asyncio.Event] = {}
+        self._tasks: list[asyncio.Task[None]] = []
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self) -> None:
+        """Spawn the worker tasks on the running event loop."""
+
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"image-job-{index}") for index in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, prompt: str) -> ImageJob:
+        job = await asyncio.to_thread(self._insert, prompt)
+        self._wake.set()
+        return job
+
+    def _insert(self, prompt: str) -> ImageJob:
+        with self._session_factory() as db:
+            depth = db.scalar(
+                select(func.count()).select_from(ImageJob).where(ImageJob.status.in_(("queued", "running")))
+            )
+            if depth >= self.max_queue:
+                raise ImageQueueFullError(f"图片任务队列已满（{depth} 个任务），请稍后再试")
+            now = datetime.utcnow()
+            job = ImageJob(
+                id=uuid.uuid4().hex, prompt=prompt, status="queued", attempts=0,
+                max_attempts=self.max_attempts, available_at=now, created_at=now,
+            )
+            # 返回提交时的状态：提交后 worker 可能立刻认领，不再回读。
+            db.expire_on_commit = False
+            db.add(job)
+            db.commit()
+            db.expunge(job)
+            return job
+
+    def get(self, job_id: str) -> ImageJob | None:
+        with self._session_factory() as db:
+            job = db.get(ImageJob, job_id)
+            if job is not None:
+                db.expunge(job)
+            return job
+
+    async def wait(self, job_id: str, timeout: float) -> ImageJob | None:
+        """Return the job once it finishes or ``timeout`` seconds pass, whichever is first."""
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            job = await asyncio.to_thread(self.get, job_id)
+            remaining = deadline - loop.time()
+            if job is None or job.status in TERMINAL_STATUSES or remaining <= 0:
+                if job is None or job.status in TERMINAL_STATUSES:
+                    self._finished.pop(job_id, None)
+                return job
+            # 本进程的 worker 完成时立即唤醒；其他进程完成的任务靠轮询发现。
+            finished = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(finished.wait(), min(self.poll_interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim(self) -> tuple[str, str, int, int] | None:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.stale_after)
+        with self._session_factory() as db:
+            candidate = (
+                select(ImageJob.id)
+                .where(
+                    or_(
+                        (ImageJob.status == "queued") & (ImageJob.available_at <= now),
+                        (ImageJob.status == "running") & (ImageJob.started_at < stale),
+                    )
+                )
+                .order_by(ImageJob.available_at)
+                .limit(1)
+                .scalar_subquery()
+            )
+            row = db.execute(
+                update(ImageJob)
+                .where(ImageJob.id == candidate)
+                .values(status="running", attempts=ImageJob.attempts + 1, started_at=now)
+                .returning(ImageJob.id, ImageJob.prompt, ImageJob.attempts, ImageJob.max_attempts)
+            ).first()
+            db.commit()
+            return tuple(row) if row else None
+
+    def _finish(self, job_id: str, **values) -> None:
+        with self._session_factory() as db:
+            db.execute(update(ImageJob).where(ImageJob.id == job_id).values(**values))
+            db.commit()
+
+    async def _worker(self) -> None:
+        while True:
+            # 先清除再认领：认领期间提交的任务会重新置位，不会错过唤醒。
+            self._wake.clear()
+            try:
+                claimed = await asyncio.to_thread(self._claim)
+            except Exception:  # pragma: no cover - keep the worker alive on transient DB errors
+                logger.exception("claiming image job failed")
+                claimed = None
+            if claimed is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(*claimed)
+
+    async def _run(self, job_id: str, prompt: str, attempts: int, max_attempts: int) -> None:
+        try:
+            url, key = await self._generate(prompt)
+        except asyncio.CancelledError:
+            # 关闭时放回队列，下次启动继续。
+            await asyncio.to_thread(self._finish, job_id, status="queued", attempts=attempts - 1)
+            raise
+        except Exception as exc:
+            error = str(exc)[:500] or type(exc).__name__
+            if attempts < max_attempts:
+                self.retried += 1
+                retry_at = datetime.utcnow() + timedelta(seconds=self.retry_backoff * 2 ** (attempts - 1))
+                await asyncio.to_thread(self._finish, job_id, status="queued", error=error, available_at=retry_at)
+                return
+            self.failed += 1
+            await asyncio.to_thread(
+                self._finish, job_id, status="failed", error=error, finished_at=datetime.utcnow()
+            )
+        else:
+            self.completed += 1
+            await asyncio.to_thread(
+                self._finish, job_id, status="succeeded", image_url=url, image_key=key, error=None,
+                finished_at=datetime.utcnow(),
+            )
+        finished = self._finished.pop(job_id, None)
+        if finished is not None:
+            finished.set()
+
+
+_queue: ImageJobQueue | None = None
+
+
+def get_image_jobs() -> ImageJobQueue | None:
+    return _queue
+
+
+def start_image_jobs(
+    session_factory: Callable[[], Session], settings: Settings, generate: GenerateFunc = generate_cached
+) -> ImageJobQueue:
+    global _queue
+    if _queue is None:
+        _queue = ImageJobQueue(
+            session_factory,
+            generate,
+            concurrency=settings.image_job_concurrency,
+            max_queue=settings.image_job_max_queue,
+            max_attempts=settings.image_job_max_attempts,
+            retry_backoff=settings.image_job_retry_backoff_seconds,
+            poll_interval=settings.image_job_poll_interval_seconds,
+            stale_after=settings.image_job_stale_after_seconds,
+        )
+        _queue.start()
+    return _queue
+
+
+async def stop_image_jobs() -> None:
+    global _queue
+    if _queue is not None:
+        await _queue.stop()
+        _queue = None
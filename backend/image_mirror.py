@@ -0,0 +1,147 @@
+"""Local mirror of generated images with pre-sized variants.
+
+Each image is downloaded once and stored under the SHA-256 of its bytes::
+
+    <image_mirror_dir>/<digest>/original.png
+    <image_mirror_dir>/<digest>/thumb.webp   # 最长边 image_thumbnail_size
+    <image_mirror_dir>/<digest>/web.webp     # 最长边 image_web_size
+
+The files never change once written, so they are served with long-lived
+immutable cache headers. Variants need Pillow; without it only the original
+is stored and variant requests fall back to it with ``Cache-Control: no-store``.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+from .config import get_settings
+from .image_cache import write_atomic
+
+try:  # Pillow 是可选依赖，未安装时只保存原图
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+VARIANTS = ("original", "thumb", "web")
+MEDIA_TYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp", "bin": "application/octet-stream"}
+
+
+def sniff_extension(data: bytes) -> str:
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "bin"
+
+
+@dataclass
+class MirroredImage:
+    digest: str
+    files: dict[str, Path] = field(default_factory=dict)
+
+    def url(self, variant: str = "original") -> str:
+        return f"/api/images/{self.digest}/{variant}"
+
+
+class ImageMirror:
+    def __init__(
+        self,
+        directory: str | Path,
+        *,
+        thumbnail_size: int = 256,
+        web_size: int = 1024,
+        webp_quality: int = 80,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sizes = {"thumb": thumbnail_size, "web": web_size}
+        self.webp_quality = webp_quality
+
+    def lookup(self, digest: str) -> MirroredImage | None:
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        folder = self.directory / digest
+        files = {path.stem: path for path in folder.glob("*.*") if path.stem in VARIANTS}
+        if "original" not in files:
+            return None
+        return MirroredImage(digest, files)
+
+    def file_for(self, digest: str, variant: str) -> Path | None:
+        """The file for ``variant``, or the original when that variant was never produced."""
+
+        image = self.lookup(digest)
+        if image is None or variant not in VARIANTS:
+            return None
+        return image.files.get(variant, image.files["original"])
+
+    def store(self, data: bytes) -> MirroredImage:
+        """Write ``data`` and its variants; storing the same bytes again is a no-op."""
+
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self.lookup(digest)
+        if existing is not None:
+            return existing
+        folder = self.directory / digest
+        folder.mkdir(parents=True, exist_ok=True)
+        files = {}
+        for name, payload in self._variants(data).items():
+            path = folder / name
+            write_atomic(path, payload)
+            files[path.stem] = path
+        # 原图最后写入：lookup 以原图是否存在判断镜像是否完整。
+        original = folder / f"original.{sniff_extension(data)}"
+        write_atomic(original, data)
+        files["original"] = original
+        return MirroredImage(digest, files)
+
+    def _variants(self, data: bytes) -> dict[str, bytes]:
+        if Image is None:
+            return {}
+        variants = {}
+        try:
+            with Image.open(io.BytesIO(data)) as source:
+                source.load()
+                for name, size in self.sizes.items():
+                    image = source.copy()
+                    image.thumbnail((size, size), Image.LANCZOS)
+                    if image.mode not in ("RGB", "RGBA"):
+                        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+                    buffer = io.BytesIO()
+                    image.save(buffer, "WEBP", quality=self.webp_quality, method=4)
+                    variants[f"{name}.webp"] = buffer.getvalue()
+        except (OSError, ValueError, KeyError) as exc:
+            # 无法解码或 Pillow 不支持 webp：只保留原图。
+            logger.warning("image variants skipped: %s", exc)
+            return {}
+        return variants
+
+    async def mirror(self, data: bytes) -> MirroredImage:
+        # 缩放与编码是 CPU 密集操作，放到线程里做。
+        return await asyncio.to_thread(self.store, data)
+
+
+def media_type(path: Path) -> str:
+    return MEDIA_TYPES.get(path.suffix.lstrip("."), "application/octet-stream")
+
+
+@lru_cache
+def get_image_mirror() -> ImageMirror:
+    settings = get_settings()
+    return ImageMirror(
+        settings.image_mirror_dir,
+        thumbnail_size=settings.image_thumbnail_size,
+        web_size=settings.image_web_size,
+        webp_quality=settings.image_webp_quality,
+    )
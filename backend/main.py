@@ -1,53 +1,165 @@
 from __future__ import annotations
 
+import hashlib
+import inspect
+import logging
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
+from functools import partial
 
-from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from typing import Callable, ContextManager, Optional
 
+from .ark_client import close_ark_client
+from .class_sets import assign_class_set, default_seed, get_class_set_store
 from .config import get_settings
-from .database import Base, engine, get_db
+from .database import Base, SessionLocal, engine, get_db
 from .foods import FOOD_MAP, FOODS
-from .models import FoodPurchase, Question, User
+from .idempotency import (
+    MAX_KEY_LENGTH,
+    IdempotencyInProgressError,
+    IdempotencyMismatchError,
+    get_idempotency_store,
+)
+from .image_mirror import get_image_mirror, media_type
+from .image_jobs import ImageQueueFullError, get_image_jobs, start_image_jobs, stop_image_jobs
+from .metrics import REGISTRY, MetricsMiddleware, time_component, update_threadpool_gauges
+from .migrations import run_migrations
+from .practice import QuestionGenerationError, is_finished, issue_question, run_practice_socket
+from .prefetch import get_question_prefetcher
+from .rate_limit import LIMITED_DETAIL, get_rate_limiter
+from .profiler import ProfilerMiddleware, list_profiles, profile_path, secret_matches
+from .models import ImageJob, Question
 from .question_generator import generate_question
+from .request_log import RequestLog, RequestRecorderMiddleware
+from .responses import PrecomputedResponse, etag_matches, json_response, matching_etag, not_modified
 from .schemas import (
     BatchQuestion,
+    BatchQuestionList,
     BuyFoodRequest,
     BuyFoodResponse,
     BatchGenerateRequest,
     BatchGenerateResponse,
     CheckAnswerRequest,
+    CatStage,
+    CatStageListResponse,
     CheckAnswerResponse,
+    ClassSetRequest,
+    ClassSetResponse,
     FoodItem,
     FoodListResponse,
     GenerateQuestionRequest,
     GenerateQuestionResponse,
+    ImageJobRequest,
+    ImageJobResponse,
     LoginRequest,
     LoginResponse,
+    PracticeAnswerResponse,
     RecentQuestionsResponse,
     UserSummaryResponse,
     HistoryCreate,
     HistoryResponse,
+    HistoryResponseList,
+    RecentQuestionList,
 )
 from .services import (
     AnswerResult,
+    cat_stage_table,
     create_history_entry,
     generate_batch_questions,
     get_cat_score,
     get_cat_stage,
     get_history_entries,
     get_recent_questions,
+    login_user,
     next_stage_threshold,
     process_answer,
+    purchase_food,
+    save_generated_question,
+    save_generated_questions,
 )
+from .tracing import TracingMiddleware, get_trace_recorder, span
+from .user_cache import CachedUser, get_user_cache
+from .write_behind import start_write_behind, stop_write_behind
 
 # Ensure tables exist before the first request
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
-app = FastAPI(title="七年级整式练习 API", version="1.0.0")
+logger = logging.getLogger(__name__)
 settings = get_settings()
+# 学生状态类接口：允许浏览器缓存，但每次使用前都要带 If-None-Match 回来校验。
+USER_STATE_CACHE_CONTROL = "private, no-cache"
+
+
+# 进程生命周期内不变的查找表：启动时序列化并压缩一次，之后只做编码协商和 ETag 比较。
+FOOD_CATALOGUE = PrecomputedResponse.from_model(
+    FoodListResponse(
+        foods=[
+            FoodItem(
+                foodId=food.food_id,
+                name=food.name,
+                description=food.description,
+                price=food.price,
+                image=food.image,
+            )
+            for food in FOODS
+        ]
+    )
+)
+CAT_STAGES = PrecomputedResponse.from_model(
+    CatStageListResponse(
+        stages=[
+            CatStage(stage=stage, minScore=min_score, maxScore=max_score)
+            for stage, min_score, max_score in cat_stage_table()
+        ]
+    )
+)
+
+
+# 录制的请求日志；未配置路径时为 None，不安装录制中间件。
+REQUEST_LOG = RequestLog(settings.request_log_path) if settings.request_log_path else None
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    if settings.write_behind_enabled:
+        start_write_behind(SessionLocal, settings)
+    if settings.image_jobs_enabled:
+        start_image_jobs(SessionLocal, settings)
+    try:
+        yield
+    finally:
+        # 关闭前把排队中的答题/历史记录全部落盘；每一步单独处理异常，失败也不跳过后面的步骤。
+        steps = [
+            ("write-behind queue", stop_write_behind),
+            ("request log", REQUEST_LOG.flush if REQUEST_LOG is not None else None),
+            ("image jobs", stop_image_jobs),
+            ("ark client", close_ark_client),
+            ("question prefetcher", get_question_prefetcher().shutdown),
+        ]
+        for name, step in steps:
+            if step is None:
+                continue
+            try:
+                result = step()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("shutting down the %s failed", name)
+
+
+app = FastAPI(
+    title="七年级整式练习 API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -56,36 +168,59 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 最后添加 = 最外层：计时包含 CORS 处理，且能看到内层路由写入 scope 的 route 模板。
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+if REQUEST_LOG is not None:
+    app.add_middleware(
+        RequestRecorderMiddleware, log=REQUEST_LOG, sample_rate=settings.request_log_sample_rate
+    )
+# 未配置密钥时不安装中间件，普通请求没有任何额外开销。
+if settings.profile_secret:
+    app.add_middleware(
+        ProfilerMiddleware,
+        secret=settings.profile_secret,
+        output_dir=settings.profile_dir,
+        interval_ms=settings.profile_interval_ms,
+    )
 
 
-def _get_user_or_404(db: Session, user_id: int) -> User:
-    user = db.get(User, user_id)
+def _get_user_or_404(db: Session, user_id: int) -> CachedUser:
+    # 只用于存在性检查；返回积分等可变字段的接口按 state_version 校验缓存。
+    user = get_user_cache().get(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="未找到该学生")
     return user
 
 
+def _current_version_or_404(db: Session, user_id: int) -> int:
+    version = get_user_cache().current_version(db, user_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="未找到该学生")
+    return version
+
+
+def _admit(request: Request, scope: str, user_id: Optional[int] = None, cost: float = 1) -> None:
+    """Charge the ``scope`` budget of this student and client IP; 429 with Retry-After when empty."""
+
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return
+    ip = request.client.host if request.client else None
+    decision = limiter.acquire(scope, user_id=user_id, ip=ip, cost=cost)
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=429, detail=LIMITED_DETAIL, headers={"Retry-After": decision.retry_after_header}
+        )
+
+
+def _user_state_etag(kind: str, user_id: int, version: int) -> str:
+    return f'"{kind}-{user_id}-{version}"'
+
+
 @app.post("/api/login", response_model=LoginResponse)
 def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = (
-        db.query(User)
-        .filter(
-            User.chinese_name == payload.chinese_name,
-            User.english_name == payload.english_name,
-            User.class_name == payload.class_name,
-        )
-        .first()
-    )
-    if not user:
-        user = User(
-            chinese_name=payload.chinese_name,
-            english_name=payload.english_name,
-            class_name=payload.class_name,
-            total_score=0,
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+    user = login_user(db, payload)
     return LoginResponse(
         userId=user.id,
         chinese_name=user.chinese_name,
@@ -96,29 +231,19 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
 
 
 @app.post("/api/generate_question", response_model=GenerateQuestionResponse)
-def create_question(payload: GenerateQuestionRequest, db: Session = Depends(get_db)):
-    user = db.get(User, payload.user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="未找到该学生")
+def create_question(payload: GenerateQuestionRequest, request: Request, db: Session = Depends(get_db)):
+    _admit(request, "generate", payload.user_id)
+    user = _get_user_or_404(db, payload.user_id)
 
     topic = payload.topic
     difficulty_level = payload.difficulty_level
     try:
-        question = generate_question(topic=topic, difficulty_level=difficulty_level)  # type: ignore[arg-type]
+        with time_component("sympy_generate"):
+            question = generate_question(topic=topic, difficulty_level=difficulty_level)  # type: ignore[arg-type]
     except Exception as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    db_question = Question(
-        question_id=question.question_id,
-        user_id=user.id,
-        expression_text=question.expression_text,
-        solution_expression=question.solution_expression,
-        topic=question.topic,
-        difficulty_level=question.difficulty_level,
-        difficulty_score=question.difficulty_score,
-    )
-    db.add(db_question)
-    db.commit()
+    db_question = save_generated_question(db, user.id, question)
 
     return GenerateQuestionResponse(
         questionId=db_question.question_id,
@@ -131,18 +256,110 @@ def create_question(payload: GenerateQuestionRequest, db: Session = Depends(get_
 
 
 @app.post("/api/questions/batch", response_model=BatchGenerateResponse)
-def batch_generate_questions(payload: BatchGenerateRequest):
+def batch_generate_questions(payload: BatchGenerateRequest, request: Request, db: Session = Depends(get_db)):
+    _admit(request, "generate", payload.user_id, cost=payload.count)
+    user = _get_user_or_404(db, payload.user_id) if payload.user_id is not None else None
     questions = generate_batch_questions(payload.count, payload.difficulty)
-    return BatchGenerateResponse(
+    # 按学生出的题要判题计分，入库后不再把答案发给前端。
+    exclude = None
+    if user is not None:
+        save_generated_questions(db, user.id, questions)
+        exclude = {"__all__": {"solution_expression"}}
+    with span("serialize"):
+        items = BatchQuestionList.validate_python(questions, from_attributes=True)
+        body = b'{"questions":' + BatchQuestionList.dump_json(items, by_alias=True, exclude=exclude) + b"}"
+    return json_response(request, body)
+
+
+@app.post("/api/class_sets/assign", response_model=ClassSetResponse, response_model_exclude_none=True)
+def assign_class_questions(payload: ClassSetRequest, request: Request, db: Session = Depends(get_db)):
+    # 全班共用一套题：第一次请求生成并入库，之后每个学生只拿到自己的题目行（可判题，不含答案）。
+    _admit(request, "generate", payload.user_id)
+    user = _get_user_or_404(db, payload.user_id)
+    seed = payload.seed if payload.seed is not None else default_seed()
+    try:
+        items = get_class_set_store().get(db, user.class_name, payload.difficulty_level, seed)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    assigned = assign_class_set(db, user.id, items)
+    return ClassSetResponse(
+        className=user.class_name,
+        difficultyLevel=payload.difficulty_level,
+        seed=seed,
         questions=[
-            BatchQuestion.model_validate(q, from_attributes=True)
-            for q in questions
-        ]
+            BatchQuestion(
+                questionId=question_id,
+                topic=item.topic,
+                difficultyLevel=item.difficulty_level,
+                expressionText=item.expression_text,
+                expressionLatex=item.expression_latex,
+                difficultyScore=item.difficulty_score,
+            )
+            for question_id, item in assigned
+        ],
     )
 
 
-@app.post("/api/check_answer", response_model=CheckAnswerResponse)
-def check_answer(payload: CheckAnswerRequest, db: Session = Depends(get_db)):
+def _idempotent(
+    db: Session,
+    scope: str,
+    user_id: int,
+    key: Optional[str],
+    payload: BaseModel,
+    handler: Callable[[], BaseModel],
+    admit: Optional[Callable[[], None]] = None,
+):
+    """Run ``handler`` once per ``Idempotency-Key``; retries get the stored response of a finished run.
+
+    ``handler`` leaves its changes uncommitted: they are committed here, together
+    with the stored response. ``admit`` (rate limiting) runs after the replay
+    check, so a retry answered from the store costs no budget.
+    """
+
+    if key is None:
+        if admit is not None:
+            admit()
+        result = handler()
+        db.commit()
+        get_user_cache().invalidate(user_id)
+        return result
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key 无效")
+    store = get_idempotency_store()
+    # 按接口与学生区分：不同学生碰巧用了同一个键也互不影响。
+    store_key = f"{scope}:{user_id}:{key}"
+    fingerprint = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+    try:
+        stored = store.begin(db, store_key, fingerprint)
+    except IdempotencyMismatchError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    except IdempotencyInProgressError as exc:
+        raise HTTPException(status_code=409, detail=str(exc), headers={"Retry-After": "1"}) from exc
+    if stored is not None:
+        return Response(
+            content=stored.body,
+            status_code=stored.status_code,
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        if admit is not None:
+            admit()
+        result = handler()
+        # 响应与判题/扣分在同一个事务里提交：不会出现改动已提交、响应却没保存下来的情况。
+        store.complete(db, store_key, 200, result.model_dump_json(by_alias=True).encode())
+    except IdempotencyInProgressError as exc:
+        raise HTTPException(status_code=409, detail=str(exc), headers={"Retry-After": "1"}) from exc
+    except BaseException:
+        # 只保存执行完成的结果：错误（积分不足等）不保存，重试按当时的状态重新执行。
+        store.abandon(db, store_key)
+        raise
+    get_user_cache().invalidate(user_id)
+    return result
+
+
+def _grade_answer(db: Session, payload: CheckAnswerRequest) -> tuple[CachedUser, Question, AnswerResult]:
     user = _get_user_or_404(db, payload.user_id)
 
     question = db.query(Question).filter(
@@ -153,91 +370,174 @@ def check_answer(payload: CheckAnswerRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="题目不存在或已过期")
 
     try:
-        result: AnswerResult = process_answer(db, question, user, payload.user_answer)
+        result = process_answer(db, question, user, payload.user_answer, commit=False)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return user, question, result
 
-    return CheckAnswerResponse(
-        isCorrect=result.is_correct,
-        difficultyScore=result.difficulty_score,
-        scoreChange=result.score_change,
-        newTotalScore=result.new_total_score,
-        attemptCount=result.attempt_count,
-        solutionExpression=result.solution_expression,
-    )
+
+def _answer_fields(result: AnswerResult) -> dict:
+    return {
+        "isCorrect": result.is_correct,
+        "difficultyScore": result.difficulty_score,
+        "scoreChange": result.score_change,
+        "newTotalScore": result.new_total_score,
+        "attemptCount": result.attempt_count,
+        "solutionExpression": result.solution_expression,
+    }
+
+
+@app.post("/api/check_answer", response_model=CheckAnswerResponse)
+def check_answer(
+    payload: CheckAnswerRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    def grade() -> CheckAnswerResponse:
+        _, _, result = _grade_answer(db, payload)
+        return CheckAnswerResponse(**_answer_fields(result))
+
+    admit = partial(_admit, request, "check", payload.user_id)
+    return _idempotent(db, "check_answer", payload.user_id, idempotency_key, payload, grade, admit)
+
+
+def _issue_question_or_400(db: Session, user_id: int, topic: str, difficulty_level: str) -> GenerateQuestionResponse:
+    try:
+        _, body = issue_question(db, user_id, topic, difficulty_level)
+    except QuestionGenerationError as exc:
+        # 只有出题失败算请求问题；保存、提交失败照常返回 500。
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return body
+
+
+@app.post("/api/practice/next", response_model=GenerateQuestionResponse)
+def practice_next(payload: GenerateQuestionRequest, request: Request, db: Session = Depends(get_db)):
+    # 与 /api/generate_question 相同，但优先使用预取好的题目，并在返回前预取下一题。
+    _admit(request, "generate", payload.user_id)
+    user = _get_user_or_404(db, payload.user_id)
+    return _issue_question_or_400(db, user.id, payload.topic, payload.difficulty_level)
+
+
+@app.post("/api/practice/answer", response_model=PracticeAnswerResponse)
+def practice_answer(
+    payload: CheckAnswerRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    def grade() -> PracticeAnswerResponse:
+        user, question, result = _grade_answer(db, payload)
+        next_question = None
+        if is_finished(result):
+            try:
+                # 保存点：出下一题失败只撤销这一步，评分仍随后面的提交生效，客户端再调 /api/practice/next。
+                with db.begin_nested():
+                    _, next_question = issue_question(
+                        db, user.id, question.topic, question.difficulty_level, commit=False
+                    )
+            except Exception:
+                logger.exception("issuing the next practice question failed")
+        else:
+            # 还要继续作答：确保下一题已在后台准备（已有则不重复生成）。
+            get_question_prefetcher().schedule(user.id, question.topic, question.difficulty_level)
+        return PracticeAnswerResponse(**_answer_fields(result), nextQuestion=next_question)
+
+    admit = partial(_admit, request, "check", payload.user_id)
+    return _idempotent(db, "practice_answer", payload.user_id, idempotency_key, payload, grade, admit)
+
+
+def _db_session() -> ContextManager[Session]:
+    # 与 Depends(get_db) 同一来源（测试里的覆盖同样生效），但由调用方决定何时打开、关闭。
+    return contextmanager(app.dependency_overrides.get(get_db, get_db))()
+
+
+@app.websocket("/ws/practice")
+async def practice_socket(websocket: WebSocket):
+    # 协议见 backend/practice.py；一个连接对应一个学生的整段练习，每条消息单独开 Session。
+    await run_practice_socket(websocket, _db_session)
 
 
 @app.post("/api/buy_food", response_model=BuyFoodResponse)
-def buy_food(payload: BuyFoodRequest, db: Session = Depends(get_db)):
-    user = db.get(User, payload.user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="未找到该学生")
+def buy_food(
+    payload: BuyFoodRequest,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    def buy() -> BuyFoodResponse:
+        _get_user_or_404(db, payload.user_id)
 
-    food = FOOD_MAP.get(payload.food_id)
-    if not food:
-        raise HTTPException(status_code=404, detail="未找到该食物")
+        food = FOOD_MAP.get(payload.food_id)
+        if not food:
+            raise HTTPException(status_code=404, detail="未找到该食物")
 
-    if user.total_score < food.price:
-        raise HTTPException(status_code=400, detail="积分不足")
+        try:
+            new_total_score = purchase_food(db, payload.user_id, food, commit=False)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    user.total_score -= food.price
-    purchase = FoodPurchase(
-        user_id=user.id,
-        food_id=food.food_id,
-        food_name=food.name,
-        cost=food.price,
-    )
-    db.add(purchase)
-    db.commit()
-    db.refresh(user)
+        cat_score = get_cat_score(db, payload.user_id)
 
-    cat_score = get_cat_score(db, user.id)
+        return BuyFoodResponse(
+            success=True,
+            newTotalScore=new_total_score,
+            currentCatStage=get_cat_stage(cat_score),
+        )
 
-    return BuyFoodResponse(
-        success=True,
-        newTotalScore=user.total_score,
-        currentCatStage=get_cat_stage(cat_score),
-    )
+    return _idempotent(db, "buy_food", payload.user_id, idempotency_key, payload, buy)
 
 
 @app.get("/api/foods", response_model=FoodListResponse)
-def list_foods():
-    return FoodListResponse(
-        foods=[
-            FoodItem(
-                foodId=food.food_id,
-                name=food.name,
-                description=food.description,
-                price=food.price,
-                image=food.image,
-            )
-            for food in FOODS
-        ]
-    )
+def list_foods(request: Request):
+    return FOOD_CATALOGUE.respond(request)
+
+
+@app.get("/api/cat_stages", response_model=CatStageListResponse)
+def list_cat_stages(request: Request):
+    return CAT_STAGES.respond(request)
 
 
 @app.get("/api/users/{user_id}/summary", response_model=UserSummaryResponse)
-def summary(user_id: int, db: Session = Depends(get_db)):
-    user = _get_user_or_404(db, user_id)
+def summary(user_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    version = _current_version_or_404(db, user_id)
+    etag = _user_state_etag("summary", user_id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag, USER_STATE_CACHE_CONTROL)
+
+    user = get_user_cache().get_at_version(db, user_id, version)
+    if not user:
+        raise HTTPException(status_code=404, detail="未找到该学生")
 
     cat_score = get_cat_score(db, user.id)
 
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = USER_STATE_CACHE_CONTROL
     return UserSummaryResponse(
         userId=user.id,
         totalScore=user.total_score,
         catScore=cat_score,
         currentCatStage=get_cat_stage(cat_score),
         nextStageScore=next_stage_threshold(cat_score),
-        updated_at=datetime.utcnow(),
+        updated_at=user.updated_at,
     )
 
 
 @app.get("/api/users/{user_id}/recent_questions", response_model=RecentQuestionsResponse)
-def recent_questions(user_id: int, db: Session = Depends(get_db)):
-    _get_user_or_404(db, user_id)
+def recent_questions(user_id: int, request: Request, db: Session = Depends(get_db)):
+    version = _current_version_or_404(db, user_id)
+    etag = _user_state_etag("recent", user_id, version)
+    matched = matching_etag(request, etag)
+    if matched is not None:
+        return not_modified(matched, USER_STATE_CACHE_CONTROL)
 
     questions = get_recent_questions(db, user_id)
-    return RecentQuestionsResponse(questions=questions)
+    with span("serialize"):
+        body = b'{"questions":' + RecentQuestionList.dump_json(questions, by_alias=True) + b"}"
+    return json_response(
+        request,
+        body,
+        headers={"ETag": etag, "Cache-Control": USER_STATE_CACHE_CONTROL},
+    )
 
 
 @app.post("/api/history", response_model=HistoryResponse)
@@ -248,6 +548,7 @@ def post_history(payload: HistoryCreate, db: Session = Depends(get_db)):
 
 @app.get("/api/history", response_model=list[HistoryResponse])
 def get_history(
+    request: Request,
     user_id: int,
     limit: int = Query(default=20, ge=1, le=100),
     offset: int = 0,
@@ -257,6 +558,123 @@ def get_history(
     db: Session = Depends(get_db),
 ):
     _get_user_or_404(db, user_id)
-    return get_history_entries(
+    entries = get_history_entries(
         db, user_id, limit, offset, min_score, date_from, date_to
     )
+    with span("serialize"):
+        body = HistoryResponseList.dump_json(entries)
+    return json_response(request, body)
+
+
+def _image_job_response(job: ImageJob) -> ImageJobResponse:
+    return ImageJobResponse(
+        jobId=job.id,
+        status=job.status,
+        attempts=job.attempts,
+        imageUrl=job.image_url,
+        error=job.error,
+        createdAt=job.created_at,
+        finishedAt=job.finished_at,
+    )
+
+
+def _image_jobs_or_503():
+    jobs = get_image_jobs()
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="图片任务队列未启用")
+    return jobs
+
+
+# async：提交与等待都不占用线程池，生成过程由后台 worker 协程完成。
+@app.post("/api/images/jobs", response_model=ImageJobResponse, status_code=202)
+async def submit_image_job(payload: ImageJobRequest, request: Request):
+    jobs = _image_jobs_or_503()
+    await run_in_threadpool(_admit, request, "image", payload.user_id)
+    try:
+        job = await jobs.submit(payload.prompt)
+    except ImageQueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"}) from exc
+    return _image_job_response(job)
+
+
+@app.get("/api/images/jobs/{job_id}", response_model=ImageJobResponse)
+async def image_job_status(job_id: str, wait: float = Query(default=0, ge=0, le=30)):
+    """Job status; ``wait`` long-polls up to that many seconds for the job to finish."""
+
+    job = await _image_jobs_or_503().wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="未找到该图片任务")
+    return _image_job_response(job)
+
+
+# 镜像文件按内容哈希寻址、写入后不再变化，可以让浏览器长期缓存。
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@app.get("/api/images/{digest}/{variant}")
+def mirrored_image(digest: str, variant: str, request: Request):
+    """Serve a mirrored image: ``original``, ``thumb`` or ``web`` (the latter two are webp)."""
+
+    path = get_image_mirror().file_for(digest, variant)
+    if path is None:
+        raise HTTPException(status_code=404, detail="未找到该图片")
+    if path.stem != variant:
+        # 变体缺失（未安装 Pillow 或缩放失败）时回退原图，但不能让变体 URL 被长期缓存成原图。
+        return FileResponse(path, media_type=media_type(path), headers={"Cache-Control": "no-store"})
+    etag = f'"{digest}-{path.stem}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, IMMUTABLE_CACHE_CONTROL)
+    return FileResponse(
+        path, media_type=media_type(path), headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    )
+
+
+def _require_profile_secret(x_profile: Optional[str] = Header(default=None)) -> None:
+    # 与未开启时一样返回 404，不暴露接口是否存在。
+    if not secret_matches(x_profile, settings.profile_secret):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.get("/api/debug/user_cache", dependencies=[Depends(_require_profile_secret)])
+def user_cache_stats():
+    return get_user_cache().stats()
+
+
+@app.get("/api/debug/prefetch", dependencies=[Depends(_require_profile_secret)])
+def prefetch_stats():
+    return get_question_prefetcher().stats()
+
+
+@app.get("/api/debug/class_sets", dependencies=[Depends(_require_profile_secret)])
+def class_set_stats():
+    return get_class_set_store().stats()
+
+
+@app.get("/api/debug/idempotency", dependencies=[Depends(_require_profile_secret)])
+def idempotency_stats():
+    return get_idempotency_store().stats()
+
+
+@app.get("/api/debug/traces", dependencies=[Depends(_require_profile_secret)])
+def recent_traces(limit: int = Query(default=20, ge=1, le=200), slow_only: bool = False):
+    return get_trace_recorder().recent(limit=limit, slow_only=slow_only)
+
+
+@app.get("/api/debug/profiles", dependencies=[Depends(_require_profile_secret)])
+def profiles():
+    return list_profiles(settings.profile_dir)
+
+
+@app.get("/api/debug/profiles/{profile_id}", dependencies=[Depends(_require_profile_secret)])
+def download_profile(profile_id: str):
+    path = profile_path(settings.profile_dir, profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path, media_type="text/plain", filename=path.name)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # async：抓取时不占用线程池，线程池被判题请求占满时也能读到排队深度。
+    update_threadpool_gauges()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,291 @@
+"""Minimal in-process Prometheus metrics (text exposition format 0.0.4)."""
+from __future__ import annotations
+
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# 数据库单条语句通常远小于请求耗时，用更细的桶。
+DB_BUCKETS: tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0,
+)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：各个桶的计数（非累计，最后一位是 +Inf）、总和、总数。
+        self._series: dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(
+                        f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                    )
+                label_text = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose value is either set directly or read from a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float] | None = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._callback = callback
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def value(self) -> float:
+        return float(self._callback()) if self._callback is not None else self._value
+
+    def collect(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_value(self.value())}",
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: list[Counter | Histogram | Gauge] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+def _resident_memory_bytes() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # 非 Linux：退回峰值 RSS（macOS 单位是字节，Linux 是 KB）。
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+REGISTRY = MetricsRegistry()
+REQUESTS = REGISTRY.register(
+    Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+)
+REQUEST_LATENCY = REGISTRY.register(
+    Histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+)
+COMPONENT_LATENCY = REGISTRY.register(
+    Histogram(
+        "component_duration_seconds",
+        "Time spent in sympy generation/checking and per SQL statement/commit.",
+        ("component",),
+        buckets=DB_BUCKETS + LATENCY_BUCKETS[-6:],
+    )
+)
+OPEN_SESSIONS = REGISTRY.register(Gauge("db_open_sessions", "SQLAlchemy sessions currently open."))
+RESIDENT_MEMORY = REGISTRY.register(
+    Gauge("process_resident_memory_bytes", "Resident set size of this worker.", _resident_memory_bytes)
+)
+RATE_LIMIT_DECISIONS = REGISTRY.register(
+    Counter(
+        "rate_limit_decisions_total",
+        "Admission decisions by budget; outcome is allowed, limited_user or limited_ip.",
+        ("scope", "outcome"),
+    )
+)
+USER_CACHE_LOOKUPS = REGISTRY.register(
+    Counter(
+        "user_cache_lookups_total",
+        "User cache lookups; outcome is hit, miss or stale (cached at an older state_version).",
+        ("outcome",),
+    )
+)
+THREADPOOL_BUSY = REGISTRY.register(Gauge("threadpool_busy_threads", "Threadpool tokens in use."))
+THREADPOOL_WAITING = REGISTRY.register(
+    Gauge("threadpool_queue_depth", "Sync endpoints waiting for a threadpool thread.")
+)
+
+
+def time_component(component: str):
+    """Context manager timing one component, e.g. ``sympy_generate`` or ``sympy_check``."""
+
+    return COMPONENT_LATENCY.time(component)
+
+
+def update_threadpool_gauges() -> None:
+    """Refresh threadpool gauges; must run inside the event loop."""
+
+    from anyio.to_thread import current_default_thread_limiter
+
+    stats = current_default_thread_limiter().statistics()
+    THREADPOOL_BUSY.set(stats.borrowed_tokens)
+    THREADPOOL_WAITING.set(stats.tasks_waiting)
+
+
+# 起始时间挂在本次执行的 ExecutionContext 上：StaticPool 等场景下多个线程可能共用同一个连接。
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context._metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    start = getattr(context, "_metrics_query_start", None)
+    if start is not None:
+        COMPONENT_LATENCY.observe(time.perf_counter() - start, "db_query")
+
+
+def instrument_engine(target: Engine) -> None:
+    """Record per-statement (``db_query``) and commit (``db_commit``) durations."""
+
+    if event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+    # SQLAlchemy 没有 "after commit" 连接事件，直接包一层方言的 do_commit 计时。
+    do_commit = target.dialect.do_commit
+
+    def timed_do_commit(dbapi_connection) -> None:
+        with COMPONENT_LATENCY.time("db_commit"):
+            do_commit(dbapi_connection)
+
+    target.dialect.do_commit = timed_do_commit
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request counts and latency per route template."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # 未匹配路由的请求（404 扫描等）归为一类，避免标签基数爆炸。
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUEST_LATENCY.observe(time.perf_counter() - start, method, route_label)
+            REQUESTS.inc(method, route_label, status)
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+from typing import Callable
+
+from sqlalchemy.engine import Connection, Engine
+
+# 历史记录与答题记录视为同一次提交的时间窗口（秒）：前端先判题、再单独 POST 历史。
+HISTORY_MATCH_WINDOW_SECONDS = 120
+
+
+def _table_exists(conn: Connection, table: str) -> bool:
+    row = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).first()
+    return row is not None
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    rows = conn.exec_driver_sql(f"PRAGMA table_info({table})").all()
+    return any(row[1] == column for row in rows)
+
+
+def _column_is_required(conn: Connection, table: str, column: str) -> bool:
+    rows = conn.exec_driver_sql(f"PRAGMA table_info({table})").all()
+    return any(row[1] == column and row[3] for row in rows)
+
+
+def _make_attempt_question_optional(conn: Connection) -> None:
+    """Rebuild question_attempts so question_id, topic and difficulty_level may be NULL.
+
+    SQLite cannot drop NOT NULL in place; the table is copied into the new shape.
+    """
+
+    if not _column_is_required(conn, "question_attempts", "question_id"):
+        return
+    conn.exec_driver_sql(
+        """
+        CREATE TABLE question_attempts_new (
+            id INTEGER NOT NULL PRIMARY KEY,
+            question_id VARCHAR REFERENCES questions (question_id),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            expression_text VARCHAR NOT NULL,
+            topic VARCHAR,
+            difficulty_level VARCHAR,
+            difficulty_score INTEGER NOT NULL,
+            user_answer VARCHAR NOT NULL,
+            is_correct BOOLEAN,
+            score_change INTEGER,
+            attempt_index INTEGER NOT NULL,
+            correct_answer VARCHAR,
+            created_at DATETIME
+        )
+        """
+    )
+    columns = (
+        "id, question_id, user_id, expression_text, topic, difficulty_level, difficulty_score, "
+        "user_answer, is_correct, score_change, attempt_index, correct_answer, created_at"
+    )
+    conn.exec_driver_sql(f"INSERT INTO question_attempts_new ({columns}) SELECT {columns} FROM question_attempts")
+    conn.exec_driver_sql("DROP TABLE question_attempts")
+    conn.exec_driver_sql("ALTER TABLE question_attempts_new RENAME TO question_attempts")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_question_attempts_id ON question_attempts (id)")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_question_attempts_user_created "
+        "ON question_attempts (user_id, created_at)"
+    )
+
+
+def _fold_history_into_attempts(conn: Connection) -> None:
+    """Serve history from question_attempts and retire history_entries.
+
+    Rows the frontend posted right after a graded answer already exist as
+    attempts; only history rows without such a twin are copied over, with no
+    question reference. The old table is kept as ``history_entries_retired``.
+    """
+
+    if not _table_exists(conn, "question_attempts"):
+        return
+    if not _has_column(conn, "question_attempts", "correct_answer"):
+        conn.exec_driver_sql("ALTER TABLE question_attempts ADD COLUMN correct_answer VARCHAR")
+    _make_attempt_question_optional(conn)
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_question_attempts_user_created "
+        "ON question_attempts (user_id, created_at)"
+    )
+    if not _table_exists(conn, "history_entries"):
+        return
+
+    # 已有对应答题记录的历史行：把揭晓的答案补到答题记录上。
+    conn.exec_driver_sql(
+        f"""
+        UPDATE question_attempts
+        SET correct_answer = (
+            SELECT h.correct_answer FROM history_entries h
+            WHERE h.user_id = question_attempts.user_id
+              AND h.question_text = question_attempts.expression_text
+              AND h.user_answer = question_attempts.user_answer
+              AND h.score = question_attempts.score_change
+              AND h.correct_answer IS NOT NULL
+              AND ABS(julianday(h.created_at) - julianday(question_attempts.created_at)) * 86400
+                  <= {HISTORY_MATCH_WINDOW_SECONDS}
+            LIMIT 1
+        )
+        WHERE correct_answer IS NULL
+        """
+    )
+    conn.exec_driver_sql(
+        f"""
+        INSERT INTO question_attempts (
+            question_id, user_id, expression_text, topic, difficulty_level,
+            difficulty_score, user_answer, is_correct, score_change, attempt_index,
+            correct_answer, created_at
+        )
+        SELECT
+            NULL, h.user_id, h.question_text, NULL, NULL,
+            0, h.user_answer, h.score > 0, h.score, 0,
+            h.correct_answer, h.created_at
+        FROM history_entries h
+        WHERE NOT EXISTS (
+            SELECT 1 FROM question_attempts qa
+            WHERE qa.user_id = h.user_id
+              AND qa.expression_text = h.question_text
+              AND qa.user_answer = h.user_answer
+              AND qa.score_change = h.score
+              AND ABS(julianday(h.created_at) - julianday(qa.created_at)) * 86400
+                  <= {HISTORY_MATCH_WINDOW_SECONDS}
+        )
+        """
+    )
+    # 不删除旧表：改名保留，迁移结果有疑问时仍可核对原始记录。
+    conn.exec_driver_sql("ALTER TABLE history_entries RENAME TO history_entries_retired")
+
+
+def _merge_duplicate_users(conn: Connection) -> None:
+    """Merge students created twice by racing first logins, then enforce uniqueness.
+
+    The lowest id survives; scores are summed, every owned row is moved to it
+    and its ``state_version`` is bumped so no worker keeps serving the old state.
+    """
+
+    if not _table_exists(conn, "users"):
+        return
+    conn.exec_driver_sql(
+        """
+        CREATE TEMP TABLE user_merge AS
+        SELECT u.id AS old_id, keep.keep_id AS keep_id
+        FROM users u
+        JOIN (
+            SELECT chinese_name, english_name, class_name, MIN(id) AS keep_id
+            FROM users
+            GROUP BY chinese_name, english_name, class_name
+            HAVING COUNT(*) > 1
+        ) keep
+          ON u.chinese_name = keep.chinese_name
+         AND u.english_name = keep.english_name
+         AND u.class_name = keep.class_name
+        WHERE u.id != keep.keep_id
+        """
+    )
+    conn.exec_driver_sql(
+        """
+        UPDATE users
+        SET total_score = COALESCE(total_score, 0) + (
+            SELECT COALESCE(SUM(old.total_score), 0)
+            FROM users old JOIN user_merge m ON old.id = m.old_id
+            WHERE m.keep_id = users.id
+        )
+        WHERE id IN (SELECT keep_id FROM user_merge)
+        """
+    )
+    if _has_column(conn, "users", "state_version"):
+        conn.exec_driver_sql(
+            "UPDATE users SET state_version = state_version + 1 WHERE id IN (SELECT keep_id FROM user_merge)"
+        )
+    for table in ("questions", "question_attempts", "food_purchases", "archived_records"):
+        if not _table_exists(conn, table):
+            continue
+        conn.exec_driver_sql(
+            f"""
+            UPDATE {table}
+            SET user_id = (SELECT keep_id FROM user_merge WHERE old_id = {table}.user_id)
+            WHERE user_id IN (SELECT old_id FROM user_merge)
+            """
+        )
+    conn.exec_driver_sql("DELETE FROM users WHERE id IN (SELECT old_id FROM user_merge)")
+    conn.exec_driver_sql("DROP TABLE user_merge")
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_users_identity "
+        "ON users (chinese_name, english_name, class_name)"
+    )
+
+
+def _add_user_state_version(conn: Connection) -> None:
+    if _table_exists(conn, "users") and not _has_column(conn, "users", "state_version"):
+        conn.exec_driver_sql("ALTER TABLE users ADD COLUMN state_version INTEGER NOT NULL DEFAULT 0")
+
+
+def _index_user_lookups(conn: Connection) -> None:
+    """Index the per-student reads that scanned whole tables (recent questions, cat score)."""
+
+    if _table_exists(conn, "questions"):
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_questions_user_created ON questions (user_id, created_at)"
+        )
+    if _table_exists(conn, "food_purchases"):
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_food_purchases_user ON food_purchases (user_id)")
+
+
+def _add_question_class_item(conn: Connection) -> None:
+    # class_set_items 表本身由 create_all 创建，这里只给已有的 questions 表补列。
+    if _table_exists(conn, "questions") and not _has_column(conn, "questions", "class_item_id"):
+        conn.exec_driver_sql(
+            "ALTER TABLE questions ADD COLUMN class_item_id INTEGER REFERENCES class_set_items (id)"
+        )
+
+
+def _unique_class_item_questions(conn: Connection) -> None:
+    """One question row per student and shared class item.
+
+    Rows assigned twice by racing requests are detached from the shared item
+    (they keep their attempts as ordinary questions); the first one stays.
+    """
+
+    if not _table_exists(conn, "questions") or not _has_column(conn, "questions", "class_item_id"):
+        return
+    conn.exec_driver_sql(
+        """
+        UPDATE questions
+        SET class_item_id = NULL
+        WHERE class_item_id IS NOT NULL
+          AND rowid NOT IN (
+            SELECT MIN(rowid) FROM questions
+            WHERE class_item_id IS NOT NULL
+            GROUP BY user_id, class_item_id
+          )
+        """
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_questions_user_class_item "
+        "ON questions (user_id, class_item_id) WHERE class_item_id IS NOT NULL"
+    )
+
+
+# 按顺序追加，下标 + 1 即写入 PRAGMA user_version 的版本号；已发布的迁移不要改动顺序。
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    _fold_history_into_attempts,
+    _merge_duplicate_users,
+    _add_user_state_version,
+    _index_user_lookups,
+    _add_question_class_item,
+    _unique_class_item_questions,
+]
+
+
+def run_migrations(target: Engine) -> int:
+    """Apply pending migrations in one transaction; returns the schema version.
+
+    Every uvicorn worker calls this at import, so the transaction takes the
+    write lock up front (``BEGIN IMMEDIATE``) and re-reads ``user_version``
+    once it holds it: workers that lose the race find nothing left to do.
+    """
+
+    if target.dialect.name != "sqlite":
+        return 0
+    # 由我们自己发 BEGIN/COMMIT，驱动不再隐式开启 DEFERRED 事务。
+    with target.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+        if version >= len(MIGRATIONS):
+            return version
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            version = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+            for index in range(version, len(MIGRATIONS)):
+                MIGRATIONS[index](conn)
+                conn.exec_driver_sql(f"PRAGMA user_version = {index + 1}")
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
+        return max(version, len(MIGRATIONS))
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, LargeBinary, String
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -15,6 +15,8 @@ class User(Base):
     english_name = Column(String, nullable=False)
     class_name = Column(String, nullable=False)
     total_score = Column(Integer, default=0)
+    # 每次积分或购买变化时 +1，用于缓存失效判断。
+    state_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -22,6 +24,10 @@ class User(Base):
     attempts = relationship("QuestionAttempt", back_populates="user")
     purchases = relationship("FoodPurchase", back_populates="user")
 
+    __table_args__ = (
+        Index("ux_users_identity", "chinese_name", "english_name", "class_name", unique=True),
+    )
+
 
 class Question(Base):
     __tablename__ = "questions"
@@ -36,30 +42,51 @@ class Question(Base):
     attempts_used = Column(Integer, default=0)
     is_solved = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # 班级共享题目：指向 class_set_items，题面与答案相同，作答记录仍按学生分开。
+    class_item_id = Column(Integer, ForeignKey("class_set_items.id"), nullable=True)
 
     user = relationship("User", back_populates="questions")
     attempts = relationship("QuestionAttempt", back_populates="question")
 
+    __table_args__ = (
+        Index("ix_questions_user_created", "user_id", "created_at"),
+        # 每个学生每道班级共享题只有一行题目。
+        Index(
+            "ux_questions_user_class_item",
+            "user_id",
+            "class_item_id",
+            unique=True,
+            sqlite_where=class_item_id.isnot(None),
+        ),
+    )
+
 
 class QuestionAttempt(Base):
     __tablename__ = "question_attempts"
 
     id = Column(Integer, primary_key=True, index=True)
-    question_id = Column(String, ForeignKey("questions.question_id"), nullable=False)
+    # 单独 POST /api/history、没有对应题目的记录：题目、题型、难度为空。
+    question_id = Column(String, ForeignKey("questions.question_id"), nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     expression_text = Column(String, nullable=False)
-    topic = Column(String, nullable=False)
-    difficulty_level = Column(String, nullable=False)
+    topic = Column(String, nullable=True)
+    difficulty_level = Column(String, nullable=True)
     difficulty_score = Column(Integer, nullable=False)
     user_answer = Column(String, nullable=False)
     is_correct = Column(Boolean, default=False)
     score_change = Column(Integer, default=0)
     attempt_index = Column(Integer, nullable=False)
+    # 三次机会用完时揭晓的答案，供 /api/history 投影使用。
+    correct_answer = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="attempts")
     question = relationship("Question", back_populates="attempts")
 
+    __table_args__ = (
+        Index("ix_question_attempts_user_created", "user_id", "created_at"),
+    )
+
 
 class FoodPurchase(Base):
     __tablename__ = "food_purchases"
@@ -73,14 +100,81 @@ class FoodPurchase(Base):
 
     user = relationship("User", back_populates="purchases")
 
+    __table_args__ = (
+        Index("ix_food_purchases_user", "user_id"),
+    )
+
+
+
+class ClassSetItem(Base):
+    """One question of a class-wide set, generated once per (class, difficulty, seed)."""
+
+    __tablename__ = "class_set_items"
+
+    id = Column(Integer, primary_key=True)
+    class_name = Column(String, nullable=False)
+    difficulty_level = Column(String, nullable=False)
+    seed = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False)
+    topic = Column(String, nullable=False)
+    expression_text = Column(String, nullable=False)
+    expression_latex = Column(String, nullable=False)
+    solution_expression = Column(String, nullable=False)
+    difficulty_score = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ux_class_set_items_slot", "class_name", "difficulty_level", "seed", "position", unique=True),
+    )
+
+
+class ImageJob(Base):
+    """A queued image generation; workers claim rows with ``status = 'queued'``."""
+
+    __tablename__ = "image_jobs"
+
+    id = Column(String, primary_key=True)
+    prompt = Column(String, nullable=False)
+    # queued -> running -> succeeded / failed；失败但还有重试次数时回到 queued。
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    image_url = Column(String, nullable=True)
+    image_key = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_image_jobs_status_available", "status", "available_at"),
+    )
+
 
-class HistoryEntry(Base):
-    __tablename__ = "history_entries"
+class IdempotencyRecord(Base):
+    """The stored response for an ``Idempotency-Key``; ``status_code`` is NULL while the first request runs."""
+
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class ArchivedRecord(Base):
+    """A zlib-compressed JSON batch of rows moved out of the hot tables."""
+
+    __tablename__ = "archived_records"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    question_text = Column(String, nullable=False)
-    user_answer = Column(String, nullable=False)
-    score = Column(Integer, nullable=False)
-    correct_answer = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    kind = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=False, index=True)
+    record_count = Column(Integer, nullable=False)
+    first_created_at = Column(DateTime, nullable=True)
+    last_created_at = Column(DateTime, nullable=True)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,258 @@
+"""WebSocket practice channel: one long-lived session per connected student.
+
+Protocol (JSON text frames)::
+
+    -> {"type": "login", "chinese_name": ..., "english_name": ..., "class_name": ...}
+    <- {"type": "session", "userId", "totalScore", "catScore", "currentCatStage", "nextStageScore"}
+    -> {"type": "next", "topic": "add_sub", "difficultyLevel": "basic"}
+    <- {"type": "question", ...GenerateQuestionResponse}
+    -> {"type": "answer", "userAnswer": "2x+4"}
+    <- {"type": "result", ...CheckAnswerResponse}
+    <- {"type": "question", ...}          # 答对或三次机会用完后自动推送下一题
+                                           # 下一题生成失败时 result 带 "nextQuestion": null，
+                                           # 随后是一条 error，客户端再发 next
+    -> {"type": "buy", "foodId": "fish"}
+    <- {"type": "purchase", "newTotalScore", "catScore", "currentCatStage", "nextStageScore", "stageChanged"}
+    <- {"type": "error", "detail": "..."}  # 连接保持打开；被限流时另带 "retryAfter"（秒）
+                                           # 服务端异常时发送后以 1011 关闭
+
+The student, their score, cat score and current question are loaded once and
+kept on the connection, so an answer costs the grading queries only. Each
+message gets its own database session, so an idle connection holds no
+connection from the pool. Both this
+channel and the ``/api/practice/*`` routes hand out questions through
+:func:`issue_question`, which takes the question prefetched while the student
+was thinking and schedules the one after it.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Callable, ContextManager
+
+from fastapi import WebSocket, WebSocketDisconnect, status
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .foods import FOOD_MAP
+from .models import Question
+from .prefetch import get_question_prefetcher
+from .rate_limit import LIMITED_DETAIL, get_rate_limiter
+from .schemas import (
+    CheckAnswerResponse,
+    GenerateQuestionResponse,
+    LoginRequest,
+    PracticeAnswerMessage,
+    PracticeBuyMessage,
+    PracticeNextMessage,
+)
+from .services import (
+    MAX_ATTEMPTS_PER_QUESTION,
+    AnswerResult,
+    get_cat_score,
+    get_cat_stage,
+    login_user,
+    next_stage_threshold,
+    process_answer,
+    purchase_food,
+    save_generated_question,
+)
+from .user_cache import CachedUser
+
+logger = logging.getLogger(__name__)
+
+Message = dict[str, Any]
+SessionScope = Callable[[], ContextManager[Session]]
+SERVER_ERROR_DETAIL = "服务器内部错误"
+NEXT_QUESTION_FAILED_DETAIL = "下一题生成失败，请重新获取题目"
+# 与 HTTP 接口共用限流额度：出题算 generate，判题算 check。
+RATE_LIMIT_SCOPES = {"next": "generate", "answer": "check"}
+
+
+class QuestionGenerationError(RuntimeError):
+    """No question could be generated for the requested topic and difficulty; nothing was written."""
+
+
+def issue_question(
+    db: Session, user_id: int, topic: str, difficulty_level: str, *, commit: bool = True
+) -> tuple[Question, GenerateQuestionResponse]:
+    """Persist the student's next question (prefetched when possible) and prefetch the one after."""
+
+    prefetcher = get_question_prefetcher()
+    try:
+        generated = prefetcher.take(user_id, topic, difficulty_level)
+    except Exception as exc:
+        raise QuestionGenerationError(str(exc)) from exc
+    question = save_generated_question(db, user_id, generated, commit=commit)
+    prefetcher.schedule(user_id, topic, difficulty_level)
+    return question, question_response(question, generated.expression_latex)
+
+
+def question_response(question: Question, expression_latex: str) -> GenerateQuestionResponse:
+    return GenerateQuestionResponse(
+        questionId=question.question_id,
+        topic=question.topic,
+        difficultyLevel=question.difficulty_level,
+        expressionText=question.expression_text,
+        expressionLatex=expression_latex,
+        difficultyScore=question.difficulty_score,
+    )
+
+
+def is_finished(result: AnswerResult) -> bool:
+    return result.is_correct or result.attempt_count >= MAX_ATTEMPTS_PER_QUESTION
+
+
+class PracticeSession:
+    """Server-side state for one connection; every method runs in the threadpool."""
+
+    def __init__(self, user: CachedUser, cat_score: int) -> None:
+        self.user = user
+        self.total_score = user.total_score
+        self.cat_score = cat_score
+        self.topic: str | None = None
+        self.difficulty_level: str | None = None
+        self.question: Question | None = None
+
+    @classmethod
+    def open(cls, db: Session, payload: LoginRequest) -> PracticeSession:
+        user = CachedUser(*login_user(db, payload))
+        cat_score = get_cat_score(db, user.id)
+        db.rollback()
+        return cls(user, cat_score)
+
+    def _stage_fields(self) -> Message:
+        return {
+            "catScore": self.cat_score,
+            "currentCatStage": get_cat_stage(self.cat_score),
+            "nextStageScore": next_stage_threshold(self.cat_score),
+        }
+
+    def snapshot(self) -> Message:
+        return {"type": "session", "userId": self.user.id, "totalScore": self.total_score, **self._stage_fields()}
+
+    def next_question(self, db: Session, message: Message) -> list[Message]:
+        request = PracticeNextMessage.model_validate(message)
+        self.topic, self.difficulty_level = request.topic, request.difficulty_level
+        return [self._new_question(db)]
+
+    def _new_question(self, db: Session) -> Message:
+        self.question, body = issue_question(db, self.user.id, self.topic, self.difficulty_level)
+        return {"type": "question", **body.model_dump(by_alias=True)}
+
+    def answer(self, db: Session, message: Message) -> list[Message]:
+        request = PracticeAnswerMessage.model_validate(message)
+        if self.question is None:
+            raise ValueError("请先获取题目")
+        # 题目来自上一条消息的 Session：挂到本次 Session 上但不重新查询。
+        self.question = db.merge(self.question, load=False)
+        try:
+            result = process_answer(db, self.question, self.user, request.user_answer)
+        except ValueError:
+            db.rollback()
+            raise
+        self.total_score = result.new_total_score
+        body = CheckAnswerResponse(
+            isCorrect=result.is_correct,
+            difficultyScore=result.difficulty_score,
+            scoreChange=result.score_change,
+            newTotalScore=result.new_total_score,
+            attemptCount=result.attempt_count,
+            solutionExpression=result.solution_expression,
+        )
+        replies = [{"type": "result", **body.model_dump(by_alias=True)}]
+        if is_finished(result):
+            try:
+                replies.append(self._new_question(db))
+            except Exception:
+                # 评分已提交：与 /api/practice/answer 一样，出下一题失败不能让学生丢掉这次结果。
+                db.rollback()
+                logger.exception("issuing the next practice question failed")
+                replies[0]["nextQuestion"] = None
+                replies.append({"type": "error", "detail": NEXT_QUESTION_FAILED_DETAIL})
+        return replies
+
+    def buy(self, db: Session, message: Message) -> list[Message]:
+        request = PracticeBuyMessage.model_validate(message)
+        food = FOOD_MAP.get(request.food_id)
+        if food is None:
+            raise ValueError("未找到该食物")
+        self.total_score = purchase_food(db, self.user.id, food)
+        previous_stage = get_cat_stage(self.cat_score)
+        self.cat_score += food.price
+        return [
+            {
+                "type": "purchase",
+                "newTotalScore": self.total_score,
+                **self._stage_fields(),
+                "stageChanged": get_cat_stage(self.cat_score) != previous_stage,
+            }
+        ]
+
+
+def _in_session(session_scope: SessionScope, handler: Callable[..., Any], *args: Any) -> Any:
+    """Run ``handler(db, *args)`` in a Session opened and closed for this one message."""
+
+    with session_scope() as db:
+        # 提交后不让题目对象过期：下一条消息判题时不必再查一次题目。
+        # 作答次数仍由 _claim_attempt 的条件 UPDATE 保证，不依赖缓存的计数。
+        db.expire_on_commit = False
+        return handler(db, *args)
+
+
+async def run_practice_socket(websocket: WebSocket, session_scope: SessionScope) -> None:
+    await websocket.accept()
+    try:
+        await _serve(websocket, session_scope)
+    except WebSocketDisconnect:
+        return
+    except Exception:
+        logger.exception("practice socket failed")
+        # 连接可能已经断开，发送失败也要继续关闭。
+        try:
+            await websocket.send_json({"type": "error", "detail": SERVER_ERROR_DETAIL})
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        except Exception:
+            pass
+
+
+async def _serve(websocket: WebSocket, session_scope: SessionScope) -> None:
+    try:
+        hello = json.loads(await websocket.receive_text())
+        if not isinstance(hello, dict) or hello.get("type") != "login":
+            raise ValueError("第一条消息必须是 login")
+        payload = LoginRequest.model_validate(hello)
+        session = await run_in_threadpool(_in_session, session_scope, PracticeSession.open, payload)
+    except ValueError as exc:
+        await websocket.send_json({"type": "error", "detail": str(exc)})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.send_json(session.snapshot())
+
+    handlers = {"next": session.next_question, "answer": session.answer, "buy": session.buy}
+    limiter = get_rate_limiter()
+    ip = websocket.client.host if websocket.client else None
+    while True:
+        try:
+            message = json.loads(await websocket.receive_text())
+        except ValueError:
+            message = None
+        handler = handlers.get(message.get("type")) if isinstance(message, dict) else None
+        if handler is None:
+            await websocket.send_json({"type": "error", "detail": "未知的消息类型"})
+            continue
+        scope = RATE_LIMIT_SCOPES.get(message["type"])
+        if limiter is not None and scope is not None:
+            decision = await run_in_threadpool(limiter.acquire, scope, user_id=session.user.id, ip=ip)
+            if not decision.allowed:
+                await websocket.send_json(
+                    {"type": "error", "detail": LIMITED_DETAIL, "retryAfter": int(decision.retry_after_header)}
+                )
+                continue
+        try:
+            replies = await run_in_threadpool(_in_session, session_scope, handler, message)
+        except (ValueError, QuestionGenerationError) as exc:
+            await websocket.send_json({"type": "error", "detail": str(exc)})
+            continue
+        for reply in replies:
+            await websocket.send_json(reply)
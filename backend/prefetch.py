@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+
+from .config import get_settings
+from .metrics import time_component
+from .question_generator import GeneratedQuestion, generate_question
+
+PrefetchKey = tuple[int, str, str]
+
+
+def _generate(topic: str, difficulty_level: str) -> GeneratedQuestion:
+    with time_component("sympy_generate"):
+        return generate_question(topic, difficulty_level)  # type: ignore[arg-type]
+
+
+class QuestionPrefetcher:
+    """Speculatively generate each student's next question while they think.
+
+    At most one question is prepared per (user, topic, difficulty). Prepared
+    questions are not persisted until :meth:`take` hands them out, so an
+    abandoned prefetch costs CPU only. Entries live in this process; a request
+    routed to another worker simply generates inline.
+    """
+
+    def __init__(self, workers: int = 2, max_entries: int = 1000, ttl: float = 600.0) -> None:
+        self._executor = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="question-prefetch") if workers > 0 else None
+        )
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._pending: OrderedDict[PrefetchKey, tuple[float, Future[GeneratedQuestion]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def schedule(self, user_id: int, topic: str, difficulty_level: str) -> None:
+        if self._executor is None:
+            return
+        key = (user_id, topic, difficulty_level)
+        with self._lock:
+            if self._closed:
+                # 关闭后仍在处理的请求不再预取，take() 会当场生成。
+                return
+            entry = self._pending.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self._ttl:
+                return
+            self._pending[key] = (time.monotonic(), self._executor.submit(_generate, topic, difficulty_level))
+            self._pending.move_to_end(key)
+            while len(self._pending) > self._max_entries:
+                _, (_, dropped) = self._pending.popitem(last=False)
+                dropped.cancel()
+                self.evictions += 1
+
+    def take(self, user_id: int, topic: str, difficulty_level: str) -> GeneratedQuestion:
+        """The prefetched question if there is one (waiting for it if still running), else a fresh one."""
+
+        with self._lock:
+            entry = self._pending.pop((user_id, topic, difficulty_level), None)
+        if entry is not None and time.monotonic() - entry[0] <= self._ttl:
+            try:
+                question = entry[1].result()
+            except Exception:
+                # 后台生成失败或被取消：当场重新生成，错误由同步路径报告。
+                pass
+            else:
+                self.hits += 1
+                return question
+        self.misses += 1
+        return _generate(topic, difficulty_level)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "pending": len(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache
+def get_question_prefetcher() -> QuestionPrefetcher:
+    settings = get_settings()
+    return QuestionPrefetcher(
+        workers=settings.practice_prefetch_workers,
+        max_entries=settings.practice_prefetch_max_entries,
+        ttl=settings.practice_prefetch_ttl_seconds,
+    )
@@ -0,0 +1,130 @@
+"""Opt-in sampling profiler for single requests.
+
+Only installed when ``PROFILE_SECRET`` is configured. A request carrying
+``X-Profile: <secret>`` is sampled every ``profile_interval_ms`` while it runs;
+the folded stacks (``flamegraph.pl`` / speedscope "collapsed" format) are written
+to ``profile_dir`` and named in the ``X-Profile-Id`` response header.
+"""
+from __future__ import annotations
+
+import hmac
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_SUFFIX = ".collapsed"
+# 叶子帧落在这些模块里的线程处于空闲等待（线程池取任务、事件循环 select），不计入样本。
+_IDLE_MODULES = ("threading.py", "queue.py", "selectors.py")
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def secret_matches(provided: str | None, secret: str | None) -> bool:
+    if not secret or not provided:
+        return False
+    return hmac.compare_digest(provided.encode(), secret.encode())
+
+
+class StackSampler:
+    """Background thread folding the stacks of every busy thread.
+
+    Sync endpoints run on threadpool workers rather than the event loop, so
+    all threads are sampled; concurrent requests on the same worker process
+    also appear in the output.
+    """
+
+    def __init__(self, interval: float = 0.001) -> None:
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def __enter__(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident or frame.f_code.co_filename.endswith(_IDLE_MODULES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def profile_path(output_dir: str | Path, profile_id: str) -> Path | None:
+    """Resolve a downloadable profile by id; ``None`` for unknown or unsafe ids."""
+
+    if _UNSAFE_NAME.search(profile_id):
+        return None
+    path = Path(output_dir) / f"{profile_id}{PROFILE_SUFFIX}"
+    return path if path.is_file() else None
+
+
+def list_profiles(output_dir: str | Path) -> list[str]:
+    directory = Path(output_dir)
+    if not directory.is_dir():
+        return []
+    files = sorted(directory.glob(f"*{PROFILE_SUFFIX}"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return [path.name[: -len(PROFILE_SUFFIX)] for path in files]
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware profiling requests that present the configured secret."""
+
+    def __init__(self, app: ASGIApp, secret: str, output_dir: str | Path, interval_ms: float = 1.0) -> None:
+        self.app = app
+        self.secret = secret
+        self.output_dir = Path(output_dir)
+        self.interval = interval_ms / 1000
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        provided = next((value for key, value in scope["headers"] if key == PROFILE_HEADER), None)
+        if provided is None or not secret_matches(provided.decode("latin-1"), self.secret):
+            await self.app(scope, receive, send)
+            return
+
+        route = _UNSAFE_NAME.sub("_", scope["path"]).strip("_") or "root"
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{route}-{uuid.uuid4().hex[:8]}"
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sampler: StackSampler | None = None
+        try:
+            with StackSampler(self.interval) as sampler:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            # 出错的请求同样保存，慢且失败的请求往往最需要分析；采样线程没能启动时没有可保存的内容。
+            if sampler is not None:
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                (self.output_dir / f"{profile_id}{PROFILE_SUFFIX}").write_text(
+                    sampler.collapsed(), encoding="utf-8"
+                )
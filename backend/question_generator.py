@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 import random
+import threading
 import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass
 from collections import Counter
-from typing import Literal, Sequence
+from typing import Iterator, Literal, Sequence
 
 import sympy as sp
 
+from .tracing import span
+
 # 允许在题目中出现的未知数集合，后面会根据难度选择其中 1~3 个。
 VARIABLE_NAMES: tuple[str, ...] = ("x", "y", "z")
 VARIABLE_SYMBOLS: dict[str, sp.Symbol] = {name: sp.Symbol(name) for name in VARIABLE_NAMES}
@@ -32,6 +36,28 @@ ADD_SUB_RELAX_POINTS = (80, 120)
 ADD_SUB_RELAX_POINT_SET = set(ADD_SUB_RELAX_POINTS)
 MAX_GENERATION_ATTEMPTS = 1000
 
+_local = threading.local()
+
+
+def _rng():
+    # seeded() 期间当前线程使用独立的随机数生成器，其余时候就是全局 random。
+    return getattr(_local, "rng", random)
+
+
+@contextmanager
+def seeded(seed: int | str) -> Iterator[None]:
+    """Make generation on this thread reproducible for ``seed`` without touching the global RNG."""
+
+    previous = getattr(_local, "rng", None)
+    _local.rng = random.Random(seed)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _local.rng
+        else:
+            _local.rng = previous
+
 
 @dataclass
 class GeneratedQuestion:
@@ -119,10 +145,10 @@ def random_polynomial(
         var_list = [x]
 
     for _ in range(MAX_POLYNOMIAL_ATTEMPTS):
-        term_count = random.randint(max(2, min_terms), max(4, min_terms))
+        term_count = _rng().randint(max(2, min_terms), max(4, min_terms))
         expr = sp.Integer(0)
         for _ in range(term_count):
-            coeff = random.randint(coeff_min, coeff_max)
+            coeff = _rng().randint(coeff_min, coeff_max)
             if coeff == 0:
                 continue
             monomial = sp.Integer(1)
@@ -132,13 +158,13 @@ def random_polynomial(
                 if total_degree >= max_total_degree:
                     power = 0
                 else:
-                    power = random.randint(0, max_total_degree - total_degree)
+                    power = _rng().randint(0, max_total_degree - total_degree)
                 if power > 0:
                     monomial *= symbol**power
                     total_degree += power
             if total_degree == 0:
                 # 避免所有指数都为 0 导致纯常数项
-                symbol = random.choice(var_list)
+                symbol = _rng().choice(var_list)
                 monomial = symbol
             expr += coeff * monomial
         if expr == 0:
@@ -203,7 +229,7 @@ def build_add_sub_expression(
                 min_degree = 1
             else:
                 min_degree = max(1, min_degree - 1)
-        group_count = random.randint(*config["group_range"])
+        group_count = _rng().randint(*config["group_range"])
         segments: list[str] = []
         latex_segments: list[str] = []
         total_expr = sp.Integer(0)
@@ -213,7 +239,7 @@ def build_add_sub_expression(
         for index in range(group_count):
             coeff_min, coeff_max = config["coeff_range"]
             for _ in range(8):
-                max_degree = random.choice(config["degree_choices"])
+                max_degree = _rng().choice(config["degree_choices"])
                 poly = random_polynomial(
                     variables,
                     max_degree,
@@ -222,16 +248,16 @@ def build_add_sub_expression(
                     min_terms=2,
                 )
                 # 高级难度中偶尔插入一次高次项，制造平方/立方的感觉。
-                if difficulty_level != "basic" and random.random() < 0.4:
-                    var = random.choice(var_list)
-                    high_power = random.randint(2, 3 if difficulty_level == "intermediate" else 4)
-                    booster = random.randint(1, 3) * var**high_power
+                if difficulty_level != "basic" and _rng().random() < 0.4:
+                    var = _rng().choice(var_list)
+                    high_power = _rng().randint(2, 3 if difficulty_level == "intermediate" else 4)
+                    booster = _rng().randint(1, 3) * var**high_power
                     poly += booster
 
                 # 强制制造可合并项：从之前的单项式中挑一些加入当前括号。
-                if shared_terms and random.random() < 0.8:
-                    term = random.choice(shared_terms)
-                    coeff = random.randint(-4, 4) or 1
+                if shared_terms and _rng().random() < 0.8:
+                    term = _rng().choice(shared_terms)
+                    coeff = _rng().randint(-4, 4) or 1
                     poly += coeff * term
 
                 poly = sp.expand(poly)
@@ -246,7 +272,7 @@ def build_add_sub_expression(
                 prefix = ""
                 latex_prefix = ""
             else:
-                sign = random.choice([1, -1])
+                sign = _rng().choice([1, -1])
                 prefix = " + " if sign == 1 else " - "
                 latex_prefix = " + " if sign == 1 else " - "
 
@@ -270,7 +296,7 @@ def build_add_sub_expression(
                 current_terms.append(term_expr)
 
             if current_terms:
-                sample = random.sample(current_terms, k=min(len(current_terms), 2))
+                sample = _rng().sample(current_terms, k=min(len(current_terms), 2))
                 shared_terms.extend(sample)
                 if len(shared_terms) > 12:
                     shared_terms = shared_terms[-12:]
@@ -308,11 +334,11 @@ def build_mul_div_expression(
     variables: Sequence[sp.Symbol],
 ) -> tuple[str, str, sp.Expr]:
     # 乘除题包含三种结构，全部保证结果仍旧是整式，便于比对。
-    pattern = random.choice(["binomial_product", "monomial_product", "polynomial_division"])
+    pattern = _rng().choice(["binomial_product", "monomial_product", "polynomial_division"])
     if pattern == "binomial_product":
-        var = random.choice(list(variables))
-        a1, b1 = random.randint(-5, 5), random.randint(-5, 5)
-        a2, b2 = random.randint(-5, 5), random.randint(-5, 5)
+        var = _rng().choice(list(variables))
+        a1, b1 = _rng().randint(-5, 5), _rng().randint(-5, 5)
+        a2, b2 = _rng().randint(-5, 5), _rng().randint(-5, 5)
         a1 = a1 or 1
         a2 = a2 or -1
         expr1 = a1 * var + b1
@@ -321,19 +347,19 @@ def build_mul_div_expression(
         latex_display = f"\\left({sp.latex(expr1)}\\right)\\left({sp.latex(expr2)}\\right)"
         return display, latex_display, sp.expand(expr1 * expr2)
     if pattern == "monomial_product":
-        var = random.choice(list(variables))
-        coeff = random.randint(2, 6)
-        power = random.randint(1, 3)
+        var = _rng().choice(list(variables))
+        coeff = _rng().randint(2, 6)
+        power = _rng().randint(1, 3)
         mono = coeff * var**power
-        poly = random_polynomial(variables, random.choice([2, 3]))
+        poly = random_polynomial(variables, _rng().choice([2, 3]))
         display = f"({humanize_expression(mono, variables)})({humanize_expression(poly, variables)})"
         latex_display = f"\\left({sp.latex(mono)}\\right)\\left({sp.latex(poly)}\\right)"
         return display, latex_display, sp.expand(mono * poly)
     # polynomial_division
     # 为了保持可约性，这里仍然只在一个变量上构造除法结构。
-    var = random.choice(list(variables))
+    var = _rng().choice(list(variables))
     divisor = random_polynomial((var,), 1)
-    quotient = random_polynomial((var,), random.choice([1, 2]))
+    quotient = random_polynomial((var,), _rng().choice([1, 2]))
     dividend = sp.expand(divisor * quotient)
     display = f"({humanize_expression(dividend, (var,))}) / ({humanize_expression(divisor, (var,))})"
     latex_display = f"\\frac{{{sp.latex(dividend)}}}{{{sp.latex(divisor)}}}"
@@ -362,64 +388,64 @@ def build_factorization_expression(
             "quadratic_times_linear",
             "multi_var_quadratic",
         ]
-    pattern = random.choice(patterns)
+    pattern = _rng().choice(patterns)
 
     if pattern == "square":
-        var = random.choice(list(variables))
-        a = random.randint(1, 4)
-        b = random.randint(-6, 6)
+        var = _rng().choice(list(variables))
+        a = _rng().randint(1, 4)
+        b = _rng().randint(-6, 6)
         expr = sp.expand((a * var + b) ** 2)
         return humanize_expression(expr, variables), sp.latex(expr), expr
     if pattern == "quadratic":
-        var = random.choice(list(variables))
-        p = random.randint(1, 4)
-        q = random.randint(1, 4)
-        m = random.randint(-6, 6)
-        n = random.randint(-6, 6)
+        var = _rng().choice(list(variables))
+        p = _rng().randint(1, 4)
+        q = _rng().randint(1, 4)
+        m = _rng().randint(-6, 6)
+        n = _rng().randint(-6, 6)
         expr = sp.expand((p * var + m) * (q * var + n))
         return humanize_expression(expr, variables), sp.latex(expr), expr
     if pattern == "diff_square":
-        var1 = random.choice(list(variables))
+        var1 = _rng().choice(list(variables))
         # 平方差可以是单变量也可以是多变量，例如 (ax)^2 - (by)^2
-        if len(variables) >= 2 and random.random() < 0.5:
-            var2 = random.choice([s for s in variables if s is not var1])
+        if len(variables) >= 2 and _rng().random() < 0.5:
+            var2 = _rng().choice([s for s in variables if s is not var1])
         else:
             var2 = var1
         # 避免 (ax)^2 与 (bx)^2 完全相同导致表达式恒为 0。
         while True:
-            a = random.randint(2, 6)
-            b = random.randint(1, 5)
+            a = _rng().randint(2, 6)
+            b = _rng().randint(1, 5)
             if not (var1 is var2 and a == b):
                 break
         expr = (a * var1) ** 2 - (b * var2) ** 2
         return humanize_expression(expr, variables), sp.latex(expr), expr
     if pattern == "quadratic_times_linear":
         # 形如 (ax^2 + bx + c)(dx + e)，体现“配方法 / 双十字相乘”的综合难度。
-        var = random.choice(list(variables))
-        a = random.randint(1, 3)
-        b = random.randint(-5, 5)
-        c = random.randint(-5, 5)
-        d = random.randint(1, 3)
-        e = random.randint(-5, 5)
+        var = _rng().choice(list(variables))
+        a = _rng().randint(1, 3)
+        b = _rng().randint(-5, 5)
+        c = _rng().randint(-5, 5)
+        d = _rng().randint(1, 3)
+        e = _rng().randint(-5, 5)
         expr = sp.expand((a * var**2 + b * var + c) * (d * var + e))
         return humanize_expression(expr, variables), sp.latex(expr), expr
     if pattern == "multi_var_quadratic" and len(variables) >= 2:
         # 形如 (ax + by + c)(dx + ey + f)，需要对多元二次式分解。
-        v1, v2 = random.sample(list(variables), 2)
-        a1 = random.randint(1, 4)
-        b1 = random.randint(1, 4)
-        a2 = random.randint(1, 4)
-        b2 = random.randint(1, 4)
-        c1 = random.randint(-5, 5)
-        c2 = random.randint(-5, 5)
+        v1, v2 = _rng().sample(list(variables), 2)
+        a1 = _rng().randint(1, 4)
+        b1 = _rng().randint(1, 4)
+        a2 = _rng().randint(1, 4)
+        b2 = _rng().randint(1, 4)
+        c1 = _rng().randint(-5, 5)
+        c2 = _rng().randint(-5, 5)
         expr = sp.expand((a1 * v1 + b1 * v2 + c1) * (a2 * v1 + b2 * v2 + c2))
         return humanize_expression(expr, variables), sp.latex(expr), expr
     # grouping：按分组提取公因式的思路构造。
-    var = random.choice(list(variables))
-    a = random.randint(1, 5)
-    b = random.randint(1, 5)
-    c = random.randint(-6, 6)
-    d = random.randint(-6, 6)
+    var = _rng().choice(list(variables))
+    a = _rng().randint(1, 5)
+    b = _rng().randint(1, 5)
+    c = _rng().randint(-6, 6)
+    d = _rng().randint(-6, 6)
     expr = sp.expand((a * var + c) * var + (b * var + d) * var)
     return humanize_expression(expr, variables), sp.latex(expr), expr
 
@@ -431,7 +457,7 @@ def build_mixed_ops_expression(variables: Sequence[sp.Symbol]) -> tuple[str, str
         patterns = ["add_mul", "div_add"]
     else:
         patterns = ["add_mul", "div_add", "multi_div_add"]
-    pattern = random.choice(patterns)
+    pattern = _rng().choice(patterns)
 
     text_segments: list[str] = []
     latex_segments: list[str] = []
@@ -439,14 +465,14 @@ def build_mixed_ops_expression(variables: Sequence[sp.Symbol]) -> tuple[str, str
 
     if pattern == "add_mul":
         # 模式 A: 加减与乘法混合，如 P1 +/- M * P2 +/- P3
-        p1 = random_polynomial(variables, random.choice([1, 2]))
-        m_coeff = random.choice([2, 3, 4])
-        m_var = random.choice(list(variables))
+        p1 = random_polynomial(variables, _rng().choice([1, 2]))
+        m_coeff = _rng().choice([2, 3, 4])
+        m_var = _rng().choice(list(variables))
         m = m_coeff * m_var
-        p2 = random_polynomial(variables, random.choice([1, 2]))
+        p2 = random_polynomial(variables, _rng().choice([1, 2]))
         p3 = random_polynomial(variables, 1)
 
-        signs = [1, random.choice([1, -1]), random.choice([1, -1])]
+        signs = [1, _rng().choice([1, -1]), _rng().choice([1, -1])]
         parts = [p1, signs[1] * m * p2, signs[2] * p3]
 
         for i, part in enumerate(parts):
@@ -465,11 +491,11 @@ def build_mixed_ops_expression(variables: Sequence[sp.Symbol]) -> tuple[str, str
 
     elif pattern == "div_add":
         # 模式 B: 可约除法 + 加减乘
-        var = random.choice(list(variables))
+        var = _rng().choice(list(variables))
         divisor = random_polynomial((var,), 1)
         if divisor == 0:
             return build_mixed_ops_expression(variables)  # retry
-        quotient = random_polynomial((var,), random.choice([1, 2]))
+        quotient = random_polynomial((var,), _rng().choice([1, 2]))
         dividend = sp.expand(divisor * quotient)
 
         div_text = f"({humanize_expression(dividend, variables)}) / ({humanize_expression(divisor, variables)})"
@@ -478,17 +504,17 @@ def build_mixed_ops_expression(variables: Sequence[sp.Symbol]) -> tuple[str, str
         latex_segments.append(div_latex)
 
         p1 = random_polynomial(variables, 1)
-        sign1 = random.choice([1, -1])
+        sign1 = _rng().choice([1, -1])
         prefix1 = " + " if sign1 > 0 else " - "
         latex_prefix1 = " + " if sign1 > 0 else " - "
         text_segments.append(f"{prefix1}{humanize_expression(p1, variables)}")
         latex_segments.append(f"{latex_prefix1}{sp.latex(p1)}")
 
-        m_coeff = random.choice([2, 3])
-        m_var = random.choice(list(variables))
+        m_coeff = _rng().choice([2, 3])
+        m_var = _rng().choice(list(variables))
         m = m_coeff * m_var
         p2 = random_polynomial(variables, 1)
-        sign2 = random.choice([1, -1])
+        sign2 = _rng().choice([1, -1])
         prefix2 = " + " if sign2 > 0 else " - "
         latex_prefix2 = " + " if sign2 > 0 else " - "
         text_segments.append(f"{prefix2}{humanize_expression(m, variables)}({humanize_expression(p2, variables)})")
@@ -498,7 +524,7 @@ def build_mixed_ops_expression(variables: Sequence[sp.Symbol]) -> tuple[str, str
 
     elif pattern == "multi_div_add":
         # 模式 C: 多个可约除 + 加减，多元
-        var1 = random.choice(list(variables))
+        var1 = _rng().choice(list(variables))
         divisor1 = random_polynomial((var1,), 1)
         if divisor1 == 0:
             return build_mixed_ops_expression(variables)
@@ -510,14 +536,14 @@ def build_mixed_ops_expression(variables: Sequence[sp.Symbol]) -> tuple[str, str
         text_segments.append(div1_text)
         latex_segments.append(div1_latex)
 
-        var2 = random.choice([v for v in variables if v != var1]) if len(variables) > 1 else var1
+        var2 = _rng().choice([v for v in variables if v != var1]) if len(variables) > 1 else var1
         divisor2 = random_polynomial((var2,), 1)
         if divisor2 == 0:
             return build_mixed_ops_expression(variables)
         quotient2 = random_polynomial(variables, 1)
         dividend2 = sp.expand(divisor2 * quotient2)
 
-        sign_div2 = random.choice([1, -1])
+        sign_div2 = _rng().choice([1, -1])
         prefix_div2 = " + " if sign_div2 > 0 else " - "
         latex_prefix_div2 = " + " if sign_div2 > 0 else " - "
         div2_text = f"({humanize_expression(dividend2, variables)}) / ({humanize_expression(divisor2, variables)})"
@@ -526,7 +552,7 @@ def build_mixed_ops_expression(variables: Sequence[sp.Symbol]) -> tuple[str, str
         latex_segments.append(f"{latex_prefix_div2}{div2_latex}")
 
         p3 = random_polynomial(variables, 1)
-        sign_p3 = random.choice([1, -1])
+        sign_p3 = _rng().choice([1, -1])
         prefix_p3 = " + " if sign_p3 > 0 else " - "
         latex_prefix_p3 = " + " if sign_p3 > 0 else " - "
         text_segments.append(f"{prefix_p3}{humanize_expression(p3, variables)}")
@@ -582,30 +608,30 @@ def build_poly_ops_expression(
     patterns = ["frac_mul", "double_mul", "nested_mix"]
     if difficulty_level != "basic":
         patterns.append("fraction_double")
-    pattern = random.choice(patterns)
+    pattern = _rng().choice(patterns)
 
     if pattern == "frac_mul":
-        var = random.choice(var_choices)
+        var = _rng().choice(var_choices)
         divisor = random_polynomial((var,), 1, min_terms=1)
         if divisor == 0:
             divisor = var
-        quotient = random_polynomial((var,), random.choice([1, 2]), min_terms=1)
+        quotient = random_polynomial((var,), _rng().choice([1, 2]), min_terms=1)
         dividend = sp.expand(divisor * quotient)
         frac = sp.simplify(dividend / divisor)
         frac_text = f"({humanize_expression(dividend, variables)}) / ({humanize_expression(divisor, variables)})"
         frac_latex = f"\\frac{{{sp.latex(dividend)}}}{{{sp.latex(divisor)}}}"
-        _append(frac, frac_text, frac_latex, random.choice([1, -1]))
+        _append(frac, frac_text, frac_latex, _rng().choice([1, -1]))
 
-        mono = random.randint(2, 4) * random.choice(var_choices)
+        mono = _rng().randint(2, 4) * _rng().choice(var_choices)
         mul_poly = _poly(2)
         mul_expr = sp.expand(mono * mul_poly)
         mul_text = f"({humanize_expression(mono, variables)})({humanize_expression(mul_poly, variables)})"
         mul_latex = f"\\left({sp.latex(mono)}\\right)\\left({sp.latex(mul_poly)}\\right)"
-        _append(mul_expr, mul_text, mul_latex, random.choice([1, -1]))
+        _append(mul_expr, mul_text, mul_latex, _rng().choice([1, -1]))
 
     elif pattern == "double_mul":
-        mono1 = random.randint(2, 5) * random.choice(var_choices)
-        mono2 = random.randint(2, 4) * random.choice(var_choices)
+        mono1 = _rng().randint(2, 5) * _rng().choice(var_choices)
+        mono2 = _rng().randint(2, 4) * _rng().choice(var_choices)
         poly1 = _poly(2)
         poly2 = _poly(1)
         term1 = sp.expand(mono1 * poly1)
@@ -614,8 +640,8 @@ def build_poly_ops_expression(
         text2 = f"({humanize_expression(mono2, variables)})({humanize_expression(poly2, variables)})"
         latex1 = f"\\left({sp.latex(mono1)}\\right)\\left({sp.latex(poly1)}\\right)"
         latex2 = f"\\left({sp.latex(mono2)}\\right)\\left({sp.latex(poly2)}\\right)"
-        _append(term1, text1, latex1, random.choice([1, -1]))
-        _append(term2, text2, latex2, random.choice([1, -1]))
+        _append(term1, text1, latex1, _rng().choice([1, -1]))
+        _append(term2, text2, latex2, _rng().choice([1, -1]))
 
     elif pattern == "nested_mix":
         inner = _poly(1)
@@ -623,36 +649,36 @@ def build_poly_ops_expression(
         combined = sp.expand(inner + outer)
         combo_text = f"(({humanize_expression(inner, variables)}) + ({humanize_expression(outer, variables)}))"
         combo_latex = f"\\left(\\left({sp.latex(inner)}\\right)+\\left({sp.latex(outer)}\\right)\\right)"
-        _append(combined, combo_text, combo_latex, random.choice([1, -1]))
+        _append(combined, combo_text, combo_latex, _rng().choice([1, -1]))
 
-        mono = random.randint(2, 4) * random.choice(var_choices)
+        mono = _rng().randint(2, 4) * _rng().choice(var_choices)
         bonus = _poly(2)
         bonus_expr = sp.expand(mono * bonus)
         bonus_text = f"({humanize_expression(mono, variables)})({humanize_expression(bonus, variables)})"
         bonus_latex = f"\\left({sp.latex(mono)}\\right)\\left({sp.latex(bonus)}\\right)"
-        _append(bonus_expr, bonus_text, bonus_latex, random.choice([1, -1]))
+        _append(bonus_expr, bonus_text, bonus_latex, _rng().choice([1, -1]))
 
     else:  # fraction_double
-        var1 = random.choice(var_choices)
+        var1 = _rng().choice(var_choices)
         divisor1 = random_polynomial((var1,), 1, min_terms=1) or var1
-        quotient1 = random_polynomial((var1,), random.choice([1, 2]), min_terms=1)
+        quotient1 = random_polynomial((var1,), _rng().choice([1, 2]), min_terms=1)
         dividend1 = sp.expand(divisor1 * quotient1)
         frac1 = sp.simplify(dividend1 / divisor1)
         text1 = f"({humanize_expression(dividend1, variables)}) / ({humanize_expression(divisor1, variables)})"
         latex1 = f"\\frac{{{sp.latex(dividend1)}}}{{{sp.latex(divisor1)}}}"
-        _append(frac1, text1, latex1, random.choice([1, -1]))
+        _append(frac1, text1, latex1, _rng().choice([1, -1]))
 
-        divisor2_var = random.choice(var_choices)
+        divisor2_var = _rng().choice(var_choices)
         divisor2 = random_polynomial((divisor2_var,), 1, min_terms=1) or divisor2_var
         quotient2 = random_polynomial((divisor2_var,), 1, min_terms=1)
         dividend2 = sp.expand(divisor2 * quotient2)
         frac2 = sp.simplify(dividend2 / divisor2)
         text2 = f"({humanize_expression(dividend2, variables)}) / ({humanize_expression(divisor2, variables)})"
         latex2 = f"\\frac{{{sp.latex(dividend2)}}}{{{sp.latex(divisor2)}}}"
-        _append(frac2, text2, latex2, random.choice([1, -1]))
+        _append(frac2, text2, latex2, _rng().choice([1, -1]))
 
     tail = _poly(1)
-    _append(tail, f"({humanize_expression(tail, variables)})", f"\\left({sp.latex(tail)}\\right)", random.choice([1, -1]))
+    _append(tail, f"({humanize_expression(tail, variables)})", f"\\left({sp.latex(tail)}\\right)", _rng().choice([1, -1]))
 
     display_expression = "".join(segments).strip()
     latex_expression = "".join(latex_segments).strip()
@@ -662,8 +688,8 @@ def build_poly_ops_expression(
 def _select_symbols(difficulty_level: DifficultyLevel) -> Sequence[sp.Symbol]:
     if difficulty_level == "basic":
         return (VARIABLE_SYMBOLS["x"],)
-    count = random.randint(2, min(3, len(VARIABLE_NAMES)))
-    names = random.sample(VARIABLE_NAMES, k=count)
+    count = _rng().randint(2, min(3, len(VARIABLE_NAMES)))
+    names = _rng().sample(VARIABLE_NAMES, k=count)
     return tuple(VARIABLE_SYMBOLS[name] for name in sorted(names))
 
 
@@ -790,32 +816,33 @@ def generate_question(topic: Topic, difficulty_level: DifficultyLevel) -> Genera
     target_range = _target_range_for(topic, difficulty_level)
     symbols: Sequence[sp.Symbol] = _select_symbols(difficulty_level)
 
-    for _ in range(MAX_GENERATION_ATTEMPTS):
-        if topic == "add_sub":
-            expression_text, expression_latex, expr = build_add_sub_expression(symbols, difficulty_level)
-            solution = sp.simplify(expr)
-        elif topic == "mul_div":
-            expression_text, expression_latex, expr = build_mul_div_expression(symbols)
-            solution = sp.simplify(expr)
-        elif topic == "poly_ops":
-            expression_text, expression_latex, expr = build_poly_ops_expression(symbols, difficulty_level)
-            solution = sp.simplify(expr)
-        elif topic == "mixed_ops":
-            expression_text, expression_latex, expr = build_mixed_ops_expression(symbols)
-            solution = sp.simplify(expr)
-        else:  # factorization
-            expression_text, expression_latex, expr = build_factorization_expression(symbols, difficulty_level)
-            solution = sp.factor(expr)
-
-        difficulty_score = compute_difficulty(expr, topic)
-        if target_range[0] <= difficulty_score <= target_range[1]:
-            return GeneratedQuestion(
-                question_id=str(uuid.uuid4()),
-                expression_text=expression_text,
-                expression_latex=expression_latex,
-                solution_expression=str(solution),
-                topic=topic,
-                difficulty_level=difficulty_level,
-                difficulty_score=difficulty_score,
-            )
+    for attempt in range(1, MAX_GENERATION_ATTEMPTS + 1):
+        with span("generate_question.attempt", topic=topic, attempt=attempt):
+            if topic == "add_sub":
+                expression_text, expression_latex, expr = build_add_sub_expression(symbols, difficulty_level)
+                solution = sp.simplify(expr)
+            elif topic == "mul_div":
+                expression_text, expression_latex, expr = build_mul_div_expression(symbols)
+                solution = sp.simplify(expr)
+            elif topic == "poly_ops":
+                expression_text, expression_latex, expr = build_poly_ops_expression(symbols, difficulty_level)
+                solution = sp.simplify(expr)
+            elif topic == "mixed_ops":
+                expression_text, expression_latex, expr = build_mixed_ops_expression(symbols)
+                solution = sp.simplify(expr)
+            else:  # factorization
+                expression_text, expression_latex, expr = build_factorization_expression(symbols, difficulty_level)
+                solution = sp.factor(expr)
+
+            difficulty_score = compute_difficulty(expr, topic)
+            if target_range[0] <= difficulty_score <= target_range[1]:
+                return GeneratedQuestion(
+                    question_id=str(uuid.uuid4()),
+                    expression_text=expression_text,
+                    expression_latex=expression_latex,
+                    solution_expression=str(solution),
+                    topic=topic,
+                    difficulty_level=difficulty_level,
+                    difficulty_score=difficulty_score,
+                )
     raise RuntimeError("未能在合理次数内生成满足难度的题目")
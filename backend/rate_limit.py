@@ -0,0 +1,150 @@
+"""Token-bucket admission control for the sympy- and Ark-heavy endpoints.
+
+Each budget (``generate``, ``check``, ``image``) keeps one bucket per student
+and one per client IP. Buckets live in a small SQLite file of their own, so all
+uvicorn workers share them without contending for the main database's write
+lock. Taking tokens is one ``INSERT ... ON CONFLICT DO UPDATE ... WHERE``
+statement per bucket, and both buckets are charged in the same transaction:
+a request limited by its IP does not use up the student's budget.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import create_engine
+
+from .config import Settings, get_settings
+from .database import configure_sqlite_pragmas
+from .metrics import RATE_LIMIT_DECISIONS, time_component
+
+LIMITED_DETAIL = "请求过于频繁，请稍后再试"
+# 空闲这么久的桶早已回满，删除不影响结果。
+IDLE_BUCKET_SECONDS = 3600.0
+PURGE_EVERY = 1000
+
+_TAKE = """
+INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (:key, :capacity - :cost, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = MIN(:capacity, tokens + MAX(0, :now - updated_at) * :rate) - :cost,
+    updated_at = :now
+WHERE MIN(:capacity, tokens + MAX(0, :now - updated_at) * :rate) >= :cost
+RETURNING tokens
+"""
+
+
+@dataclass(frozen=True)
+class Budget:
+    capacity: float
+    per_second: float
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    retry_after: float = 0.0
+    limited_by: str | None = None
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        path: str | Path,
+        budgets: dict[str, Budget],
+        ip_multiplier: float = 40.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.budgets = budgets
+        self.ip_multiplier = ip_multiplier
+        # 跨进程共享，必须用墙上时钟而不是 monotonic。
+        self._clock = clock
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 5})
+        configure_sqlite_pragmas(self.engine, "WAL", "NORMAL")
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+                "(key VARCHAR PRIMARY KEY, tokens FLOAT NOT NULL, updated_at FLOAT NOT NULL)"
+            )
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def acquire(
+        self, scope: str, *, user_id: int | None = None, ip: str | None = None, cost: float = 1.0
+    ) -> Decision:
+        """Take ``cost`` tokens from the student's and the IP's bucket for ``scope``, or neither."""
+
+        budget = self.budgets[scope]
+        buckets = []
+        if user_id is not None:
+            buckets.append(("user", f"{scope}:user:{user_id}", budget))
+        if ip is not None:
+            ip_budget = Budget(budget.capacity * self.ip_multiplier, budget.per_second * self.ip_multiplier)
+            buckets.append(("ip", f"{scope}:ip:{ip}", ip_budget))
+        if not buckets:
+            return Decision(True)
+
+        now = self._clock()
+        decision = Decision(True)
+        with time_component("rate_limit"), self.engine.connect() as conn:
+            for kind, key, bucket in buckets:
+                # 超过桶容量的请求（如 20 题的批量生成）按满桶收取，否则永远无法通过。
+                charge = min(cost, bucket.capacity)
+                params = {"key": key, "capacity": bucket.capacity, "rate": bucket.per_second, "cost": charge}
+                if conn.exec_driver_sql(_TAKE, {**params, "now": now}).first() is not None:
+                    continue
+                tokens, updated_at = conn.exec_driver_sql(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = :key", {"key": key}
+                ).one()
+                available = min(bucket.capacity, tokens + max(0.0, now - updated_at) * bucket.per_second)
+                decision = Decision(False, (charge - available) / bucket.per_second, kind)
+                break
+            if decision.allowed:
+                if self._should_purge():
+                    conn.exec_driver_sql(
+                        "DELETE FROM rate_limit_buckets WHERE updated_at < :cutoff",
+                        {"cutoff": now - IDLE_BUCKET_SECONDS},
+                    )
+                conn.commit()
+            else:
+                conn.rollback()
+        RATE_LIMIT_DECISIONS.inc(scope, "allowed" if decision.allowed else f"limited_{decision.limited_by}")
+        return decision
+
+    def _should_purge(self) -> bool:
+        with self._lock:
+            self._calls += 1
+            return self._calls % PURGE_EVERY == 0
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+
+def budgets_from_settings(settings: Settings) -> dict[str, Budget]:
+    return {
+        "generate": Budget(settings.rate_limit_generate_burst, settings.rate_limit_generate_per_minute / 60),
+        "check": Budget(settings.rate_limit_check_burst, settings.rate_limit_check_per_minute / 60),
+        "image": Budget(settings.rate_limit_image_burst, settings.rate_limit_image_per_minute / 60),
+    }
+
+
+@lru_cache
+def get_rate_limiter() -> RateLimiter | None:
+    """The shared limiter, or None when ``RATE_LIMIT_ENABLED`` is off."""
+
+    settings = get_settings()
+    if not settings.rate_limit_enabled:
+        return None
+    return RateLimiter(
+        settings.rate_limit_db_path,
+        budgets_from_settings(settings),
+        ip_multiplier=settings.rate_limit_ip_multiplier,
+    )
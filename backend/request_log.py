@@ -0,0 +1,181 @@
+"""Record API requests to a compact JSON-lines log for later replay.
+
+One line per request::
+
+    {"t": 1718000000.123, "m": "POST", "p": "/api/check_answer", "q": "", "r": "/api/check_answer",
+     "b": "{...}", "s": 200, "d": 12.4, "ids": {"userId": 7}}
+
+``t`` is the wall-clock start, ``r`` the route template, ``b`` the request body,
+``d`` the server-side duration in ms and ``ids`` the ``userId``/``questionId``
+returned by the server, which replay uses to map ids onto a fresh database.
+Students' names in ``/api/login`` bodies are replaced by pseudonyms that stay
+stable within one log file, so replay still logs the same student in again.
+Paths ending in ``.gz`` are gzip-compressed; ``{pid}`` in the path is replaced
+by the worker's process id so uvicorn workers never share a file.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 回放时需要映射到新库的编号字段。
+RECORDED_IDS = ("userId", "questionId")
+MAX_BODY_BYTES = 16 * 1024
+MAX_RESPONSE_BYTES = 4 * 1024
+SKIPPED_PREFIXES = ("/metrics", "/api/debug", "/docs", "/openapi.json")
+# 请求体里的个人信息：不写入日志，换成同一文件内稳定的化名。
+REDACTED_FIELDS = {"/api/login": ("chinese_name", "english_name")}
+
+
+def _open_log(path: Path, mode: str) -> IO[str]:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class RequestLog:
+    """Thread-safe appender; gzip members are written every ``flush_every`` lines."""
+
+    def __init__(self, path: str | Path, flush_every: int = 100) -> None:
+        self.path = Path(str(path).replace("{pid}", str(os.getpid())))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending: list[str] = []
+        # 每个文件一个随机盐：化名在文件内稳定，但无法用常见姓名反查。
+        self._salt = os.urandom(16)
+
+    def append(self, record: dict[str, Any]) -> list[str] | None:
+        """Buffer ``record``; returns a full batch the caller must hand to :meth:`write`."""
+
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._pending.append(line)
+            if len(self._pending) < self.flush_every:
+                return None
+            batch, self._pending = self._pending, []
+        return batch
+
+    def write(self, batch: list[str]) -> None:
+        """Append ``batch`` to the file; blocking, so call it from a worker thread."""
+
+        with self._write_lock, _open_log(self.path, "a") as fh:
+            fh.write("\n".join(batch) + "\n")
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self.write(batch)
+
+    def pseudonym(self, value: str) -> str:
+        return "anon-" + hmac.new(self._salt, value.encode(), hashlib.sha256).hexdigest()[:12]
+
+    def redact(self, route: str | None, body: bytes) -> str:
+        """The request body as logged: personal fields of ``route`` replaced by pseudonyms."""
+
+        fields = REDACTED_FIELDS.get(route or "")
+        if not fields or not body:
+            return body.decode("utf-8", "replace")
+        try:
+            data = json.loads(body)
+        except ValueError:
+            # 截断或格式不对，无法逐字段处理：整个请求体都不记录。
+            return ""
+        if not isinstance(data, dict):
+            return ""
+        for field in fields:
+            if isinstance(data.get(field), str):
+                data[field] = self.pseudonym(data[field])
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def read_log(path: str | Path) -> Iterator[dict[str, Any]]:
+    with _open_log(Path(path), "r") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _extract_ids(body: bytes) -> dict[str, Any]:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {key: data[key] for key in RECORDED_IDS if key in data}
+
+
+class RequestRecorderMiddleware:
+    """Pure ASGI middleware appending sampled API requests to a :class:`RequestLog`."""
+
+    def __init__(self, app: ASGIApp, log: RequestLog, sample_rate: float = 1.0) -> None:
+        self.app = app
+        self.log = log
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["path"].startswith(SKIPPED_PREFIXES)
+            or (self.sample_rate < 1.0 and random.random() >= self.sample_rate)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request_body = bytearray()
+        response_body = bytearray()
+        status = 500
+        compressed = False
+
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "http.request" and len(request_body) < MAX_BODY_BYTES:
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, compressed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                compressed = any(key == b"content-encoding" for key, _ in message.get("headers", []))
+            elif message["type"] == "http.response.body" and len(response_body) < MAX_RESPONSE_BYTES:
+                response_body.extend(message.get("body", b""))
+            await send(message)
+
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            record: dict[str, Any] = {
+                "t": round(started, 3),
+                "m": scope["method"],
+                "p": scope["path"],
+                "q": scope.get("query_string", b"").decode("latin-1"),
+                "r": route,
+                "b": self.log.redact(route, bytes(request_body[:MAX_BODY_BYTES])),
+                "s": status,
+                "d": round((time.perf_counter() - start) * 1000, 2),
+            }
+            ids = {} if compressed else _extract_ids(bytes(response_body))
+            if ids:
+                record["ids"] = ids
+            batch = self.log.append(record)
+            if batch:
+                # 攒满一批才写文件，放到线程池，不在事件循环上做磁盘 I/O。
+                await run_in_threadpool(self.log.write, batch)
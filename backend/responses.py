@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+
+import brotli
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from .config import get_settings
+from .tracing import span
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# 每次请求现压的响应用较低的压缩等级，换取更少的 CPU。
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 5
+# 服务端优先选择的编码顺序（客户端 q 值相同时）。
+ENCODING_PREFERENCE = ("br", "gzip", "identity")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether ``If-None-Match`` already names ``etag`` (weak prefixes ignored)."""
+
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """The ETag of ``encoding``'s representation: ``"abc"`` becomes ``"abc-gzip"``."""
+
+    if encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def matching_etag(request: Request, etag: str) -> str | None:
+    """The tag from ``If-None-Match`` still valid for this request, if any.
+
+    For responses sent through :func:`json_response`, where a small body stays
+    uncompressed: the identity tag, or the tag of the coding this request would
+    be given. A copy in a coding the client no longer accepts never matches.
+    """
+
+    encoding = negotiate_encoding(request, ENCODING_PREFERENCE)
+    for candidate in dict.fromkeys((encoded_etag(etag, encoding), etag)):
+        if etag_matches(request, candidate):
+            return candidate
+    return None
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def negotiate_encoding(request: Request, available: tuple[str, ...] | set[str]) -> str:
+    """Pick the best content-coding from ``Accept-Encoding`` among ``available``."""
+
+    header = request.headers.get("accept-encoding", "")
+    weights: dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name] = quality
+
+    best, best_quality = "identity", 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        quality = weights.get(encoding, weights.get("*", 1.0 if encoding == "identity" else 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def json_response(
+    request: Request,
+    content: bytes | object,
+    *,
+    headers: dict[str, str] | None = None,
+    min_size: int | None = None,
+) -> Response:
+    """Return JSON (pre-serialized bytes or orjson-encodable data), compressed when large.
+
+    Bodies of at least ``min_size`` bytes (``RESPONSE_COMPRESSION_MIN_BYTES`` by
+    default) are gzip/brotli encoded according to ``Accept-Encoding``; an
+    ``ETag`` header then gets the coding's suffix (see :func:`encoded_etag`).
+    """
+
+    if isinstance(content, bytes):
+        body = content
+    else:
+        with span("serialize"):
+            body = orjson.dumps(content)
+    headers = dict(headers or {})
+    if min_size is None:
+        min_size = get_settings().response_compression_min_bytes
+    if len(body) >= min_size:
+        headers["Vary"] = "Accept-Encoding"
+        encoding = negotiate_encoding(request, ENCODING_PREFERENCE)
+        with span("compress", encoding=encoding, size=len(body)):
+            if encoding == "gzip":
+                body = gzip.compress(body, compresslevel=DYNAMIC_GZIP_LEVEL)
+            elif encoding == "br":
+                body = brotli.compress(body, quality=DYNAMIC_BROTLI_QUALITY)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+            if "ETag" in headers:
+                headers["ETag"] = encoded_etag(headers["ETag"], encoding)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class PrecomputedResponse:
+    """A static JSON body serialized and compressed once at startup.
+
+    Use it for lookup tables that never change while the process runs; each
+    request only negotiates an encoding and compares that variant's ETag.
+    """
+
+    def __init__(self, body: bytes, *, cache_control: str = "public, max-age=3600") -> None:
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.cache_control = cache_control
+        self.variants: dict[str, bytes] = {
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+            "br": brotli.compress(body, quality=BROTLI_QUALITY),
+        }
+
+    @classmethod
+    def from_model(cls, model: BaseModel, **kwargs) -> PrecomputedResponse:
+        return cls(model.model_dump_json(by_alias=True).encode(), **kwargs)
+
+    def respond(self, request: Request) -> Response:
+        encoding = negotiate_encoding(request, self.variants.keys())
+        # 每种编码各自一个 ETag：缓存的 gzip 副本不会被当成 identity 内容复用。
+        etag = encoded_etag(self.etag, encoding)
+        if etag_matches(request, etag):
+            return not_modified(etag, self.cache_control)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type="application/json", headers=headers)
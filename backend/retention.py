@@ -0,0 +1,242 @@
+"""Archive old questions/attempts, purge abandoned questions and compact SQLite.
+
+Usage::
+
+    python -m backend.retention                       # 使用 .env 中的 RETENTION_* 配置
+    python -m backend.retention --archive-after-days 90 --dry-run
+    python -m backend.retention --full-vacuum         # 首次运行：切换到 auto_vacuum=INCREMENTAL
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import zlib
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import Table, and_, delete, func, insert, or_, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from .models import ArchivedRecord, Question, QuestionAttempt, User
+
+QUESTIONS: Table = Question.__table__
+ATTEMPTS: Table = QuestionAttempt.__table__
+SQLITE_AUTO_VACUUM_FULL = 1
+SQLITE_AUTO_VACUUM_INCREMENTAL = 2
+
+
+@dataclass
+class RetentionReport:
+    archived_questions: int = 0
+    purged_questions: int = 0
+    archived_attempts: int = 0
+    size_before: int = 0
+    size_after: int = 0
+    free_pages_before: int = 0
+    free_pages_after: int = 0
+    vacuum_mode: str = "none"
+
+    @property
+    def reclaimed_bytes(self) -> int:
+        return max(self.size_before - self.size_after, 0)
+
+
+def compress_records(rows: list[dict[str, Any]]) -> bytes:
+    return zlib.compress(json.dumps(rows, default=_json_default, separators=(",", ":")).encode(), 9)
+
+
+def load_archive(payload: bytes) -> list[dict[str, Any]]:
+    return json.loads(zlib.decompress(payload))
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def _database_pages(conn: Connection) -> tuple[int, int, int]:
+    page_size = conn.exec_driver_sql("PRAGMA page_size").scalar() or 0
+    page_count = conn.exec_driver_sql("PRAGMA page_count").scalar() or 0
+    free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+    return page_size, page_count, free_pages
+
+
+def _bump_state_versions(conn: Connection, user_ids: set[int]) -> None:
+    # 最近题目列表可能因此变化，让这些学生的 ETag 失效。
+    conn.execute(
+        update(User.__table__)
+        .where(User.__table__.c.id.in_(user_ids))
+        .values(state_version=User.__table__.c.state_version + 1)
+    )
+
+
+def _archive_batch(conn: Connection, table: Table, kind: str, criteria, batch_size: int) -> int:
+    rows = [
+        dict(row)
+        for row in conn.execute(
+            select(table).where(criteria).order_by(table.c.created_at).limit(batch_size)
+        ).mappings()
+    ]
+    if not rows:
+        return 0
+
+    by_user: dict[int, list[dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        by_user[row["user_id"]].append(row)
+    archived_at = datetime.utcnow()
+    conn.execute(
+        insert(ArchivedRecord),
+        [
+            dict(
+                kind=kind,
+                user_id=user_id,
+                record_count=len(user_rows),
+                first_created_at=user_rows[0]["created_at"],
+                last_created_at=user_rows[-1]["created_at"],
+                payload=compress_records(user_rows),
+                archived_at=archived_at,
+            )
+            for user_id, user_rows in by_user.items()
+        ],
+    )
+    primary_key = next(iter(table.primary_key.columns))
+    conn.execute(delete(table).where(primary_key.in_([row[primary_key.name] for row in rows])))
+    _bump_state_versions(conn, set(by_user))
+    return len(rows)
+
+
+def _archive_all(target: Engine, table: Table, kind: str, criteria, batch_size: int) -> int:
+    # 每批单独提交，避免长事务长时间占住写锁。
+    total = 0
+    while True:
+        with target.begin() as conn:
+            moved = _archive_batch(conn, table, kind, criteria, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+def _purge_all(target: Engine, criteria, batch_size: int) -> int:
+    total = 0
+    while True:
+        with target.begin() as conn:
+            rows = conn.execute(
+                select(QUESTIONS.c.question_id, QUESTIONS.c.user_id).where(criteria).limit(batch_size)
+            ).all()
+            if rows:
+                conn.execute(delete(QUESTIONS).where(QUESTIONS.c.question_id.in_([row[0] for row in rows])))
+                _bump_state_versions(conn, {row[1] for row in rows})
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+
+
+def _compact(target: Engine, full_vacuum: bool) -> str:
+    with target.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        if mode == SQLITE_AUTO_VACUUM_INCREMENTAL:
+            conn.exec_driver_sql("PRAGMA incremental_vacuum")
+            return "incremental"
+        if mode == SQLITE_AUTO_VACUUM_FULL:
+            return "auto"
+        if full_vacuum:
+            # auto_vacuum 只能在 VACUUM 重建文件时切换，之后每次运行都可以增量回收。
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            return "full"
+    return "none"
+
+
+def run_retention(
+    target: Engine,
+    *,
+    archive_after_days: int,
+    abandon_after_days: int,
+    attempts_after_days: int | None = None,
+    batch_size: int = 1000,
+    full_vacuum: bool = False,
+    dry_run: bool = False,
+    now: datetime | None = None,
+) -> RetentionReport:
+    if target.dialect.name != "sqlite":
+        raise ValueError("数据保留任务目前只支持 SQLite")
+
+    now = now or datetime.utcnow()
+    unattempted = and_(QUESTIONS.c.attempts_used == 0, QUESTIONS.c.is_solved.is_(False))
+    abandoned = and_(unattempted, QUESTIONS.c.created_at < now - timedelta(days=abandon_after_days))
+    archivable = and_(
+        or_(QUESTIONS.c.attempts_used > 0, QUESTIONS.c.is_solved.is_(True)),
+        QUESTIONS.c.created_at < now - timedelta(days=archive_after_days),
+    )
+    old_attempts = None
+    if attempts_after_days is not None:
+        old_attempts = ATTEMPTS.c.created_at < now - timedelta(days=attempts_after_days)
+
+    report = RetentionReport()
+    with target.connect() as conn:
+        page_size, page_count, report.free_pages_before = _database_pages(conn)
+        report.size_before = page_size * page_count
+        if dry_run:
+            def count(table: Table, criteria) -> int:
+                return conn.scalar(select(func.count()).select_from(table).where(criteria))
+
+            report.purged_questions = count(QUESTIONS, abandoned)
+            report.archived_questions = count(QUESTIONS, archivable)
+            if old_attempts is not None:
+                report.archived_attempts = count(ATTEMPTS, old_attempts)
+            report.size_after, report.free_pages_after = report.size_before, report.free_pages_before
+            return report
+
+    report.purged_questions = _purge_all(target, abandoned, batch_size)
+    report.archived_questions = _archive_all(target, QUESTIONS, "question", archivable, batch_size)
+    if old_attempts is not None:
+        report.archived_attempts = _archive_all(target, ATTEMPTS, "attempt", old_attempts, batch_size)
+    report.vacuum_mode = _compact(target, full_vacuum)
+
+    with target.connect() as conn:
+        page_size, page_count, report.free_pages_after = _database_pages(conn)
+        report.size_after = page_size * page_count
+    return report
+
+
+def main() -> None:
+    from .config import get_settings
+    from .database import Base, engine
+    from .migrations import MIGRATIONS, run_migrations
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--archive-after-days", type=int, default=settings.retention_archive_after_days)
+    parser.add_argument("--abandon-after-days", type=int, default=settings.retention_abandon_after_days)
+    parser.add_argument("--attempts-after-days", type=int, default=settings.retention_attempts_after_days)
+    parser.add_argument("--batch-size", type=int, default=settings.retention_batch_size)
+    parser.add_argument("--full-vacuum", action="store_true", help="必要时执行一次完整 VACUUM 以启用增量回收")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不修改数据库")
+    args = parser.parse_args()
+
+    if not args.dry_run:
+        # 归档按当前表结构读写：旧库先升级，不能在 history 尚未合并等旧结构上运行。
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+    elif engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            version = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+        if version < len(MIGRATIONS):
+            parser.error(f"数据库结构版本 {version} 落后于 {len(MIGRATIONS)}，请先启动一次服务或去掉 --dry-run 完成迁移")
+    report = run_retention(
+        engine,
+        archive_after_days=args.archive_after_days,
+        abandon_after_days=args.abandon_after_days,
+        attempts_after_days=args.attempts_after_days,
+        batch_size=args.batch_size,
+        full_vacuum=args.full_vacuum,
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(asdict(report) | {"reclaimed_bytes": report.reclaimed_bytes}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
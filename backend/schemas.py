@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 
 
 class APIModel(BaseModel):
@@ -57,6 +57,11 @@ class CheckAnswerResponse(APIModel):
     solution_expression: str | None = Field(default=None, alias="solutionExpression")
 
 
+class PracticeAnswerResponse(CheckAnswerResponse):
+    # 答对或三次机会用完时附带同一题型的下一题，否则为 null。
+    next_question: GenerateQuestionResponse | None = Field(default=None, alias="nextQuestion")
+
+
 class BuyFoodRequest(APIModel):
     user_id: int = Field(alias="userId")
     food_id: str = Field(alias="foodId")
@@ -80,6 +85,16 @@ class FoodListResponse(APIModel):
     foods: list[FoodItem]
 
 
+class CatStage(APIModel):
+    stage: int
+    min_score: int = Field(alias="minScore")
+    max_score: int | None = Field(default=None, alias="maxScore")
+
+
+class CatStageListResponse(APIModel):
+    stages: list[CatStage]
+
+
 class UserSummaryResponse(APIModel):
     user_id: int = Field(alias="userId")
     total_score: int = Field(alias="totalScore")
@@ -97,6 +112,8 @@ class UserSummaryResponse(APIModel):
 class BatchGenerateRequest(APIModel):
     count: int = Field(..., gt=0, le=20)
     difficulty: Optional[Literal["basic", "intermediate", "advanced"]] = None
+    # 带 userId 时题目整批入库，可用 /api/check_answer 判题，响应不含答案。
+    user_id: Optional[int] = Field(default=None, alias="userId")
 
 
 class BatchQuestion(APIModel):
@@ -106,13 +123,27 @@ class BatchQuestion(APIModel):
     expression_text: str = Field(..., alias="expressionText")
     expression_latex: str = Field(..., alias="expressionLatex")
     difficulty_score: int = Field(..., alias="difficultyScore")
-    solution_expression: str = Field(..., alias="solutionExpression")
+    solution_expression: Optional[str] = Field(default=None, alias="solutionExpression")
 
 
 class BatchGenerateResponse(APIModel):
     questions: list[BatchQuestion]
 
 
+class ClassSetRequest(APIModel):
+    user_id: int = Field(alias="userId")
+    difficulty_level: Literal["basic", "intermediate", "advanced"] = Field(alias="difficultyLevel")
+    # 不传时按当天日期；老师想让全班重做同一套题时传同一个种子。
+    seed: Optional[int] = Field(default=None, ge=0)
+
+
+class ClassSetResponse(APIModel):
+    class_name: str = Field(alias="className")
+    difficulty_level: str = Field(alias="difficultyLevel")
+    seed: int
+    questions: list[BatchQuestion]
+
+
 class RecentQuestion(APIModel):
     question_id: str = Field(..., alias="questionId")
     expression_text: str = Field(..., alias="expressionText")
@@ -132,7 +163,7 @@ class HistoryCreate(APIModel):
 
 
 class HistoryResponse(APIModel):
-    id: int
+    id: Optional[int]
     user_id: int
     question_text: str
     user_answer: str
@@ -145,3 +176,38 @@ class HistoryResponse(APIModel):
         from_attributes=True,
         json_encoders={datetime: lambda v: v.isoformat()},
     )
+
+
+class PracticeNextMessage(APIModel):
+    topic: Literal["add_sub", "mul_div", "poly_ops", "factorization", "mixed_ops"]
+    difficulty_level: Literal["basic", "intermediate", "advanced"] = Field(alias="difficultyLevel")
+
+
+class PracticeAnswerMessage(APIModel):
+    user_answer: str = Field(alias="userAnswer")
+
+
+class PracticeBuyMessage(APIModel):
+    food_id: str = Field(alias="foodId")
+
+
+class ImageJobRequest(APIModel):
+    prompt: str = Field(min_length=1, max_length=2000)
+    # 可选：带上时按学生限流，否则只按客户端 IP。
+    user_id: Optional[int] = Field(default=None, alias="userId")
+
+
+class ImageJobResponse(APIModel):
+    job_id: str = Field(alias="jobId")
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int
+    image_url: Optional[str] = Field(default=None, alias="imageUrl")
+    error: Optional[str] = None
+    created_at: datetime = Field(alias="createdAt")
+    finished_at: Optional[datetime] = Field(default=None, alias="finishedAt")
+
+
+# 列表接口整批校验/序列化，避免逐行 model_validate。
+BatchQuestionList = TypeAdapter(list[BatchQuestion])
+RecentQuestionList = TypeAdapter(list[RecentQuestion])
+HistoryResponseList = TypeAdapter(list[HistoryResponse])
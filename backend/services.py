@@ -3,10 +3,13 @@ from __future__ import annotations
 import random
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
 
 import sympy as sp
-from sqlalchemy import func
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from sympy.parsing.sympy_parser import (
     implicit_multiplication_application,
@@ -20,8 +23,20 @@ from .question_generator import (
     VARIABLE_SYMBOLS,
     generate_question,
 )
-from .models import FoodPurchase, HistoryEntry, Question, QuestionAttempt, User
-from .schemas import HistoryCreate, HistoryResponse, RecentQuestion
+from .foods import Food
+from .metrics import time_component
+from .models import FoodPurchase, Question, QuestionAttempt, User
+from .schemas import (
+    HistoryCreate,
+    HistoryResponse,
+    HistoryResponseList,
+    LoginRequest,
+    RecentQuestion,
+    RecentQuestionList,
+)
+from .tracing import traced
+from .user_cache import CachedUser, get_user_cache
+from .write_behind import get_write_behind
 
 # 计分规则：根据难度决定一次答对和答错的分差。
 SCORE_RULES: dict[DifficultyLevel, tuple[int, int]] = {
@@ -32,9 +47,42 @@ SCORE_RULES: dict[DifficultyLevel, tuple[int, int]] = {
 
 MAX_ATTEMPTS_PER_QUESTION = 3
 MAX_INPUT_LENGTH = 200
+# POST /api/history 只在这段时间内找不到同一次答题记录时才补写。
+HISTORY_DEDUPE_WINDOW = timedelta(minutes=10)
 _TRANSFORMATIONS = standard_transformations + (implicit_multiplication_application,)
 
 
+def login_user(db: Session, payload: LoginRequest) -> Row:
+    """Find or create the student in one INSERT ... ON CONFLICT ... RETURNING.
+
+    The no-op DO UPDATE makes SQLite return the existing row on conflict, which
+    DO NOTHING would not, so both paths finish in a single statement.
+    """
+
+    stmt = sqlite_insert(User).values(
+        chinese_name=payload.chinese_name,
+        english_name=payload.english_name,
+        class_name=payload.class_name,
+        total_score=0,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.chinese_name, User.english_name, User.class_name],
+        set_={"chinese_name": stmt.excluded.chinese_name},
+    ).returning(
+        User.id,
+        User.chinese_name,
+        User.english_name,
+        User.class_name,
+        User.total_score,
+        User.state_version,
+        User.updated_at,
+    )
+    row = db.execute(stmt).one()
+    db.commit()
+    get_user_cache().store(CachedUser(*row))
+    return row
+
+
 def get_score_change(difficulty_level: DifficultyLevel, is_correct: bool) -> int:
     correct, incorrect = SCORE_RULES[difficulty_level]
     return correct if is_correct else incorrect
@@ -52,6 +100,7 @@ def _sanitize_input(text: str) -> str:
     return text.replace("^", "**")
 
 
+@traced("normalize_expr")
 def normalize_expr(text: str) -> sp.Expr:
     sanitized = _sanitize_input(text)
     try:
@@ -66,31 +115,47 @@ def normalize_expr(text: str) -> sp.Expr:
         raise ValueError(f"无法解析表达式: {exc}") from exc
 
 
+@lru_cache(maxsize=4096)
+def normalized_solution(text: str) -> sp.Expr:
+    """``normalize_expr`` for stored solutions, parsed once per process.
+
+    Students sharing a class set (and retries of one question) grade against
+    the same solution string, so only the student's answer is parsed each time.
+    """
+
+    return normalize_expr(text)
+
+
+@traced("compare_expressions")
 def compare_expressions(left: sp.Expr, right: sp.Expr) -> bool:
     return sp.simplify(left - right) == 0
 
 
+# 猫咪成长阶段：每个阶段可达到的最高猫粮积分，超过最后一档即为第 4 阶段。
+CAT_STAGE_MAX_SCORES: tuple[int, ...] = (50, 150, 200)
+
+
 def get_cat_stage(total_score: int) -> int:
-    if total_score <= 50:
-        return 1
-    if total_score <= 150:
-        return 2
-    if total_score <= 200:
-        return 3
-    return 4
+    for stage, max_score in enumerate(CAT_STAGE_MAX_SCORES, start=1):
+        if total_score <= max_score:
+            return stage
+    return len(CAT_STAGE_MAX_SCORES) + 1
 
 
 def next_stage_threshold(total_score: int) -> int:
     stage = get_cat_stage(total_score)
-    if stage == 1:
-        return 51
-    if stage == 2:
-        return 151
-    if stage == 3:
-        return 201
+    if stage <= len(CAT_STAGE_MAX_SCORES):
+        return CAT_STAGE_MAX_SCORES[stage - 1] + 1
     return total_score
 
 
+def cat_stage_table() -> list[tuple[int, int, int | None]]:
+    """(stage, min_score, max_score) rows; the last stage has no upper bound."""
+
+    bounds = (-1, *CAT_STAGE_MAX_SCORES, None)
+    return [(stage, bounds[stage - 1] + 1, bounds[stage]) for stage in range(1, len(bounds))]
+
+
 def get_cat_score(db: Session, user_id: int) -> int:
     total = (
         db.query(func.coalesce(func.sum(FoodPurchase.cost), 0))
@@ -117,61 +182,202 @@ def _guard_attempt_status(question: Question) -> None:
         raise ValueError("该题已达到三次机会，请获取下一题")
 
 
+def _claim_attempt(db: Session, question_id: str, is_correct: bool) -> int | None:
+    """Consume one attempt in a single guarded UPDATE and return the new count.
+
+    Returns ``None`` when the question was solved or exhausted in the meantime,
+    so a double-submit can never push ``attempts_used`` past the limit.
+    """
+
+    stmt = (
+        update(Question)
+        .where(
+            Question.question_id == question_id,
+            Question.is_solved.is_(False),
+            Question.attempts_used < MAX_ATTEMPTS_PER_QUESTION,
+        )
+        .values(attempts_used=Question.attempts_used + 1, is_solved=is_correct)
+        .returning(Question.attempts_used)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).scalar_one_or_none()
+
+
+def bump_state_version(db: Session, user_id: int) -> None:
+    """Mark the user's summary/recent-questions state as changed (commit is up to the caller)."""
+
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(state_version=User.state_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _apply_score_change(db: Session, user_id: int, score_change: int) -> int:
+    """Add ``score_change`` to the user's score in SQL, clamped at zero."""
+
+    stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            total_score=func.max(User.total_score + score_change, 0),
+            state_version=User.state_version + 1,
+        )
+        .returning(User.total_score)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).scalar_one()
+
+
 def process_answer(
     db: Session,
     question: Question,
-    user: User,
+    user: User | CachedUser,
     user_answer: str,
+    *,
+    commit: bool = True,
 ) -> AnswerResult:
+    """Grade ``user_answer`` and record the attempt.
+
+    With ``commit=False`` the changes are left in ``db``'s transaction; the
+    caller commits them and then invalidates the user cache.
+    """
+
     _guard_attempt_status(question)
 
-    correct_expr = normalize_expr(question.solution_expression)
-    user_expr = normalize_expr(user_answer)
-    is_correct = compare_expressions(correct_expr, user_expr)
+    with time_component("sympy_check"):
+        correct_expr = normalized_solution(question.solution_expression)
+        user_expr = normalize_expr(user_answer)
+        is_correct = compare_expressions(correct_expr, user_expr)
 
-    question.attempts_used += 1
-    if is_correct:
-        question.is_solved = True
+    attempts_used = _claim_attempt(db, question.question_id, is_correct)
+    if attempts_used is None:
+        # 并发提交抢先用掉了最后一次机会：回滚后按最新状态给出提示。
+        db.rollback()
+        db.refresh(question)
+        _guard_attempt_status(question)
+        raise ValueError("该题状态已变化，请刷新后重试")
 
     if is_correct:
         score_change = get_score_change(question.difficulty_level, True)
-    elif question.attempts_used >= MAX_ATTEMPTS_PER_QUESTION:
+    elif attempts_used >= MAX_ATTEMPTS_PER_QUESTION:
         score_change = get_score_change(question.difficulty_level, False)
     else:
         score_change = 0
 
-    if score_change:
-        user.total_score = clamp_score(user.total_score + score_change)
+    # 即使不加减分也要递增 state_version；顺便取回数据库中的最新积分（user 可能来自缓存）。
+    new_total_score = _apply_score_change(db, user.id, score_change)
 
-    db_attempt = QuestionAttempt(
+    difficulty_score = question.difficulty_score
+    solution = question.solution_expression if attempts_used >= MAX_ATTEMPTS_PER_QUESTION else None
+
+    attempt_values = dict(
         question_id=question.question_id,
         user_id=user.id,
         expression_text=question.expression_text,
         topic=question.topic,
         difficulty_level=question.difficulty_level,
-        difficulty_score=question.difficulty_score,
+        difficulty_score=difficulty_score,
         user_answer=user_answer,
         is_correct=is_correct,
         score_change=score_change,
-        attempt_index=question.attempts_used,
+        attempt_index=attempts_used,
+        correct_answer=solution,
+        created_at=datetime.utcnow(),
     )
-    db.add(db_attempt)
-    db.commit()
-    db.refresh(user)
-    db.refresh(question)
-
-    solution = question.solution_expression if question.attempts_used >= MAX_ATTEMPTS_PER_QUESTION else None
+    writer = get_write_behind()
+    if writer is not None:
+        writer.submit(db, QuestionAttempt, attempt_values)
+    else:
+        db.add(QuestionAttempt(**attempt_values))
+    if commit:
+        db.commit()
+        get_user_cache().invalidate(user.id)
 
     return AnswerResult(
         is_correct=is_correct,
-        difficulty_score=question.difficulty_score,
+        difficulty_score=difficulty_score,
         score_change=score_change,
-        new_total_score=user.total_score,
-        attempt_count=question.attempts_used,
+        new_total_score=new_total_score,
+        attempt_count=attempts_used,
         solution_expression=solution,
     )
 
 
+def purchase_food(db: Session, user_id: int, food: Food, *, commit: bool = True) -> int:
+    """Deduct the food price atomically and record the purchase.
+
+    The balance check lives in the UPDATE's WHERE clause, so two concurrent
+    purchases can never spend the same points twice. ``commit=False`` works as
+    in :func:`process_answer`.
+    """
+
+    stmt = (
+        update(User)
+        .where(User.id == user_id, User.total_score >= food.price)
+        .values(total_score=User.total_score - food.price, state_version=User.state_version + 1)
+        .returning(User.total_score)
+        .execution_options(synchronize_session=False)
+    )
+    new_total_score = db.execute(stmt).scalar_one_or_none()
+    if new_total_score is None:
+        db.rollback()
+        raise ValueError("积分不足")
+
+    db.add(
+        FoodPurchase(
+            user_id=user_id,
+            food_id=food.food_id,
+            food_name=food.name,
+            cost=food.price,
+        )
+    )
+    if commit:
+        db.commit()
+        get_user_cache().invalidate(user_id)
+    else:
+        db.flush()
+    return new_total_score
+
+
+def _question_values(user_id: int, question: GeneratedQuestion) -> dict:
+    return {
+        "question_id": question.question_id,
+        "user_id": user_id,
+        "expression_text": question.expression_text,
+        "solution_expression": question.solution_expression,
+        "topic": question.topic,
+        "difficulty_level": question.difficulty_level,
+        "difficulty_score": question.difficulty_score,
+    }
+
+
+def save_generated_question(
+    db: Session, user_id: int, question: GeneratedQuestion, *, commit: bool = True
+) -> Question:
+    """Persist a generated question for ``user_id`` and commit (see :func:`process_answer` for ``commit``)."""
+
+    db_question = Question(**_question_values(user_id, question))
+    db.add(db_question)
+    bump_state_version(db, user_id)
+    if commit:
+        db.commit()
+        get_user_cache().invalidate(user_id)
+    else:
+        db.flush()
+    return db_question
+
+
+def save_generated_questions(db: Session, user_id: int, questions: list[GeneratedQuestion]) -> None:
+    """Persist a whole worksheet for ``user_id`` with one executemany and one commit."""
+
+    db.execute(insert(Question), [_question_values(user_id, question) for question in questions])
+    bump_state_version(db, user_id)
+    db.commit()
+    get_user_cache().invalidate(user_id)
+
+
 def generate_batch_questions(count: int, difficulty: Optional[DifficultyLevel] = None) -> list[GeneratedQuestion]:
     topics = ["add_sub", "mul_div", "poly_ops", "factorization", "mixed_ops"]
     difficulty_levels = ["basic", "intermediate", "advanced"]
@@ -179,35 +385,106 @@ def generate_batch_questions(count: int, difficulty: Optional[DifficultyLevel] =
     for _ in range(count):
         topic = random.choice(topics)
         diff_level = difficulty or random.choice(difficulty_levels)
-        q = generate_question(topic, diff_level)
+        with time_component("sympy_generate"):
+            q = generate_question(topic, diff_level)
         questions.append(q)
     return questions
 
 
 def get_recent_questions(db: Session, user_id: int) -> list[RecentQuestion]:
-    questions = (
-        db.query(Question)
-        .filter(Question.user_id == user_id)
+    rows = db.execute(
+        select(Question.question_id, Question.expression_text, Question.created_at)
+        .where(Question.user_id == user_id)
         .order_by(Question.created_at.desc())
         .limit(5)
-        .all()
+    ).all()
+    return RecentQuestionList.validate_python(rows, from_attributes=True)
+
+
+def _history_projection():
+    """question_attempts 投影成历史记录字段，走 (user_id, created_at) 索引。"""
+
+    return select(
+        QuestionAttempt.id,
+        QuestionAttempt.user_id,
+        QuestionAttempt.expression_text.label("question_text"),
+        QuestionAttempt.user_answer,
+        QuestionAttempt.score_change.label("score"),
+        QuestionAttempt.correct_answer,
+        QuestionAttempt.created_at,
     )
-    return [
-        RecentQuestion(
-            question_id=q.question_id,
-            expression_text=q.expression_text,
-            created_at=q.created_at,
-        )
-        for q in questions
-    ]
 
 
 def create_history_entry(db: Session, history: HistoryCreate) -> HistoryResponse:
-    db_history = HistoryEntry(**history.model_dump())
-    db.add(db_history)
+    """Return the attempt row matching a client-side history record.
+
+    Graded answers are already logged by ``process_answer``, so posting history
+    is optional; a row is only inserted when no matching attempt exists.
+    """
+
+    since = datetime.utcnow() - HISTORY_DEDUPE_WINDOW
+    writer = get_write_behind()
+    if writer is not None:
+        # 刚判完的答题可能还在写入队列里：先在队列中找，不在请求路径上 flush。
+        for values in reversed(writer.queued(QuestionAttempt)):
+            if (
+                values["user_id"] == history.user_id
+                and values["expression_text"] == history.question_text
+                and values["user_answer"] == history.user_answer
+                and values["score_change"] == history.score
+                and values["created_at"] >= since
+            ):
+                return HistoryResponse(
+                    id=None,
+                    user_id=values["user_id"],
+                    question_text=values["expression_text"],
+                    user_answer=values["user_answer"],
+                    score=values["score_change"],
+                    correct_answer=values.get("correct_answer"),
+                    created_at=values["created_at"],
+                )
+
+    existing = db.execute(
+        _history_projection()
+        .where(
+            QuestionAttempt.user_id == history.user_id,
+            QuestionAttempt.expression_text == history.question_text,
+            QuestionAttempt.user_answer == history.user_answer,
+            QuestionAttempt.score_change == history.score,
+            QuestionAttempt.created_at >= since,
+        )
+        .order_by(QuestionAttempt.created_at.desc())
+        .limit(1)
+    ).first()
+    if existing is not None:
+        return HistoryResponse.model_validate(existing, from_attributes=True)
+
+    values = dict(
+        question_id=None,
+        user_id=history.user_id,
+        expression_text=history.question_text,
+        topic=None,
+        difficulty_level=None,
+        difficulty_score=0,
+        user_answer=history.user_answer,
+        is_correct=history.score > 0,
+        score_change=history.score,
+        attempt_index=0,
+        correct_answer=history.correct_answer,
+        created_at=datetime.utcnow(),
+    )
+    if writer is not None:
+        # 排队批量写入：此时还没有自增 id，响应里 id 为空。
+        writer.submit(db, QuestionAttempt, values)
+        db.commit()
+        return HistoryResponse(id=None, **history.model_dump(), created_at=values["created_at"])
+
+    db_attempt = QuestionAttempt(**values)
+    db.add(db_attempt)
+    db.flush()
+    attempt_id = db_attempt.id
     db.commit()
-    db.refresh(db_history)
-    return HistoryResponse.model_validate(db_history, from_attributes=True)
+    return HistoryResponse(id=attempt_id, **history.model_dump(), created_at=values["created_at"])
 
 
 def get_history_entries(
@@ -219,17 +496,21 @@ def get_history_entries(
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
 ) -> list[HistoryResponse]:
-    query = db.query(HistoryEntry).filter(HistoryEntry.user_id == user_id).order_by(HistoryEntry.created_at.desc())
+    query = (
+        _history_projection()
+        .where(QuestionAttempt.user_id == user_id)
+        .order_by(QuestionAttempt.created_at.desc())
+    )
     if min_score is not None:
-        query = query.filter(HistoryEntry.score >= min_score)
+        query = query.where(QuestionAttempt.score_change >= min_score)
     if date_from:
-        query = query.filter(HistoryEntry.created_at >= date_from)
+        query = query.where(QuestionAttempt.created_at >= date_from)
     if date_to:
         # If the client sends a date-only value (parsed as midnight), include the entire day by
         # filtering up to but not including the next day.
         if date_to.time() == datetime.min.time():
-            query = query.filter(HistoryEntry.created_at < date_to + timedelta(days=1))
+            query = query.where(QuestionAttempt.created_at < date_to + timedelta(days=1))
         else:
-            query = query.filter(HistoryEntry.created_at <= date_to)
-    histories = query.offset(offset).limit(limit).all()
-    return [HistoryResponse.model_validate(h, from_attributes=True) for h in histories]
+            query = query.where(QuestionAttempt.created_at <= date_to)
+    rows = db.execute(query.offset(offset).limit(limit)).all()
+    return HistoryResponseList.validate_python(rows, from_attributes=True)
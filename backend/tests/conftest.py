@@ -7,6 +7,8 @@ from sqlalchemy.pool import StaticPool
 
 from backend.database import Base, get_db
 from backend.main import app
+from backend.services import normalized_solution
+from backend.user_cache import get_user_cache
 import backend.models  # noqa: F401
 
 
@@ -32,6 +34,9 @@ def setup_test_db():
     app.dependency_overrides[get_db] = override_get_db
     Base.metadata.drop_all(bind=test_engine)
     Base.metadata.create_all(bind=test_engine)
+    # 每个用例都重建数据库，user id 会复用，缓存必须一起清空。
+    get_user_cache().clear()
+    normalized_solution.cache_clear()
     yield
     app.dependency_overrides.pop(get_db, None)
 
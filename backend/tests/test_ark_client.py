@@ -0,0 +1,196 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.ark_client import (
+    ArkCircuitOpenError,
+    ArkImageClient,
+    ArkImageError,
+    CircuitBreaker,
+    backoff_delay,
+)
+from backend.config import Settings
+
+
+class StubArk:
+    """Local HTTP/1.1 server answering with a scripted list of (status, body, delay)."""
+
+    def __init__(self):
+        self.script = []
+        self.requests = []
+        self.client_ports = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                stub.requests.append(
+                    {"body": json.loads(self.rfile.read(length)), "auth": self.headers["Authorization"]}
+                )
+                stub.client_ports.add(self.client_address[1])
+                status, body, delay = stub.script.pop(0) if stub.script else (200, None, 0)
+                if delay:
+                    time.sleep(delay)
+                payload = json.dumps(body or {"data": [{"url": "https://img.example/cat.png"}]}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v3/images/generations"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubArk()
+    yield server
+    server.close()
+
+
+def make_settings(stub, **overrides):
+    values = dict(
+        ark_api_key="test-key",
+        ark_base_url=stub.url,
+        ark_backoff_base_seconds=0.01,
+        ark_backoff_max_seconds=0.05,
+        ark_attempt_timeout_seconds=2.0,
+        ark_deadline_seconds=5.0,
+    )
+    values.update(overrides)
+    return Settings(**values)
+
+
+def run_with_client(settings, calls):
+    async def main():
+        async with ArkImageClient(settings, rng=random.Random(0)) as client:
+            return await calls(client)
+
+    return asyncio.run(main())
+
+
+def test_reuses_one_keepalive_connection(stub):
+    urls = run_with_client(make_settings(stub), lambda client: _sequential(client, 5))
+    assert urls == ["https://img.example/cat.png"] * 5
+    assert len(stub.requests) == 5
+    assert stub.requests[0]["auth"] == "Bearer test-key"
+    assert stub.requests[0]["body"]["prompt"] == "猫 0"
+    # 顺序调用全部复用同一条 keep-alive 连接。
+    assert len(stub.client_ports) == 1
+
+
+async def _sequential(client, count):
+    return [await client.generate_image(f"猫 {i}") for i in range(count)]
+
+
+def test_retries_transient_errors_then_succeeds(stub):
+    stub.script = [(503, {"error": "busy"}, 0), (429, {"error": "slow down"}, 0)]
+    url = run_with_client(make_settings(stub), lambda client: client.generate_image("猫"))
+    assert url == "https://img.example/cat.png"
+    assert len(stub.requests) == 3
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.script = [(400, {"error": "bad prompt"}, 0)]
+    with pytest.raises(ArkImageError, match="HTTP 400"):
+        run_with_client(make_settings(stub), lambda client: client.generate_image("猫"))
+    assert len(stub.requests) == 1
+
+
+def test_deadline_bounds_the_whole_call(stub):
+    stub.script = [(200, None, 1.0)] * 3
+    settings = make_settings(stub, ark_attempt_timeout_seconds=10.0)
+    start = time.monotonic()
+    with pytest.raises(ArkImageError, match="超时"):
+        run_with_client(settings, lambda client: client.generate_image("猫", deadline_seconds=0.3))
+    assert time.monotonic() - start < 0.9
+
+
+def test_breaker_opens_after_repeated_failures(stub):
+    stub.script = [(500, {"error": "down"}, 0)] * 4
+    settings = make_settings(stub, ark_max_retries=2, ark_breaker_failure_threshold=4)
+
+    async def calls(client):
+        for _ in range(2):
+            with pytest.raises(ArkImageError):
+                await client.generate_image("猫")
+        assert client.breaker.state == "open"
+        with pytest.raises(ArkCircuitOpenError):
+            await client.generate_image("猫")
+
+    run_with_client(settings, calls)
+    # 熔断后的调用不再打到服务端。
+    assert len(stub.requests) == 4
+
+
+def test_breaker_half_open_allows_one_trial():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 10.0
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_cancelled_trial_is_not_a_failure(stub):
+    stub.script = [(200, None, 1.0), (200, None, 1.0)]
+    now = [0.0]
+
+    async def calls(client):
+        client.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=lambda: now[0])
+        # 客户端断开导致的取消不计入连续失败。
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.generate_image("猫"), timeout=0.1)
+        assert client.breaker.state == "closed"
+
+        client.breaker.record_failure()
+        now[0] = 10.0
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.generate_image("猫"), timeout=0.1)
+        # 取消不是 Ark 的故障：不重新熔断，只归还试探名额，下一次试探立即放行。
+        assert client.breaker.state == "half_open"
+        assert client.breaker.allow()
+
+    run_with_client(make_settings(stub), calls)
+
+
+def test_backoff_is_capped_full_jitter():
+    rng = random.Random(1)
+    delays = [backoff_delay(attempt, 0.5, 4.0, rng) for attempt in range(1, 10)]
+    assert all(0 <= delay <= min(4.0, 0.5 * 2 ** (i)) for i, delay in enumerate(delays))
+    assert len(set(delays)) == len(delays)
+
+
+def test_missing_api_key(stub):
+    with pytest.raises(ArkImageError, match="ARK_API_KEY"):
+        run_with_client(make_settings(stub, ark_api_key=None), lambda client: client.generate_image("猫"))
+    assert stub.requests == []
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, false, insert, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+import backend.main as main
+from backend.class_sets import ClassSetStore, assign_class_set, generate_class_set
+from backend.migrations import MIGRATIONS, run_migrations
+from backend.models import ClassSetItem, Question
+from backend.services import normalized_solution
+
+client = TestClient(main.app)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = ClassSetStore(size=5)
+    monkeypatch.setattr(main, "get_class_set_store", lambda: store)
+    return store
+
+
+def _login(name: str, class_name: str = "七年级1班") -> int:
+    resp = client.post("/api/login", json={"chinese_name": name, "english_name": name, "class_name": class_name})
+    return resp.json()["userId"]
+
+
+def _assign(user_id: int, seed: int = 1) -> dict:
+    resp = client.post("/api/class_sets/assign", json={"userId": user_id, "difficultyLevel": "basic", "seed": seed})
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_seeded_generation_is_reproducible():
+    first = generate_class_set("C1", "basic", 7, 5)
+    second = generate_class_set("C1", "basic", 7, 5)
+    assert [q.expression_text for q in first] == [q.expression_text for q in second]
+    assert [q.topic for q in first] == ["add_sub", "mul_div", "poly_ops", "factorization", "mixed_ops"]
+
+
+def test_class_shares_one_generated_set(store, db_session):
+    alice, bob = _login("Alice"), _login("Bob")
+    first = _assign(alice)
+    second = _assign(bob)
+
+    assert first["className"] == "七年级1班" and first["seed"] == 1
+    texts = [q["expressionText"] for q in first["questions"]]
+    assert texts == [q["expressionText"] for q in second["questions"]]
+    assert len(texts) == 5 and all("solutionExpression" not in q for q in first["questions"])
+    # 题面共享，题目行按学生分开。
+    assert {q["questionId"] for q in first["questions"]}.isdisjoint(q["questionId"] for q in second["questions"])
+    assert store.stats()["generated"] == 1 and store.stats()["hits"] == 1
+    assert db_session.query(ClassSetItem).count() == 5
+
+    # 重复请求返回同一批题目行，不重复写入。
+    assert _assign(alice)["questions"] == first["questions"]
+    assert db_session.query(Question).filter_by(user_id=alice).count() == 5
+
+
+def test_other_worker_loads_the_stored_set(store, monkeypatch):
+    first = _assign(_login("Alice"))
+    other_worker = ClassSetStore(size=5)
+    monkeypatch.setattr(main, "get_class_set_store", lambda: other_worker)
+    second = _assign(_login("Carol"))
+    assert [q["expressionText"] for q in second["questions"]] == [q["expressionText"] for q in first["questions"]]
+    assert other_worker.stats() == {"sets": 1, "hits": 0, "loaded": 1, "generated": 0}
+
+
+def test_grading_reuses_the_parsed_solution(store, db_session):
+    students = [_login("Alice"), _login("Bob")]
+    sheets = [_assign(user_id) for user_id in students]
+    for user_id, sheet in zip(students, sheets):
+        question = sheet["questions"][0]
+        solution = db_session.get(Question, question["questionId"]).solution_expression
+        resp = client.post(
+            "/api/check_answer",
+            json={
+                "userId": user_id,
+                "questionId": question["questionId"],
+                "expressionText": question["expressionText"],
+                "topic": question["topic"],
+                "difficultyLevel": question["difficultyLevel"],
+                "userAnswer": solution,
+            },
+        )
+        assert resp.json()["isCorrect"] and resp.json()["newTotalScore"] == 1
+    info = normalized_solution.cache_info()
+    assert info.misses == 1 and info.hits == 1
+
+
+def test_unknown_student_is_404(store):
+    resp = client.post("/api/class_sets/assign", json={"userId": 9999, "difficultyLevel": "basic"})
+    assert resp.status_code == 404
+
+
+def test_racing_assignment_reuses_the_rows_already_written(store, db_session, monkeypatch):
+    user_id = _login("Alice")
+    first = _assign(user_id)
+    items = store.get(db_session, "七年级1班", "basic", 1)
+
+    # 模拟并发请求：查找时还没看到对方写入的题目行。
+    real_execute = db_session.execute
+    lookups = []
+
+    def stale_first_lookup(statement, *args, **kwargs):
+        if not lookups:
+            lookups.append(statement)
+            return real_execute(statement.where(false()), *args, **kwargs)
+        return real_execute(statement, *args, **kwargs)
+
+    monkeypatch.setattr(db_session, "execute", stale_first_lookup)
+    assigned = assign_class_set(db_session, user_id, items)
+    assert [question_id for question_id, _ in assigned] == [q["questionId"] for q in first["questions"]]
+    assert db_session.query(Question).filter_by(user_id=user_id).count() == 5
+
+    with pytest.raises(IntegrityError):
+        real_execute(
+            insert(Question),
+            {
+                "question_id": "duplicate",
+                "user_id": user_id,
+                "expression_text": "x",
+                "solution_expression": "x",
+                "topic": "add_sub",
+                "difficulty_level": "basic",
+                "difficulty_score": 1,
+                "class_item_id": items[0].id,
+            },
+        )
+
+
+def test_migration_detaches_duplicate_class_questions(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'duplicates.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE questions (question_id VARCHAR PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "class_item_id INTEGER)"
+        ))
+        conn.execute(text(
+            "INSERT INTO questions VALUES ('a', 1, 7), ('b', 1, 7), ('c', 2, 7), ('d', 1, NULL), ('e', 1, NULL)"
+        ))
+        conn.execute(text(f"PRAGMA user_version = {len(MIGRATIONS) - 1}"))
+
+    assert run_migrations(engine) == len(MIGRATIONS)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT question_id, class_item_id FROM questions ORDER BY question_id")).all()
+    assert rows == [("a", 7), ("b", None), ("c", 7), ("d", None), ("e", None)]
+    assert "ux_questions_user_class_item" in {ix["name"] for ix in inspect(engine).get_indexes("questions")}
+    engine.dispose()
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.benchmarks.classroom import ClassroomConfig, EndpointStats, expected_answer, run_classroom
+from backend.database import Base, get_db
+from backend.main import app
+from backend.services import compare_expressions, normalize_expr
+
+
+def test_expected_answer_is_graded_correct():
+    expression = "(2x + 3) - (x - 1)"
+    assert compare_expressions(normalize_expr(expected_answer(expression)), normalize_expr("x+4"))
+
+
+def test_percentiles_use_nearest_rank():
+    stats = EndpointStats(latencies=[0.001 * i for i in range(1, 101)])
+    assert stats.percentile(50) == 0.05
+    assert stats.percentile(99) == 0.099
+    assert EndpointStats().percentile(95) == 0.0
+
+
+def test_small_classroom_runs_the_full_flow(tmp_path):
+    # 模拟学生并发请求，共享一条连接的内存库会互相打断事务，改用文件库。
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'classroom.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def file_db():
+        with factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = file_db
+    config = ClassroomConfig(
+        students=3,
+        duration=0.5,
+        think_time=(0.0, 0.0),
+        correct_rate=1.0,
+        buy_rate=1.0,
+        topics={"add_sub": 1.0},
+        difficulties={"basic": 1.0},
+        seed=7,
+    )
+    transport = httpx.ASGITransport(app=app)
+    try:
+        report = asyncio.run(run_classroom("http://classroom", config, transport=transport))
+    finally:
+        engine.dispose()
+
+    data = report.as_dict()
+    assert data["errors"] == 0
+    endpoints = data["endpoints"]
+    assert endpoints["POST /api/login"]["count"] == 3
+    assert endpoints["POST /api/check_answer"]["count"] == endpoints["POST /api/generate_question"]["count"]
+    assert endpoints["GET /api/history"]["count"] >= 3
+    assert "req/s" in report.format_table()
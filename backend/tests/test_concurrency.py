@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.foods import FOOD_MAP
+from backend.models import FoodPurchase, Question, QuestionAttempt, User
+from backend.services import MAX_ATTEMPTS_PER_QUESTION, process_answer, purchase_food
+
+WORKERS = 8
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    # Real concurrency needs separate connections, so use a file database
+    # instead of the shared in-memory StaticPool from conftest.
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'concurrency.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    yield factory
+    engine.dispose()
+
+
+def _create_user(factory, total_score: int) -> int:
+    with factory() as db:
+        user = User(chinese_name="并发", english_name="Racer", class_name="C1", total_score=total_score)
+        db.add(user)
+        db.commit()
+        return user.id
+
+
+def _create_question(factory, user_id: int) -> str:
+    question_id = str(uuid.uuid4())
+    with factory() as db:
+        db.add(
+            Question(
+                question_id=question_id,
+                user_id=user_id,
+                expression_text="(x+1) + (x+2)",
+                solution_expression="2*x + 3",
+                topic="add_sub",
+                difficulty_level="basic",
+                difficulty_score=10,
+            )
+        )
+        db.commit()
+    return question_id
+
+
+def _answer(factory, user_id: int, question_id: str, answer: str) -> bool:
+    with factory() as db:
+        user = db.get(User, user_id)
+        question = db.get(Question, question_id)
+        try:
+            process_answer(db, question, user, answer)
+        except ValueError:
+            return False
+        return True
+
+
+def test_concurrent_purchases_never_overspend(file_session_factory):
+    food = FOOD_MAP["basic-kibble"]
+    user_id = _create_user(file_session_factory, total_score=food.price * 10)
+
+    def buy(_: int) -> bool:
+        with file_session_factory() as db:
+            try:
+                purchase_food(db, user_id, food)
+            except ValueError:
+                return False
+            return True
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(buy, range(25)))
+
+    assert results.count(True) == 10
+    with file_session_factory() as db:
+        assert db.get(User, user_id).total_score == 0
+        purchases = db.query(func.count(FoodPurchase.id)).filter(FoodPurchase.user_id == user_id).scalar()
+        assert purchases == 10
+
+
+def test_double_submit_cannot_exceed_attempt_limit(file_session_factory):
+    user_id = _create_user(file_session_factory, total_score=10)
+    question_id = _create_question(file_session_factory, user_id)
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(lambda _: _answer(file_session_factory, user_id, question_id, "0"), range(12)))
+
+    assert results.count(True) == MAX_ATTEMPTS_PER_QUESTION
+    with file_session_factory() as db:
+        question = db.get(Question, question_id)
+        assert question.attempts_used == MAX_ATTEMPTS_PER_QUESTION
+        attempts = db.query(QuestionAttempt).filter(QuestionAttempt.question_id == question_id).all()
+        assert sorted(a.attempt_index for a in attempts) == [1, 2, 3]
+        # Only the final wrong attempt costs a point.
+        assert db.get(User, user_id).total_score == 9
+
+
+def test_concurrent_correct_answers_do_not_lose_score(file_session_factory):
+    user_id = _create_user(file_session_factory, total_score=0)
+    question_ids = [_create_question(file_session_factory, user_id) for _ in range(16)]
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(lambda qid: _answer(file_session_factory, user_id, qid, "2x+3"), question_ids))
+
+    assert all(results)
+    with file_session_factory() as db:
+        assert db.get(User, user_id).total_score == len(question_ids)
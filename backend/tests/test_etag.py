@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, update
+
+from backend.main import app
+from backend.models import User
+
+from conftest import test_engine
+
+client = TestClient(app)
+
+
+@contextmanager
+def count_statements():
+    statements: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(test_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _login() -> int:
+    resp = client.post(
+        "/api/login",
+        json={"chinese_name": "标签", "english_name": "Etag", "class_name": "E1"},
+    )
+    return resp.json()["userId"]
+
+
+def test_summary_revalidates_with_one_version_query():
+    user_id = _login()
+    first = client.get(f"/api/users/{user_id}/summary")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert client.get(f"/api/users/{user_id}/summary").json() == first.json()
+
+    with count_statements() as statements:
+        resp = client.get(f"/api/users/{user_id}/summary", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+    assert resp.headers["etag"] == etag
+    assert len(statements) == 1
+    assert "state_version" in statements[0]
+
+
+def test_purchases_and_new_questions_change_etags(db_session):
+    user_id = _login()
+    summary_etag = client.get(f"/api/users/{user_id}/summary").headers["etag"]
+    recent_etag = client.get(f"/api/users/{user_id}/recent_questions").headers["etag"]
+    assert summary_etag != recent_etag
+
+    client.post(
+        "/api/generate_question",
+        json={"userId": user_id, "topic": "add_sub", "difficultyLevel": "basic"},
+    )
+    resp = client.get(f"/api/users/{user_id}/recent_questions", headers={"If-None-Match": recent_etag})
+    assert resp.status_code == 200
+    assert len(resp.json()["questions"]) == 1
+
+    db_session.execute(update(User).where(User.id == user_id).values(total_score=10))
+    db_session.commit()
+    summary_etag = client.get(f"/api/users/{user_id}/summary").headers["etag"]
+    client.post("/api/buy_food", json={"userId": user_id, "foodId": "basic-kibble"})
+    resp = client.get(f"/api/users/{user_id}/summary", headers={"If-None-Match": summary_etag})
+    assert resp.status_code == 200
+    assert resp.json()["catScore"] == 5
+    assert resp.headers["etag"] != summary_etag
+
+
+def test_unknown_user_is_404_even_with_etag():
+    resp = client.get("/api/users/999/summary", headers={"If-None-Match": '"summary-999-0"'})
+    assert resp.status_code == 404
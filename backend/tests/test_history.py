@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+from backend.main import app
+from backend.migrations import MIGRATIONS, run_migrations
+from backend.models import QuestionAttempt
+
+client = TestClient(app)
+
+
+def _login(suffix: str) -> int:
+    resp = client.post(
+        "/api/login",
+        json={"chinese_name": f"历史{suffix}", "english_name": f"History{suffix}", "class_name": "H1"},
+    )
+    return resp.json()["userId"]
+
+
+def _new_question(user_id: int) -> dict:
+    return client.post(
+        "/api/generate_question",
+        json={"userId": user_id, "topic": "add_sub", "difficultyLevel": "basic"},
+    ).json()
+
+
+def _answer(user_id: int, question: dict, answer: str) -> dict:
+    resp = client.post(
+        "/api/check_answer",
+        json={
+            "userId": user_id,
+            "questionId": question["questionId"],
+            "expressionText": question["expressionText"],
+            "topic": question["topic"],
+            "difficultyLevel": question["difficultyLevel"],
+            "userAnswer": answer,
+        },
+    )
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_history_is_served_from_attempts():
+    user_id = _login("Read")
+    question = _new_question(user_id)
+    for _ in range(3):
+        result = _answer(user_id, question, "0")
+
+    resp = client.get("/api/history", params={"user_id": user_id})
+    assert resp.status_code == 200
+    rows = resp.json()
+    assert len(rows) == 3
+    latest = rows[0]
+    assert latest["question_text"] == question["expressionText"]
+    assert latest["user_answer"] == "0"
+    assert latest["score"] == -1
+    assert latest["correct_answer"] == result["solutionExpression"]
+    assert [row["correct_answer"] for row in rows[1:]] == [None, None]
+
+    resp = client.get("/api/history", params={"user_id": user_id, "min_score": 0})
+    assert len(resp.json()) == 2
+
+    today = datetime.utcnow().date().isoformat()
+    resp = client.get("/api/history", params={"user_id": user_id, "date_to": today})
+    assert len(resp.json()) == 3
+    resp = client.get("/api/history", params={"user_id": user_id, "date_from": "2100-01-01"})
+    assert resp.json() == []
+
+
+def test_posting_history_after_an_answer_does_not_duplicate(db_session):
+    user_id = _login("Dedupe")
+    question = _new_question(user_id)
+    result = _answer(user_id, question, "0")
+
+    resp = client.post(
+        "/api/history",
+        json={
+            "user_id": user_id,
+            "question_text": question["expressionText"],
+            "user_answer": "0",
+            "score": result["scoreChange"],
+        },
+    )
+    assert resp.status_code == 200
+    assert resp.json()["id"] is not None
+    assert db_session.query(QuestionAttempt).filter_by(user_id=user_id).count() == 1
+
+
+def test_posting_unknown_history_inserts_an_attempt(db_session):
+    user_id = _login("Manual")
+    resp = client.post(
+        "/api/history",
+        json={"user_id": user_id, "question_text": "2x+x", "user_answer": "3x", "score": 1},
+    )
+    assert resp.status_code == 200
+    created = resp.json()
+
+    rows = client.get("/api/history", params={"user_id": user_id}).json()
+    assert [row["id"] for row in rows] == [created["id"]]
+    assert rows[0]["question_text"] == "2x+x"
+    # 没有对应的题目：不编造题目编号。
+    attempt = db_session.get(QuestionAttempt, created["id"])
+    assert attempt.question_id is None and attempt.topic is None
+
+
+def test_migration_folds_legacy_history(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE question_attempts (id INTEGER PRIMARY KEY, question_id VARCHAR NOT NULL, "
+            "user_id INTEGER NOT NULL, expression_text VARCHAR NOT NULL, topic VARCHAR NOT NULL, "
+            "difficulty_level VARCHAR NOT NULL, difficulty_score INTEGER NOT NULL, "
+            "user_answer VARCHAR NOT NULL, is_correct BOOLEAN, score_change INTEGER, "
+            "attempt_index INTEGER NOT NULL, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE history_entries (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "question_text VARCHAR NOT NULL, user_answer VARCHAR NOT NULL, score INTEGER NOT NULL, "
+            "correct_answer VARCHAR, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO question_attempts VALUES "
+            "(1, 'q1', 7, 'x+x', 'add_sub', 'basic', 5, '0', 0, -1, 3, '2024-03-01 08:00:00.000000')"
+        ))
+        conn.execute(text(
+            "INSERT INTO history_entries VALUES "
+            "(1, 7, 'x+x', '0', -1, '2*x', '2024-03-01 08:00:01.000000'), "
+            "(2, 7, 'y+y', '2y', 1, NULL, '2023-09-01 09:00:00.000000')"
+        ))
+
+    assert run_migrations(engine) == len(MIGRATIONS)
+    assert run_migrations(engine) == len(MIGRATIONS)
+
+    tables = inspect(engine).get_table_names()
+    assert "history_entries" not in tables and "history_entries_retired" in tables
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT question_id, topic, expression_text, score_change, correct_answer "
+            "FROM question_attempts ORDER BY created_at"
+        )).all()
+        assert conn.execute(text("SELECT COUNT(*) FROM history_entries_retired")).scalar() == 2
+    assert rows == [
+        (None, None, "y+y", 1, None),
+        ("q1", "add_sub", "x+x", -1, "2*x"),
+    ]
+    assert {ix["name"] for ix in inspect(engine).get_indexes("question_attempts")} >= {
+        "ix_question_attempts_user_created"
+    }
+    engine.dispose()
+
+
+def test_concurrent_workers_migrate_once(tmp_path):
+    path = tmp_path / "workers.db"
+    with create_engine(f"sqlite:///{path}").begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE question_attempts (id INTEGER PRIMARY KEY, question_id VARCHAR NOT NULL, "
+            "user_id INTEGER NOT NULL, expression_text VARCHAR NOT NULL, topic VARCHAR NOT NULL, "
+            "difficulty_level VARCHAR NOT NULL, difficulty_score INTEGER NOT NULL, "
+            "user_answer VARCHAR NOT NULL, is_correct BOOLEAN, score_change INTEGER, "
+            "attempt_index INTEGER NOT NULL, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE history_entries (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "question_text VARCHAR NOT NULL, user_answer VARCHAR NOT NULL, score INTEGER NOT NULL, "
+            "correct_answer VARCHAR, created_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO history_entries VALUES (1, 7, 'y+y', '2y', 1, NULL, '2023-09-01 09:00:00')"))
+
+    # 模拟多个 uvicorn worker 同时启动：每个 worker 一个引擎。
+    engines = [create_engine(f"sqlite:///{path}", connect_args={"timeout": 30}) for _ in range(4)]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        versions = list(pool.map(run_migrations, engines))
+    assert versions == [len(MIGRATIONS)] * 4
+    with engines[0].connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM question_attempts")).scalar() == 1
+    for engine in engines:
+        engine.dispose()
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import backend.main as main
+from backend.database import Base, get_db
+from backend.foods import FOOD_MAP
+from backend.idempotency import IdempotencyInProgressError, IdempotencyMismatchError, IdempotencyStore
+from backend.models import FoodPurchase, IdempotencyRecord, Question, QuestionAttempt, User
+from backend.rate_limit import Budget, RateLimiter
+
+client = TestClient(main.app)
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    # 并发用例需要各自的连接，不能用 conftest 里共享的内存库。
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'idempotency.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    yield factory
+    engine.dispose()
+
+
+def _login(total_score: int, db_session) -> int:
+    user_id = client.post(
+        "/api/login", json={"chinese_name": "重试", "english_name": "Retry", "class_name": "C1"}
+    ).json()["userId"]
+    db_session.query(User).filter_by(id=user_id).update({"total_score": total_score})
+    db_session.commit()
+    return user_id
+
+
+def test_retried_answer_is_graded_once(db_session):
+    user_id = _login(0, db_session)
+    question = client.post(
+        "/api/generate_question", json={"userId": user_id, "topic": "factorization", "difficultyLevel": "basic"}
+    ).json()
+    body = {
+        "userId": user_id,
+        "questionId": question["questionId"],
+        "expressionText": question["expressionText"],
+        "topic": question["topic"],
+        "difficultyLevel": question["difficultyLevel"],
+        "userAnswer": "0",
+    }
+    headers = {"Idempotency-Key": "answer-1"}
+
+    first = client.post("/api/check_answer", json=body, headers=headers)
+    retry = client.post("/api/check_answer", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json() and retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+
+    db_session.expire_all()
+    assert db_session.get(Question, question["questionId"]).attempts_used == 1
+    assert db_session.query(QuestionAttempt).count() == 1
+
+    # 新的键才算一次新的作答；同一个键换了请求体直接拒绝。
+    assert client.post("/api/check_answer", json=body, headers={"Idempotency-Key": "answer-2"}).json()[
+        "attemptCount"
+    ] == 2
+    changed = client.post("/api/check_answer", json={**body, "userAnswer": "1"}, headers=headers)
+    assert changed.status_code == 422
+
+
+def test_retried_purchase_deducts_once_and_errors_are_not_stored(db_session):
+    user_id = _login(30, db_session)
+    body = {"userId": user_id, "foodId": "small-fish"}
+    first = client.post("/api/buy_food", json=body, headers={"Idempotency-Key": "buy-1"})
+    retry = client.post("/api/buy_food", json=body, headers={"Idempotency-Key": "buy-1"})
+    assert first.status_code == 200 and retry.json() == first.json()
+    assert db_session.query(FoodPurchase).count() == 1
+
+    feast = {"userId": user_id, "foodId": "feast"}
+    refused = client.post("/api/buy_food", json=feast, headers={"Idempotency-Key": "buy-2"})
+    assert refused.status_code == 400
+    assert db_session.query(IdempotencyRecord).filter(IdempotencyRecord.key.like("%buy-2")).count() == 0
+    db_session.query(User).filter_by(id=user_id).update({"total_score": 100})
+    db_session.commit()
+    # 被拒绝的请求没有执行完：同一个键重试时按新的积分重新执行。
+    bought = client.post("/api/buy_food", json=feast, headers={"Idempotency-Key": "buy-2"})
+    assert bought.status_code == 200 and "idempotent-replayed" not in bought.headers
+    replay = client.post("/api/buy_food", json=feast, headers={"Idempotency-Key": "buy-2"})
+    assert replay.json() == bought.json() and replay.headers["idempotent-replayed"] == "true"
+    assert db_session.query(FoodPurchase).count() == 2
+    assert client.post("/api/buy_food", json=feast, headers={"Idempotency-Key": ""}).status_code == 400
+
+
+def test_concurrent_duplicates_wait_for_the_first(file_session_factory, monkeypatch):
+    def override_get_db():
+        db = file_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(main.app.dependency_overrides, get_db, override_get_db)
+    with file_session_factory() as db:
+        user = User(chinese_name="并发", english_name="Twin", class_name="C1", total_score=30)
+        db.add(user)
+        db.commit()
+        user_id = user.id
+
+    calls = []
+    original = main.purchase_food
+
+    def slow_purchase(db, user_id, food, **kwargs):
+        calls.append(food.food_id)
+        time.sleep(0.3)
+        return original(db, user_id, food, **kwargs)
+
+    monkeypatch.setattr(main, "purchase_food", slow_purchase)
+
+    def buy(_):
+        return client.post(
+            "/api/buy_food", json={"userId": user_id, "foodId": "small-fish"}, headers={"Idempotency-Key": "twin"}
+        )
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(buy, range(4)))
+
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len({r.content for r in responses}) == 1
+    assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 3
+    assert len(calls) == 1
+    with file_session_factory() as db:
+        assert db.query(FoodPurchase).count() == 1
+
+
+def test_other_worker_polls_until_the_first_completes(file_session_factory):
+    first_worker = IdempotencyStore()
+    other_worker = IdempotencyStore(wait_timeout=5, poll_interval=0.01)
+    with file_session_factory() as db:
+        assert first_worker.begin(db, "k", "fp") is None
+
+    def finish():
+        time.sleep(0.2)
+        with file_session_factory() as db:
+            first_worker.complete(db, "k", 200, b'{"ok":true}')
+
+    threading.Thread(target=finish).start()
+    with file_session_factory() as db:
+        stored = other_worker.begin(db, "k", "fp")
+        assert (stored.status_code, stored.body) == (200, b'{"ok":true}')
+        with pytest.raises(IdempotencyMismatchError):
+            other_worker.begin(db, "k", "other")
+
+
+def test_unfinished_claims_time_out_and_expired_keys_are_reused(file_session_factory):
+    store = IdempotencyStore(ttl=0, wait_timeout=0.1)
+    with file_session_factory() as db:
+        assert store.begin(db, "k", "fp") is None
+        with pytest.raises(IdempotencyInProgressError):
+            IdempotencyStore(wait_timeout=0.1).begin(db, "k", "fp")
+        store.complete(db, "k", 200, b"{}")
+        # ttl 为 0：完成的记录立即过期，同一个键可以重新领取。
+        assert store.begin(db, "k", "fp") is None
+        store.abandon(db, "k")
+        assert store.begin(db, "k", "fp") is None
+
+
+def test_purchase_and_stored_response_commit_together(db_session, monkeypatch):
+    user_id = _login(30, db_session)
+    body = {"userId": user_id, "foodId": "small-fish"}
+    original = IdempotencyStore.complete
+
+    def failing_complete(self, db, key, status_code, body):
+        monkeypatch.setattr(IdempotencyStore, "complete", original)
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr(IdempotencyStore, "complete", failing_complete)
+    failed = TestClient(main.app, raise_server_exceptions=False).post(
+        "/api/buy_food", json=body, headers={"Idempotency-Key": "buy-atomic"}
+    )
+    assert failed.status_code == 500
+    # 响应没保存下来，扣分也随之回滚：重试只扣一次。
+    db_session.expire_all()
+    assert db_session.query(FoodPurchase).count() == 0 and db_session.get(User, user_id).total_score == 30
+    retry = client.post("/api/buy_food", json=body, headers={"Idempotency-Key": "buy-atomic"})
+    assert retry.status_code == 200 and "idempotent-replayed" not in retry.headers
+    db_session.expire_all()
+    assert db_session.query(FoodPurchase).count() == 1
+    assert db_session.get(User, user_id).total_score == 30 - FOOD_MAP["small-fish"].price
+
+
+def test_claim_taken_over_after_timeout_is_not_committed(file_session_factory):
+    slow_worker = IdempotencyStore()
+    with file_session_factory() as db:
+        assert slow_worker.begin(db, "k", "fp") is None
+        # 首个请求超过占位有效期仍未完成：重试请求重新领取并执行。
+        db.query(IdempotencyRecord).update({"expires_at": IdempotencyRecord.created_at})
+        db.commit()
+        retry_worker = IdempotencyStore()
+        assert retry_worker.begin(db, "k", "fp") is None
+
+        db.add(User(chinese_name="超时", english_name="Late", class_name="C1"))
+        with pytest.raises(IdempotencyInProgressError):
+            slow_worker.complete(db, "k", 200, b"{}")
+        assert db.query(User).count() == 0
+        slow_worker.abandon(db, "k")
+        # 放弃也只删除自己的占位，不影响接手的请求。
+        retry_worker.complete(db, "k", 200, b'{"ok":true}')
+        assert IdempotencyStore().begin(db, "k", "fp").body == b'{"ok":true}'
+
+
+def test_replays_do_not_spend_the_rate_limit(db_session, tmp_path, monkeypatch):
+    limiter = RateLimiter(tmp_path / "rate_limit.db", {"check": Budget(capacity=1, per_second=0.01), "generate": Budget(10, 1)})
+    monkeypatch.setattr(main, "get_rate_limiter", lambda: limiter)
+    user_id = _login(0, db_session)
+    question = client.post(
+        "/api/generate_question", json={"userId": user_id, "topic": "factorization", "difficultyLevel": "basic"}
+    ).json()
+    body = {
+        "userId": user_id,
+        "questionId": question["questionId"],
+        "expressionText": question["expressionText"],
+        "topic": question["topic"],
+        "difficultyLevel": question["difficultyLevel"],
+        "userAnswer": "0",
+    }
+    try:
+        first = client.post("/api/check_answer", json=body, headers={"Idempotency-Key": "limited"})
+        retry = client.post("/api/check_answer", json=body, headers={"Idempotency-Key": "limited"})
+        assert first.status_code == retry.status_code == 200
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert client.post("/api/check_answer", json=body, headers={"Idempotency-Key": "next"}).status_code == 429
+    finally:
+        limiter.close()
@@ -0,0 +1,103 @@
+import asyncio
+
+from backend.ark_client import ArkImageError
+from backend.config import Settings
+from backend.image_cache import ImageCache, image_cache_key
+
+
+class FakeArk:
+    def __init__(self, settings=None, fail=False):
+        self.settings = settings or Settings(ark_api_key="test-key")
+        self.fail = fail
+        self.calls = []
+        self.downloads = []
+
+    async def generate_image(self, prompt):
+        self.calls.append(prompt)
+        await asyncio.sleep(0.05)
+        if self.fail:
+            raise ArkImageError("boom")
+        return f"https://img.example/{len(self.calls)}.png"
+
+    async def download(self, url):
+        self.downloads.append(url)
+        return b"\x89PNG" + url.encode()
+
+
+def test_key_depends_on_prompt_and_output_settings():
+    base = Settings(ark_model="m1", ark_image_size="2K", ark_watermark=True)
+    key = image_cache_key("小猫", base)
+    assert key == image_cache_key("小猫", Settings(ark_model="m1", ark_image_size="2K", ark_watermark=True))
+    assert key != image_cache_key("小狗", base)
+    assert key != image_cache_key("小猫", Settings(ark_model="m1", ark_image_size="1K", ark_watermark=True))
+    assert key != image_cache_key("小猫", Settings(ark_model="m1", ark_image_size="2K", ark_watermark=False))
+
+
+def test_concurrent_identical_prompts_share_one_generation(tmp_path):
+    cache = ImageCache(tmp_path)
+    ark = FakeArk()
+
+    async def main():
+        return await asyncio.gather(*[cache.generate(ark, "小猫") for _ in range(5)], cache.generate(ark, "小狗"))
+
+    results = asyncio.run(main())
+    assert ark.calls == ["小猫", "小狗"]
+    assert len({image.url for image in results[:5]}) == 1
+    assert (cache.misses, cache.coalesced) == (2, 4)
+
+    again = asyncio.run(cache.generate(ark, "小猫"))
+    assert again.url == results[0].url
+    assert cache.hits == 1 and len(ark.calls) == 2
+
+
+def test_failure_is_shared_and_not_cached(tmp_path):
+    cache = ImageCache(tmp_path)
+    ark = FakeArk(fail=True)
+
+    async def main():
+        return await asyncio.gather(*[cache.generate(ark, "小猫") for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ArkImageError) for result in results)
+    assert len(ark.calls) == 1
+
+    ark.fail = False
+    assert asyncio.run(cache.generate(ark, "小猫")).url.startswith("https://")
+    assert len(ark.calls) == 2
+
+
+def test_stores_bytes_and_survives_restart(tmp_path):
+    ark = FakeArk()
+    image = asyncio.run(ImageCache(tmp_path, store_bytes=True).generate(ark, "小猫"))
+    assert image.path.read_bytes().startswith(b"\x89PNG")
+
+    reopened = ImageCache(tmp_path, store_bytes=True)
+    assert asyncio.run(reopened.generate(ark, "小猫")).path == image.path
+    assert len(ark.calls) == 1 and len(ark.downloads) == 1
+
+
+def test_lru_eviction_removes_files(tmp_path):
+    cache = ImageCache(tmp_path, max_entries=2, store_bytes=True)
+    ark = FakeArk()
+    first = asyncio.run(cache.generate(ark, "a"))
+    asyncio.run(cache.generate(ark, "b"))
+    asyncio.run(cache.generate(ark, "a"))  # 访问 a，b 变成最久未用
+    asyncio.run(cache.generate(ark, "c"))
+
+    assert len(cache) == 2 and cache.evictions == 1
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == sorted(
+        f"{image_cache_key(prompt, ark.settings)}.json" for prompt in ("a", "c")
+    )
+    assert first.path.exists()
+
+
+def test_url_only_entries_expire(tmp_path):
+    cache = ImageCache(tmp_path, url_ttl=60)
+    ark = FakeArk()
+    image = asyncio.run(cache.generate(ark, "小猫"))
+    meta = tmp_path / f"{image.key}.json"
+    meta.write_text(meta.read_text().replace(str(image.created_at), str(image.created_at - 120)))
+
+    assert cache.get(image.key) is None
+    asyncio.run(cache.generate(ark, "小猫"))
+    assert len(ark.calls) == 2
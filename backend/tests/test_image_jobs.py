@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.config import Settings
+from backend.database import Base
+from backend.image_jobs import ImageJobQueue, start_image_jobs, stop_image_jobs
+from backend.main import app
+from backend.models import ImageJob
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    # worker 在线程里访问数据库，用文件库让每个线程有自己的连接。
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'jobs.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+class FakeGenerator:
+    def __init__(self, failures=0, delay=0.05):
+        self.failures = failures
+        self.delay = delay
+        self.prompts = []
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Ark 暂时不可用")
+        return f"https://img.example/{len(self.prompts)}.png", f"key-{len(self.prompts)}"
+
+
+def job_settings(**overrides):
+    values = dict(
+        image_job_concurrency=2,
+        image_job_max_queue=10,
+        image_job_max_attempts=3,
+        image_job_retry_backoff_seconds=0.01,
+        image_job_poll_interval_seconds=0.05,
+    )
+    values.update(overrides)
+    return Settings(**values)
+
+
+def with_api(factory, generate, settings, scenario):
+    async def main():
+        start_image_jobs(factory, settings, generate)
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await scenario(client)
+        finally:
+            await stop_image_jobs()
+
+    return asyncio.run(main())
+
+
+def test_submit_returns_immediately_and_wait_returns_result(file_session_factory):
+    generate = FakeGenerator(delay=0.2)
+
+    async def scenario(client):
+        submitted = await client.post("/api/images/jobs", json={"prompt": "一只橘猫"})
+        assert submitted.status_code == 202
+        body = submitted.json()
+        assert body["status"] == "queued" and body["imageUrl"] is None
+
+        pending = await client.get(f"/api/images/jobs/{body['jobId']}")
+        assert pending.json()["status"] in ("queued", "running")
+        done = await client.get(f"/api/images/jobs/{body['jobId']}", params={"wait": 5})
+        return done.json()
+
+    result = with_api(file_session_factory, generate, job_settings(), scenario)
+    assert result["status"] == "succeeded"
+    assert result["imageUrl"] == "https://img.example/1.png"
+    assert result["attempts"] == 1 and result["finishedAt"] is not None
+    assert generate.prompts == ["一只橘猫"]
+
+
+def test_failed_generations_are_retried_then_marked_failed(file_session_factory):
+    async def scenario(client):
+        job_id = (await client.post("/api/images/jobs", json={"prompt": "猫"})).json()["jobId"]
+        return (await client.get(f"/api/images/jobs/{job_id}", params={"wait": 5})).json()
+
+    flaky = FakeGenerator(failures=2)
+    result = with_api(file_session_factory, flaky, job_settings(), scenario)
+    assert result["status"] == "succeeded" and result["attempts"] == 3
+
+    broken = FakeGenerator(failures=10)
+    result = with_api(file_session_factory, broken, job_settings(image_job_max_attempts=2), scenario)
+    assert result["status"] == "failed" and result["attempts"] == 2
+    assert "Ark 暂时不可用" in result["error"]
+
+
+def test_concurrency_limit_and_queue_depth(file_session_factory):
+    generate = FakeGenerator(delay=0.1)
+
+    async def scenario(client):
+        responses = [await client.post("/api/images/jobs", json={"prompt": f"猫 {i}"}) for i in range(4)]
+        job_ids = [resp.json()["jobId"] for resp in responses if resp.status_code == 202]
+        rejected = [resp for resp in responses if resp.status_code == 503]
+        results = [(await client.get(f"/api/images/jobs/{job_id}", params={"wait": 5})).json() for job_id in job_ids]
+        return results, rejected
+
+    settings = job_settings(image_job_concurrency=2, image_job_max_queue=3)
+    results, rejected = with_api(file_session_factory, generate, settings, scenario)
+    assert len(results) == 3 and all(result["status"] == "succeeded" for result in results)
+    assert len(rejected) == 1 and rejected[0].headers["retry-after"] == "5"
+    assert generate.peak == 2
+
+
+def test_stale_running_job_is_reclaimed(file_session_factory):
+    with file_session_factory() as db:
+        db.add(
+            ImageJob(
+                id="orphan", prompt="猫", status="running", attempts=1,
+                started_at=datetime.utcnow() - timedelta(hours=1),
+            )
+        )
+        db.commit()
+    queue = ImageJobQueue(file_session_factory, FakeGenerator(), stale_after=60)
+
+    async def main():
+        queue.start()
+        try:
+            return await queue.wait("orphan", 5)
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(main())
+    assert job.status == "succeeded" and job.attempts == 2
+
+
+def test_endpoints_unavailable_when_disabled():
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/images/jobs", json={"prompt": "猫"}), await client.get(
+                "/api/images/jobs/missing"
+            )
+
+    submitted, status = asyncio.run(main())
+    assert submitted.status_code == 503 and status.status_code == 503
@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import struct
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.image_jobs as image_jobs
+import backend.main as main
+from backend.config import Settings
+from backend.image_cache import CachedImage
+from backend.image_mirror import ImageMirror, sniff_extension
+
+
+def make_png(width: int, height: int) -> bytes:
+    """A valid RGB PNG built without Pillow."""
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    raw = b"".join(
+        b"\x00" + b"".join(bytes([(x + y) % 256, x % 256, y % 256]) for x in range(width)) for y in range(height)
+    )
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    mirror = ImageMirror(tmp_path, thumbnail_size=16, web_size=64)
+    monkeypatch.setattr(main, "get_image_mirror", lambda: mirror)
+    return mirror
+
+
+def test_store_is_content_addressed_and_idempotent(mirror):
+    data = make_png(8, 8)
+    first = mirror.store(data)
+    assert first.digest == hashlib.sha256(data).hexdigest()
+    assert first.files["original"].name == "original.png"
+    assert mirror.store(data).files["original"] == first.files["original"]
+    assert len(list(mirror.directory.iterdir())) == 1
+    assert sniff_extension(b"\xff\xd8\xff\xe0") == "jpg"
+    assert sniff_extension(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+
+
+def test_serves_with_immutable_cache_headers(mirror):
+    data = make_png(8, 8)
+    image = mirror.store(data)
+    client = TestClient(main.app)
+
+    resp = client.get(image.url())
+    assert resp.status_code == 200 and resp.content == data
+    assert resp.headers["content-type"] == "image/png"
+    assert resp.headers["cache-control"] == "public, max-age=31536000, immutable"
+    etag = resp.headers["etag"]
+    assert image.digest in etag
+
+    revalidated = client.get(image.url(), headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+
+    assert client.get(f"/api/images/{'0' * 64}/original").status_code == 404
+    assert client.get(f"/api/images/{image.digest}/huge").status_code == 404
+    assert client.get("/api/images/..%2F..%2Fetc/original").status_code == 404
+
+
+def test_variants_resized_to_webp(mirror):
+    pytest.importorskip("PIL")
+    from PIL import Image
+
+    image = mirror.store(make_png(200, 100))
+    client = TestClient(main.app)
+    for variant, longest in (("thumb", 16), ("web", 64)):
+        resp = client.get(image.url(variant))
+        assert resp.headers["content-type"] == "image/webp"
+        with Image.open(mirror.file_for(image.digest, variant)) as decoded:
+            assert decoded.format == "WEBP" and max(decoded.size) == longest
+        assert len(resp.content) < len(make_png(200, 100))
+
+
+def test_variant_falls_back_to_original_without_pillow(mirror, monkeypatch):
+    monkeypatch.setattr("backend.image_mirror.Image", None)
+    data = make_png(8, 8)
+    image = mirror.store(data)
+    client = TestClient(main.app)
+    resp = client.get(image.url("thumb"))
+    assert resp.status_code == 200 and resp.content == data
+    assert resp.headers["cache-control"] == "no-store"
+    assert client.get(image.url()).headers["cache-control"] == "public, max-age=31536000, immutable"
+
+
+def test_job_pipeline_mirrors_generated_image(mirror, monkeypatch):
+    data = make_png(8, 8)
+
+    class FakeCache:
+        async def generate(self, client, prompt):
+            return CachedImage(key="cache-key", url="https://ark.example/expiring.png", created_at=0)
+
+    class FakeArk:
+        downloads = []
+
+        async def download(self, url):
+            self.downloads.append(url)
+            return data
+
+    ark = FakeArk()
+    monkeypatch.setattr(image_jobs, "get_image_cache", lambda: FakeCache())
+    monkeypatch.setattr(image_jobs, "get_ark_client", lambda: ark)
+    monkeypatch.setattr(image_jobs, "get_image_mirror", lambda: mirror)
+    monkeypatch.setattr(image_jobs, "get_settings", lambda: Settings(image_mirror_enabled=True))
+
+    url, key = asyncio.run(image_jobs.generate_cached("猫"))
+    assert url == f"/api/images/{hashlib.sha256(data).hexdigest()}/original"
+    assert key == "cache-key" and ark.downloads == ["https://ark.example/expiring.png"]
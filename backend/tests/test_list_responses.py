@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+
+client = TestClient(app)
+
+
+def _login() -> int:
+    resp = client.post(
+        "/api/login",
+        json={"chinese_name": "列表", "english_name": "Lists", "class_name": "L1"},
+    )
+    return resp.json()["userId"]
+
+
+def _post_history(user_id: int, count: int) -> None:
+    for i in range(count):
+        client.post(
+            "/api/history",
+            json={"user_id": user_id, "question_text": f"{i}x + {i}y", "user_answer": "0", "score": 0},
+        )
+
+
+def test_large_history_is_compressed():
+    user_id = _login()
+    _post_history(user_id, 30)
+
+    resp = client.get(
+        "/api/history", params={"user_id": user_id, "limit": 100}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["vary"] == "Accept-Encoding"
+    rows = resp.json()
+    assert len(rows) == 30
+    assert set(rows[0]) == {
+        "id", "user_id", "question_text", "user_answer", "score", "correct_answer", "created_at"
+    }
+
+
+def test_small_responses_stay_uncompressed():
+    user_id = _login()
+    _post_history(user_id, 1)
+
+    resp = client.get("/api/history", params={"user_id": user_id}, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert len(resp.json()) == 1
+
+
+def test_batch_questions_use_aliases_when_compressed():
+    resp = client.post(
+        "/api/questions/batch", json={"count": 10}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert resp.headers["content-encoding"] == "gzip"
+    question = resp.json()["questions"][0]
+    assert {"questionId", "difficultyLevel", "expressionLatex", "solutionExpression"} <= set(question)
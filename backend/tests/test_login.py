@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.main import app
+from backend.migrations import run_migrations
+from backend.models import User
+from backend.schemas import LoginRequest
+from backend.services import login_user
+
+client = TestClient(app)
+IDENTITY = {"chinese_name": "小明", "english_name": "Ming", "class_name": "7A"}
+
+
+def test_login_returns_same_user_on_repeat(db_session):
+    first = client.post("/api/login", json=IDENTITY).json()
+    second = client.post("/api/login", json=IDENTITY).json()
+    other = client.post("/api/login", json=IDENTITY | {"class_name": "7B"}).json()
+
+    assert first == second
+    assert first["total_score"] == 0
+    assert other["userId"] != first["userId"]
+    assert db_session.query(User).count() == 2
+
+
+def test_simultaneous_first_logins_create_one_user(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'login.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    def login(_: int) -> int:
+        with Session() as db:
+            return login_user(db, LoginRequest(**IDENTITY)).id
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ids = set(pool.map(login, range(32)))
+
+    assert len(ids) == 1
+    with Session() as db:
+        assert db.query(User).count() == 1
+    engine.dispose()
+
+
+def test_migration_merges_duplicate_users(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dupes.db'}")
+    with engine.begin() as conn:
+        # 旧库没有唯一索引：先按旧结构建表，再写入重复学生。
+        Base.metadata.create_all(bind=conn)
+        conn.execute(text("DROP INDEX ux_users_identity"))
+        conn.execute(text(
+            "INSERT INTO users (id, chinese_name, english_name, class_name, total_score) VALUES "
+            "(1, '小明', 'Ming', '7A', 5), (2, '小明', 'Ming', '7A', 7), (3, '小红', 'Hong', '7A', 1)"
+        ))
+        conn.execute(text(
+            "INSERT INTO food_purchases (user_id, food_id, food_name, cost) VALUES (2, 'milk', '牛奶', 8)"
+        ))
+
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        users = conn.execute(text("SELECT id, total_score, state_version FROM users ORDER BY id")).all()
+        purchase_owner = conn.execute(text("SELECT user_id FROM food_purchases")).scalar()
+    # 合并后的学生版本号递增，其他 worker 缓存的旧积分随之失效。
+    assert users == [(1, 12, 1), (3, 1, 0)]
+    assert purchase_owner == 1
+
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        assert login_user(db, LoginRequest(**IDENTITY)).id == 1
+    engine.dispose()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.metrics import COMPONENT_LATENCY, REQUESTS, Histogram, instrument_engine
+from conftest import test_engine
+
+client = TestClient(app)
+instrument_engine(test_engine)
+
+
+def _login() -> int:
+    resp = client.post(
+        "/api/login",
+        json={"chinese_name": "指标", "english_name": "Metrics", "class_name": "M1"},
+    )
+    return resp.json()["userId"]
+
+
+def test_metrics_expose_routes_and_components():
+    user_id = _login()
+    before_answers = REQUESTS.value("POST", "/api/check_answer", "200")
+    before_checks = COMPONENT_LATENCY.count("sympy_check")
+    before_commits = COMPONENT_LATENCY.count("db_commit")
+
+    question = client.post(
+        "/api/generate_question",
+        json={"userId": user_id, "topic": "add_sub", "difficultyLevel": "basic"},
+    ).json()
+    client.post(
+        "/api/check_answer",
+        json={
+            "userId": user_id,
+            "questionId": question["questionId"],
+            "expressionText": question["expressionText"],
+            "topic": question["topic"],
+            "difficultyLevel": question["difficultyLevel"],
+            "userAnswer": "0",
+        },
+    )
+    client.get(f"/api/users/{user_id}/summary")
+
+    assert REQUESTS.value("POST", "/api/check_answer", "200") == before_answers + 1
+    assert COMPONENT_LATENCY.count("sympy_check") == before_checks + 1
+    assert COMPONENT_LATENCY.count("db_commit") > before_commits
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    # 路由以模板为标签，而不是具体的 user_id。
+    assert 'route="/api/users/{user_id}/summary"' in body
+    assert f"/api/users/{user_id}/summary" not in body
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/api/check_answer",le="+Inf"}' in body
+    for component in ("sympy_generate", "sympy_check", "db_query", "db_commit"):
+        assert f'component_duration_seconds_count{{component="{component}"}}' in body
+    for gauge in ("process_resident_memory_bytes", "threadpool_busy_threads", "threadpool_queue_depth", "db_open_sessions"):
+        assert f"\n{gauge} " in body
+
+
+def test_unmatched_paths_share_one_label():
+    client.get("/does-not-exist/1")
+    client.get("/does-not-exist/2")
+    assert REQUESTS.value("GET", "unmatched", "404") >= 2
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("demo_seconds", "Demo.", ("kind",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "a")
+    lines = histogram.collect()
+    assert 'demo_seconds_bucket{kind="a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{kind="a",le="1"} 3' in lines
+    assert 'demo_seconds_bucket{kind="a",le="+Inf"} 4' in lines
+    assert 'demo_seconds_count{kind="a"} 4' in lines
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import threading
+
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+
+import backend.main as main
+import backend.practice as practice
+import backend.prefetch as prefetch
+from backend.main import app
+from backend.models import Question
+from backend.prefetch import QuestionPrefetcher
+
+client = TestClient(app)
+
+
+def _login() -> int:
+    resp = client.post(
+        "/api/login", json={"chinese_name": "预取", "english_name": "Prefetch", "class_name": "C1"}
+    )
+    return resp.json()["userId"]
+
+
+def _answer(question: dict, user_id: int, answer: str) -> dict:
+    resp = client.post(
+        "/api/practice/answer",
+        json={
+            "userId": user_id,
+            "questionId": question["questionId"],
+            "expressionText": question["expressionText"],
+            "topic": question["topic"],
+            "difficultyLevel": question["difficultyLevel"],
+            "userAnswer": answer,
+        },
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_take_uses_prefetched_question_and_falls_back_inline(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def fake_generate(topic, difficulty_level):
+        calls.append(threading.current_thread().name)
+        if threading.current_thread().name.startswith("question-prefetch"):
+            release.wait(5)
+        return f"{topic}-{difficulty_level}-{len(calls)}"
+
+    monkeypatch.setattr(prefetch, "_generate", fake_generate)
+    prefetcher = QuestionPrefetcher(workers=1, max_entries=2)
+    try:
+        prefetcher.schedule(1, "factorization", "basic")
+        prefetcher.schedule(1, "factorization", "basic")  # 已在准备中，不重复提交
+        release.set()
+        assert prefetcher.take(1, "factorization", "basic") == "factorization-basic-1"
+        assert prefetcher.take(1, "factorization", "basic") == "factorization-basic-2"
+        assert prefetcher.stats()["hits"] == 1 and prefetcher.stats()["misses"] == 1
+
+        for user_id in (1, 2, 3):
+            prefetcher.schedule(user_id, "add_sub", "basic")
+        assert prefetcher.stats()["pending"] == 2 and prefetcher.evictions == 1
+    finally:
+        prefetcher.shutdown()
+
+    # 关闭后（服务退出时仍在处理的请求）不再预取，也不抛异常。
+    prefetcher.schedule(4, "factorization", "basic")
+    assert prefetcher.stats()["pending"] == 2
+    assert prefetcher.take(4, "factorization", "basic").startswith("factorization-basic")
+
+
+def test_answer_returns_next_question_when_finished(db_session):
+    user_id = _login()
+    resp = client.post(
+        "/api/practice/next", json={"userId": user_id, "topic": "factorization", "difficultyLevel": "basic"}
+    )
+    assert resp.status_code == 200
+    question = resp.json()
+
+    wrong = _answer(question, user_id, "0")
+    assert not wrong["isCorrect"] and wrong["nextQuestion"] is None
+
+    solution = db_session.get(Question, question["questionId"]).solution_expression
+    right = _answer(question, user_id, solution)
+    assert right["isCorrect"] and right["newTotalScore"] == 1
+    following = right["nextQuestion"]
+    assert following["questionId"] != question["questionId"]
+    assert following["topic"] == "factorization" and following["difficultyLevel"] == "basic"
+
+    # 附带的下一题已入库，可以直接作答。
+    db_session.expire_all()
+    assert db_session.get(Question, following["questionId"]).user_id == user_id
+    assert _answer(following, user_id, "0")["attemptCount"] == 1
+
+
+def test_failed_next_question_still_returns_the_grade(db_session, monkeypatch):
+    user_id = _login()
+    question = client.post(
+        "/api/practice/next", json={"userId": user_id, "topic": "factorization", "difficultyLevel": "basic"}
+    ).json()
+
+    def broken_issue(*args):
+        raise RuntimeError("generator exploded")
+
+    monkeypatch.setattr(main, "issue_question", broken_issue)
+    solution = db_session.get(Question, question["questionId"]).solution_expression
+    right = _answer(question, user_id, solution)
+    assert right["isCorrect"] and right["newTotalScore"] == 1 and right["nextQuestion"] is None
+    db_session.expire_all()
+    assert db_session.get(Question, question["questionId"]).attempts_used == 1
+
+
+def test_exhausted_question_also_moves_on():
+    user_id = _login()
+    question = client.post(
+        "/api/practice/next", json={"userId": user_id, "topic": "factorization", "difficultyLevel": "basic"}
+    ).json()
+    for _ in range(3):
+        result = _answer(question, user_id, "0")
+    assert result["attemptCount"] == 3 and result["solutionExpression"]
+    assert result["nextQuestion"]["questionId"] != question["questionId"]
+
+
+def test_unknown_topic_is_rejected():
+    user_id = _login()
+    resp = client.post("/api/practice/next", json={"userId": user_id, "topic": "calculus", "difficultyLevel": "basic"})
+    assert resp.status_code == 400
+    assert client.post(
+        "/api/practice/next", json={"userId": 9999, "topic": "factorization", "difficultyLevel": "basic"}
+    ).status_code == 404
+
+
+def test_database_errors_are_not_reported_as_bad_requests(monkeypatch):
+    user_id = _login()
+
+    def broken_save(*args, **kwargs):
+        raise OperationalError("INSERT INTO questions", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(practice, "save_generated_question", broken_save)
+    resp = TestClient(app, raise_server_exceptions=False).post(
+        "/api/practice/next", json={"userId": user_id, "topic": "factorization", "difficultyLevel": "basic"}
+    )
+    assert resp.status_code == 500
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from starlette.websockets import WebSocketDisconnect
+
+from conftest import TestingSessionLocal, test_engine
+
+import backend.practice as practice
+import backend.prefetch as prefetch
+from backend.database import get_db
+from backend.main import app
+from backend.models import Question, User
+
+LOGIN = {"type": "login", "chinese_name": "练习", "english_name": "Socket", "class_name": "C1"}
+# factorization 生成只要几毫秒，测试里反复出题也不慢。
+NEXT = {"type": "next", "topic": "factorization", "difficultyLevel": "basic"}
+
+
+def _solution(db_session, question_id: str) -> str:
+    db_session.expire_all()
+    return db_session.get(Question, question_id).solution_expression
+
+
+def test_login_question_answer_and_auto_next(db_session):
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(LOGIN)
+        session = ws.receive_json()
+        assert session == {
+            "type": "session",
+            "userId": session["userId"],
+            "totalScore": 0,
+            "catScore": 0,
+            "currentCatStage": 1,
+            "nextStageScore": 51,
+        }
+
+        ws.send_json(NEXT)
+        question = ws.receive_json()
+        assert question["type"] == "question" and question["topic"] == "factorization"
+        assert question["expressionLatex"]
+
+        for attempt in (1, 2):
+            ws.send_json({"type": "answer", "userAnswer": "0"})
+            result = ws.receive_json()
+            assert result["type"] == "result" and result["attemptCount"] == attempt
+            assert not result["isCorrect"] and result["solutionExpression"] is None
+
+        solution = _solution(db_session, question["questionId"])
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+        event.listen(test_engine, "before_cursor_execute", listener)
+        try:
+            ws.send_json({"type": "answer", "userAnswer": solution})
+            result = ws.receive_json()
+            following = ws.receive_json()
+        finally:
+            event.remove(test_engine, "before_cursor_execute", listener)
+
+        assert result["isCorrect"] and result["scoreChange"] == 1 and result["newTotalScore"] == 1
+        # 答对后自动推送同一题型的下一题。
+        assert following["type"] == "question" and following["questionId"] != question["questionId"]
+        assert following["topic"] == "factorization" and following["difficultyLevel"] == "basic"
+        # 学生与题目都缓存在连接上：判题不再查询 users / questions。
+        selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+        assert selects == []
+
+
+def test_exhausted_question_reveals_solution_and_moves_on():
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(LOGIN)
+        ws.receive_json()
+        ws.send_json(NEXT)
+        first = ws.receive_json()
+        for _ in range(3):
+            ws.send_json({"type": "answer", "userAnswer": "0"})
+            result = ws.receive_json()
+        assert result["attemptCount"] == 3 and result["scoreChange"] == -1
+        assert result["solutionExpression"]
+        assert ws.receive_json()["questionId"] != first["questionId"]
+
+
+def test_failed_next_question_keeps_the_result_and_connection(db_session, monkeypatch):
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(LOGIN)
+        ws.receive_json()
+        ws.send_json(NEXT)
+        question = ws.receive_json()
+
+        def broken_generate(*args, **kwargs):
+            raise RuntimeError("generator exploded")
+
+        # 不用已预取好的下一题，让出题真正走到 generate_question。
+        monkeypatch.setattr(practice, "get_question_prefetcher", lambda: prefetch.QuestionPrefetcher(workers=0))
+        monkeypatch.setattr(prefetch, "generate_question", broken_generate)
+        ws.send_json({"type": "answer", "userAnswer": _solution(db_session, question["questionId"])})
+        result = ws.receive_json()
+        assert result["type"] == "result" and result["isCorrect"] and result["newTotalScore"] == 1
+        assert result["nextQuestion"] is None
+        assert ws.receive_json() == {"type": "error", "detail": practice.NEXT_QUESTION_FAILED_DETAIL}
+
+        monkeypatch.undo()
+        ws.send_json(NEXT)
+        assert ws.receive_json()["type"] == "question"
+    db_session.expire_all()
+    assert db_session.get(Question, question["questionId"]).attempts_used == 1
+
+
+def test_purchase_pushes_score_and_stage_changes(db_session):
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(LOGIN)
+        user_id = ws.receive_json()["userId"]
+
+        ws.send_json({"type": "buy", "foodId": "feast"})
+        assert ws.receive_json() == {"type": "error", "detail": "积分不足"}
+
+        db_session.query(User).filter_by(id=user_id).update({"total_score": 100})
+        db_session.commit()
+        ws.send_json({"type": "buy", "foodId": "feast"})
+        first = ws.receive_json()
+        assert first["newTotalScore"] == 50 and first["catScore"] == 50
+        assert first["currentCatStage"] == 1 and not first["stageChanged"]
+
+        ws.send_json({"type": "buy", "foodId": "basic-kibble"})
+        second = ws.receive_json()
+        assert second["catScore"] == 55 and second["currentCatStage"] == 2 and second["stageChanged"]
+
+
+def test_errors_keep_the_connection_open():
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(LOGIN)
+        ws.receive_json()
+        ws.send_json({"type": "answer", "userAnswer": "x"})
+        assert ws.receive_json() == {"type": "error", "detail": "请先获取题目"}
+        ws.send_text("not json")
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"type": "next", "topic": "calculus", "difficultyLevel": "basic"})
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json(NEXT)
+        assert ws.receive_json()["type"] == "question"
+
+
+def test_generation_failure_on_next_keeps_the_connection_open(monkeypatch):
+    def broken_generate(*args, **kwargs):
+        raise RuntimeError("未能在合理次数内生成满足难度的题目")
+
+    monkeypatch.setattr(practice, "get_question_prefetcher", lambda: prefetch.QuestionPrefetcher(workers=0))
+    monkeypatch.setattr(prefetch, "generate_question", broken_generate)
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(LOGIN)
+        ws.receive_json()
+        ws.send_json(NEXT)
+        assert ws.receive_json() == {"type": "error", "detail": "未能在合理次数内生成满足难度的题目"}
+        ws.send_json({"type": "buy", "foodId": "feast"})
+        assert ws.receive_json()["detail"] == "积分不足"
+
+
+def test_first_message_must_log_in():
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(NEXT)
+        assert ws.receive_json()["type"] == "error"
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1008
+
+
+def test_sessions_are_opened_per_message(monkeypatch):
+    open_sessions = []
+
+    def counting_get_db():
+        db = TestingSessionLocal()
+        open_sessions.append(db)
+        try:
+            yield db
+        finally:
+            open_sessions.remove(db)
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, counting_get_db)
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(LOGIN)
+        ws.receive_json()
+        # 连接空闲时不占用 Session。
+        assert open_sessions == []
+        ws.send_json(NEXT)
+        assert ws.receive_json()["type"] == "question"
+        assert open_sessions == []
+        ws.send_json({"type": "answer", "userAnswer": "0"})
+        assert ws.receive_json()["attemptCount"] == 1
+        assert open_sessions == []
+
+
+def test_unexpected_errors_close_with_1011(monkeypatch):
+    def broken_purchase(*args):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(practice, "purchase_food", broken_purchase)
+    with TestClient(app).websocket_connect("/ws/practice") as ws:
+        ws.send_json(LOGIN)
+        ws.receive_json()
+        ws.send_json({"type": "buy", "foodId": "feast"})
+        assert ws.receive_json() == {"type": "error", "detail": practice.SERVER_ERROR_DETAIL}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1011
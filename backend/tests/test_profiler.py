@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.main import app
+from backend.profiler import ProfilerMiddleware, StackSampler, profile_path
+
+SECRET = "classroom-debug"
+
+
+def _busy_wait(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampler_folds_busy_thread_stacks():
+    with StackSampler(interval=0.001) as sampler:
+        _busy_wait(0.05)
+    collapsed = sampler.collapsed()
+    assert "_busy_wait (test_profiler.py" in collapsed
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+
+
+def test_profiled_request_is_saved_and_downloadable(tmp_path, monkeypatch):
+    profiled = TestClient(ProfilerMiddleware(app, secret=SECRET, output_dir=tmp_path, interval_ms=0.5))
+    user_id = profiled.post(
+        "/api/login",
+        json={"chinese_name": "分析", "english_name": "Profile", "class_name": "P1"},
+    ).json()["userId"]
+
+    plain = profiled.get(f"/api/users/{user_id}/summary")
+    assert "x-profile-id" not in plain.headers
+    wrong = profiled.get(f"/api/users/{user_id}/summary", headers={"X-Profile": "guess"})
+    assert "x-profile-id" not in wrong.headers
+    assert list(tmp_path.iterdir()) == []
+
+    resp = profiled.get(f"/api/users/{user_id}/summary", headers={"X-Profile": SECRET})
+    assert resp.status_code == 200
+    profile_id = resp.headers["x-profile-id"]
+    assert profile_path(tmp_path, profile_id) is not None
+
+    monkeypatch.setattr(main.settings, "profile_secret", SECRET)
+    monkeypatch.setattr(main.settings, "profile_dir", str(tmp_path))
+    client = TestClient(app)
+    assert client.get("/api/debug/profiles").status_code == 404
+    assert client.get("/api/debug/profiles", headers={"X-Profile": SECRET}).json() == [profile_id]
+    download = client.get(f"/api/debug/profiles/{profile_id}", headers={"X-Profile": SECRET})
+    assert download.status_code == 200
+    assert download.text == profile_path(tmp_path, profile_id).read_text()
+    assert client.get("/api/debug/profiles/..%2Fdata", headers={"X-Profile": SECRET}).status_code == 404
+
+
+def test_sampler_that_fails_to_start_raises_its_own_error(tmp_path, monkeypatch):
+    def broken_enter(self):
+        raise RuntimeError("can't start new thread")
+
+    monkeypatch.setattr(StackSampler, "__enter__", broken_enter)
+    profiled = TestClient(ProfilerMiddleware(app, secret=SECRET, output_dir=tmp_path))
+    with pytest.raises(RuntimeError, match="can't start new thread"):
+        profiled.get("/api/foods", headers={"X-Profile": SECRET})
+    assert not tmp_path.exists() or list(tmp_path.iterdir()) == []
+
+
+def test_profile_endpoints_are_hidden_without_secret():
+    client = TestClient(app)
+    assert client.get("/api/debug/profiles", headers={"X-Profile": ""}).status_code == 404
@@ -1,7 +1,12 @@
 import pytest
 import pytest_asyncio
+from fastapi.testclient import TestClient
 from httpx import AsyncClient
+from sqlalchemy import event
+
+from conftest import test_engine
 from backend.main import app
+from backend.models import Question
 from backend.schemas import BatchGenerateRequest
 
 
@@ -64,3 +69,52 @@ async def test_batch_generate_max_count():
         assert resp.status_code == 200
         data = resp.json()
         assert len(data["questions"]) == 20
+
+
+def test_batch_for_user_persists_in_one_commit(db_session):
+    client = TestClient(app)
+    user_id = client.post(
+        "/api/login", json={"chinese_name": "练习卷", "english_name": "Sheet", "class_name": "C1"}
+    ).json()["userId"]
+
+    inserts, commits = [], []
+    on_execute = lambda conn, cursor, statement, params, context, executemany: (  # noqa: E731
+        inserts.append(executemany) if statement.lstrip().upper().startswith("INSERT") else None
+    )
+    on_commit = lambda conn: commits.append(1)  # noqa: E731
+    event.listen(test_engine, "before_cursor_execute", on_execute)
+    event.listen(test_engine, "commit", on_commit)
+    try:
+        resp = client.post("/api/questions/batch", json={"count": 5, "difficulty": "basic", "userId": user_id})
+    finally:
+        event.remove(test_engine, "before_cursor_execute", on_execute)
+        event.remove(test_engine, "commit", on_commit)
+
+    assert resp.status_code == 200
+    questions = resp.json()["questions"]
+    assert len(questions) == 5
+    # 入库的题目要判题计分，不返回答案。
+    assert all("solutionExpression" not in q for q in questions)
+    assert inserts == [True] and len(commits) == 1
+
+    rows = {q.question_id: q for q in db_session.query(Question).filter_by(user_id=user_id)}
+    assert set(rows) == {q["questionId"] for q in questions}
+
+    first = questions[0]
+    checked = client.post(
+        "/api/check_answer",
+        json={
+            "userId": user_id,
+            "questionId": first["questionId"],
+            "expressionText": first["expressionText"],
+            "topic": first["topic"],
+            "difficultyLevel": first["difficultyLevel"],
+            "userAnswer": rows[first["questionId"]].solution_expression,
+        },
+    )
+    assert checked.status_code == 200 and checked.json()["isCorrect"]
+
+
+def test_batch_for_unknown_user_is_404():
+    resp = TestClient(app).post("/api/questions/batch", json={"count": 1, "userId": 9999})
+    assert resp.status_code == 404
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+import backend.practice as practice
+from backend.metrics import REGISTRY
+from backend.rate_limit import Budget, RateLimiter
+
+client = TestClient(main.app)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_limiter(tmp_path, clock):
+    limiters = []
+
+    def make(**budgets: Budget) -> RateLimiter:
+        limiter = RateLimiter(tmp_path / "rate_limit.db", budgets, ip_multiplier=2, clock=clock)
+        limiters.append(limiter)
+        return limiter
+
+    yield make
+    for limiter in limiters:
+        limiter.close()
+
+
+def test_bucket_refills_over_time(make_limiter, clock):
+    limiter = make_limiter(check=Budget(capacity=2, per_second=0.5))
+    assert limiter.acquire("check", user_id=1).allowed
+    assert limiter.acquire("check", user_id=1).allowed
+    denied = limiter.acquire("check", user_id=1)
+    assert not denied.allowed and denied.limited_by == "user"
+    assert denied.retry_after == pytest.approx(2.0) and denied.retry_after_header == "2"
+    # 其他学生的桶互不影响。
+    assert limiter.acquire("check", user_id=2).allowed
+
+    clock.now += 2
+    assert limiter.acquire("check", user_id=1).allowed
+    assert not limiter.acquire("check", user_id=1).allowed
+
+
+def test_ip_budget_is_shared_and_charged_atomically(make_limiter):
+    limiter = make_limiter(generate=Budget(capacity=2, per_second=1))
+    # IP 额度 = 学生额度 × 2：同一教室的第三名学生用完后整个 IP 被限流。
+    for user_id in (1, 1, 2, 3):
+        assert limiter.acquire("generate", user_id=user_id, ip="10.0.0.1").allowed
+    denied = limiter.acquire("generate", user_id=4, ip="10.0.0.1")
+    assert not denied.allowed and denied.limited_by == "ip"
+    # 被 IP 拒绝的请求没有扣掉学生 4 的令牌。
+    assert limiter.acquire("generate", user_id=4, ip="10.0.0.2").allowed
+    assert limiter.acquire("generate", user_id=4, ip="10.0.0.2").allowed
+
+
+def test_workers_share_buckets_and_oversized_costs_take_a_full_bucket(make_limiter):
+    first_worker = make_limiter(generate=Budget(capacity=5, per_second=1))
+    other_worker = make_limiter(generate=Budget(capacity=5, per_second=1))
+    assert first_worker.acquire("generate", user_id=1, cost=20).allowed
+    denied = other_worker.acquire("generate", user_id=1)
+    assert not denied.allowed and denied.retry_after == pytest.approx(1.0)
+
+
+def test_http_endpoints_return_429_with_retry_after(make_limiter, monkeypatch):
+    limiter = make_limiter(
+        generate=Budget(capacity=1, per_second=0.1), check=Budget(capacity=5, per_second=1), image=Budget(1, 1)
+    )
+    monkeypatch.setattr(main, "get_rate_limiter", lambda: limiter)
+    user_id = client.post(
+        "/api/login", json={"chinese_name": "限流", "english_name": "Limit", "class_name": "C1"}
+    ).json()["userId"]
+    body = {"userId": user_id, "topic": "factorization", "difficultyLevel": "basic"}
+
+    assert client.post("/api/generate_question", json=body).status_code == 200
+    limited = client.post("/api/practice/next", json=body)
+    assert limited.status_code == 429
+    assert limited.headers["retry-after"] == "10" and limited.json()["detail"] == "请求过于频繁，请稍后再试"
+    assert client.post("/api/questions/batch", json={"count": 2, "userId": user_id}).status_code == 429
+
+    metrics = REGISTRY.render()
+    assert 'rate_limit_decisions_total{scope="generate",outcome="limited_user"}' in metrics
+    assert 'component_duration_seconds_count{component="rate_limit"}' in metrics
+
+
+def test_socket_messages_share_the_budget(make_limiter, monkeypatch):
+    limiter = make_limiter(generate=Budget(capacity=1, per_second=0.1), check=Budget(capacity=5, per_second=1))
+    monkeypatch.setattr(practice, "get_rate_limiter", lambda: limiter)
+    with client.websocket_connect("/ws/practice") as ws:
+        ws.send_json({"type": "login", "chinese_name": "限流", "english_name": "Socket", "class_name": "C1"})
+        ws.receive_json()
+        next_message = {"type": "next", "topic": "factorization", "difficultyLevel": "basic"}
+        ws.send_json(next_message)
+        assert ws.receive_json()["type"] == "question"
+        ws.send_json(next_message)
+        error = ws.receive_json()
+        assert error["type"] == "error" and error["retryAfter"] == 10
+        # 连接保持打开，判题走另一份额度。
+        ws.send_json({"type": "answer", "userAnswer": "0"})
+        assert ws.receive_json()["type"] == "result"
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from backend.benchmarks.replay import diff_reports, recorded_user, replay
+from backend.main import app
+from backend.models import QuestionAttempt, User
+from backend.request_log import RequestLog, RequestRecorderMiddleware, read_log
+
+
+def _record_session(log: RequestLog) -> int:
+    client = TestClient(RequestRecorderMiddleware(app, log=log))
+    user_id = client.post(
+        "/api/login",
+        json={"chinese_name": "回放", "english_name": "Replay", "class_name": "R1"},
+    ).json()["userId"]
+    question = client.post(
+        "/api/generate_question",
+        json={"userId": user_id, "topic": "add_sub", "difficultyLevel": "basic"},
+    ).json()
+    for answer in ("x+", "2x + 1", "0"):
+        client.post(
+            "/api/check_answer",
+            json={
+                "userId": user_id,
+                "questionId": question["questionId"],
+                "expressionText": question["expressionText"],
+                "topic": question["topic"],
+                "difficultyLevel": question["difficultyLevel"],
+                "userAnswer": answer,
+            },
+        )
+    client.get(f"/api/users/{user_id}/summary")
+    client.get("/api/history", params={"user_id": user_id, "limit": 5})
+    client.get("/api/foods")
+    client.get("/metrics")
+    log.flush()
+    return user_id
+
+
+def test_recorder_writes_compact_gzip_log(tmp_path):
+    log = RequestLog(tmp_path / "requests-{pid}.jsonl.gz", flush_every=3)
+    user_id = _record_session(log)
+    assert log.path.name.endswith(".jsonl.gz") and "{pid}" not in log.path.name
+
+    records = list(read_log(log.path))
+    assert [r["r"] for r in records] == [
+        "/api/login",
+        "/api/generate_question",
+        "/api/check_answer",
+        "/api/check_answer",
+        "/api/check_answer",
+        "/api/users/{user_id}/summary",
+        "/api/history",
+        "/api/foods",
+    ]
+    login, generate, first_answer = records[:3]
+    assert login["ids"] == {"userId": user_id}
+    # 姓名不落盘，换成化名；班级保留。
+    assert "回放" not in login["b"] and "Replay" not in login["b"]
+    body = json.loads(login["b"])
+    assert body["english_name"] == log.pseudonym("Replay") and body["class_name"] == "R1"
+    assert "questionId" in generate["ids"]
+    assert '"userAnswer":"x+"' in first_answer["b"].replace(" ", "")
+    assert first_answer["s"] == 400
+    assert records[6]["q"] == f"user_id={user_id}&limit=5"
+    assert all(r["d"] >= 0 for r in records)
+    assert all(recorded_user(r) == user_id for r in records[:7])
+    assert recorded_user(records[7]) is None
+
+
+def test_replay_remaps_ids_and_reports_latency(tmp_path, db_session):
+    log = RequestLog(tmp_path / "requests.jsonl")
+    _record_session(log)
+    records = list(read_log(log.path))
+    # 日志里是化名，回放时会创建新的学生、得到新的编号，后续请求都要映射过去。
+    pseudonym = json.loads(records[0]["b"])["english_name"]
+
+    report = asyncio.run(replay(records, "http://replay", speed=0, transport=httpx.ASGITransport(app=app)))
+    data = report.as_dict()
+    assert data["requests"] == len(records)
+    assert data["errors"] == 0
+    assert data["endpoints"]["POST /api/check_answer"]["count"] == 3
+
+    copy = db_session.query(User).filter_by(english_name=pseudonym).one()
+    answers = [a.user_answer for a in db_session.query(QuestionAttempt).filter_by(user_id=copy.id)]
+    assert sorted(answers) == ["0", "2x + 1"]
+
+    rows = diff_reports(data, data)
+    assert {row["endpoint"] for row in rows} == set(data["endpoints"])
+    assert all(row["p50_ms"][2] in (0.0, None) for row in rows)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import backend.database as database
+from backend.database import Base
+from backend.migrations import MIGRATIONS
+from backend.models import ArchivedRecord, Question, QuestionAttempt, User
+from backend.retention import load_archive, main, run_retention
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def retention_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'retention.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def _seed(engine) -> None:
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add(User(id=1, chinese_name="归档", english_name="Archive", class_name="R1"))
+        rows = [
+            # (question_id, age in days, attempts_used, is_solved)
+            ("old-abandoned", 60, 0, False),
+            ("fresh-abandoned", 2, 0, False),
+            ("old-solved", 400, 1, True),
+            ("old-unsolved", 300, 2, False),
+            ("recent-solved", 10, 1, True),
+        ]
+        for question_id, age, attempts, solved in rows:
+            db.add(
+                Question(
+                    question_id=question_id,
+                    user_id=1,
+                    expression_text="x" + " + x" * 40,
+                    solution_expression="41*x",
+                    topic="add_sub",
+                    difficulty_level="basic",
+                    difficulty_score=10,
+                    attempts_used=attempts,
+                    is_solved=solved,
+                    created_at=NOW - timedelta(days=age),
+                )
+            )
+        db.add(
+            QuestionAttempt(
+                question_id="old-solved",
+                user_id=1,
+                expression_text="x + x",
+                topic="add_sub",
+                difficulty_level="basic",
+                difficulty_score=10,
+                user_answer="2x",
+                is_correct=True,
+                score_change=1,
+                attempt_index=1,
+                created_at=NOW - timedelta(days=400),
+            )
+        )
+        db.commit()
+
+
+def test_retention_archives_and_purges(retention_engine):
+    _seed(retention_engine)
+
+    dry = run_retention(
+        retention_engine, archive_after_days=180, abandon_after_days=30, dry_run=True, now=NOW
+    )
+    assert (dry.archived_questions, dry.purged_questions) == (2, 1)
+
+    report = run_retention(
+        retention_engine,
+        archive_after_days=180,
+        abandon_after_days=30,
+        attempts_after_days=365,
+        batch_size=1,
+        now=NOW,
+    )
+    assert report.archived_questions == 2
+    assert report.purged_questions == 1
+    assert report.archived_attempts == 1
+
+    Session = sessionmaker(bind=retention_engine)
+    with Session() as db:
+        remaining = {q.question_id for q in db.query(Question)}
+        assert remaining == {"fresh-abandoned", "recent-solved"}
+        assert db.query(QuestionAttempt).count() == 0
+
+        archives = db.query(ArchivedRecord).filter_by(kind="question").all()
+        archived_ids = {row["question_id"] for a in archives for row in load_archive(a.payload)}
+        assert archived_ids == {"old-solved", "old-unsolved"}
+        assert all(a.user_id == 1 and a.record_count == 1 for a in archives)
+
+
+def test_full_vacuum_enables_incremental_reclaim(retention_engine):
+    _seed(retention_engine)
+
+    first = run_retention(
+        retention_engine, archive_after_days=180, abandon_after_days=30, full_vacuum=True, now=NOW
+    )
+    assert first.vacuum_mode == "full"
+    assert first.free_pages_after == 0
+
+    second = run_retention(retention_engine, archive_after_days=0, abandon_after_days=0, now=NOW)
+    assert second.vacuum_mode == "incremental"
+    assert second.free_pages_after == 0
+    assert second.reclaimed_bytes >= 0
+
+
+def test_cli_migrates_before_archiving(retention_engine, monkeypatch, capsys):
+    monkeypatch.setattr(database, "engine", retention_engine)
+    monkeypatch.setattr("sys.argv", ["retention", "--dry-run"])
+    # 旧库（user_version 落后）不做只读统计。
+    with pytest.raises(SystemExit):
+        main()
+    assert "--dry-run" in capsys.readouterr().err
+
+    monkeypatch.setattr("sys.argv", ["retention"])
+    main()
+    with retention_engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA user_version").scalar() == len(MIGRATIONS)
+
+
+def test_cli_dry_run_does_not_touch_the_schema(tmp_path, monkeypatch, capsys):
+    engine = create_engine(f"sqlite:///{tmp_path / 'untouched.db'}")
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr("sys.argv", ["retention", "--dry-run"])
+
+    def schema():
+        with engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT type, name, sql FROM sqlite_master ORDER BY name").all()
+
+    with pytest.raises(SystemExit):
+        main()
+    assert schema() == []
+
+    monkeypatch.setattr("sys.argv", ["retention"])
+    main()
+    migrated = schema()
+    monkeypatch.setattr("sys.argv", ["retention", "--dry-run"])
+    main()
+    assert schema() == migrated
+    capsys.readouterr()
+    engine.dispose()
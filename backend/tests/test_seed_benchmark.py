@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from collections import Counter
+
+from sqlalchemy import create_engine, func, inspect, select
+
+from backend.benchmarks.queries import run_benchmark
+from backend.benchmarks.seed import seed_database
+from backend.models import FoodPurchase, Question, QuestionAttempt, User
+from backend.question_generator import GeneratedQuestion
+
+POOL = [
+    GeneratedQuestion(
+        question_id="pool-1", expression_text="(2x+3)-(x-1)", expression_latex="", solution_expression="x + 4",
+        topic="add_sub", difficulty_level="basic", difficulty_score=10,
+    ),
+    GeneratedQuestion(
+        question_id="pool-2", expression_text="3x*2y", expression_latex="", solution_expression="6*x*y",
+        topic="mul_div", difficulty_level="advanced", difficulty_score=70,
+    ),
+]
+
+
+def test_seed_then_benchmark_read_paths(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bench.db'}")
+    report = seed_database(engine, users=30, questions=2_000, batch_size=300, pool=POOL, seed=3, skew=1.2)
+
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(User)) == 30
+        assert conn.scalar(select(func.count()).select_from(Question)) == report.questions == 2_000
+        assert conn.scalar(select(func.count()).select_from(QuestionAttempt)) == report.attempts
+        assert conn.scalar(select(func.count()).select_from(FoodPurchase)) == report.purchases
+        assert conn.scalar(select(func.min(User.total_score))) >= 0
+        owners = Counter(row[0] for row in conn.execute(select(Question.user_id)))
+    # Zipf 分布：最活跃的学生远多于中位数学生。
+    counts = sorted(owners.values(), reverse=True)
+    assert counts[0] > 5 * counts[len(counts) // 2]
+    index_names = {index["name"] for index in inspect(engine).get_indexes("question_attempts")}
+    assert "ix_question_attempts_user_created" in index_names
+
+    results = run_benchmark(engine, iterations=2, with_plans=True)
+    heavy = {result.name: result for result in results if result.tier == "heavy"}
+    assert {"recent_questions", "history_deep_page", "cat_score", "history_dedupe"} <= set(heavy)
+    assert "USING INDEX ix_questions_user_created" in heavy["recent_questions"].plans[0]
+    assert heavy["history_dedupe"].statements == 1
+    assert all(len(result.timings) == 2 for result in results)
+    engine.dispose()
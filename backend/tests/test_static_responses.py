@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import json
+
+import brotli
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from backend.foods import FOODS
+from backend.main import app
+from backend.responses import json_response, matching_etag, negotiate_encoding
+
+client = TestClient(app)
+
+
+def _request(accept_encoding: str, if_none_match: str | None = None) -> Request:
+    headers = [(b"accept-encoding", accept_encoding.encode())]
+    if if_none_match is not None:
+        headers.append((b"if-none-match", if_none_match.encode()))
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.mark.parametrize(
+    ("header", "expected"),
+    [
+        ("", "identity"),
+        ("gzip, deflate", "gzip"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("gzip;q=0, identity", "identity"),
+        ("*", "gzip"),
+    ],
+)
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(_request(header), {"identity", "gzip"}) == expected
+
+
+def test_foods_are_served_precompressed():
+    resp = client.get("/api/foods", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert resp.headers["cache-control"].startswith("public")
+    assert [f["foodId"] for f in resp.json()["foods"]] == [f.food_id for f in FOODS]
+
+    plain = client.get("/api/foods", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    # 每种编码各自一个 ETag。
+    assert resp.headers["etag"] == plain.headers["etag"][:-1] + '-gzip"'
+    assert json.loads(plain.content) == resp.json()
+    assert resp.num_bytes_downloaded < len(plain.content)
+
+
+def test_foods_not_modified():
+    etag = client.get("/api/foods").headers["etag"]
+    resp = client.get("/api/foods", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+
+def test_not_modified_only_for_the_negotiated_coding():
+    gzip_etag = client.get("/api/foods", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    same = client.get("/api/foods", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+    assert same.status_code == 304 and same.headers["etag"] == gzip_etag
+    # 缓存的是 gzip 副本，客户端却不再接受 gzip：必须返回完整的 identity 内容。
+    plain = client.get("/api/foods", headers={"Accept-Encoding": "identity", "If-None-Match": gzip_etag})
+    assert plain.status_code == 200 and "content-encoding" not in plain.headers
+
+
+def test_json_response_suffixes_the_etag_of_compressed_bodies():
+    body = b'{"questions":[' + b",".join([b'{"x":1}'] * 50) + b"]}"
+    compressed = json_response(_request("gzip"), body, headers={"ETag": '"recent-1-2"'}, min_size=100)
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["etag"] == '"recent-1-2-gzip"'
+    small = json_response(_request("gzip"), b"{}", headers={"ETag": '"recent-1-2"'}, min_size=100)
+    assert small.headers["etag"] == '"recent-1-2"'
+
+    assert matching_etag(_request("gzip", '"recent-1-2-gzip"'), '"recent-1-2"') == '"recent-1-2-gzip"'
+    assert matching_etag(_request("gzip", '"recent-1-2"'), '"recent-1-2"') == '"recent-1-2"'
+    assert matching_etag(_request("identity", '"recent-1-2-gzip"'), '"recent-1-2"') is None
+
+
+def test_json_response_negotiates_brotli():
+    body = b'{"questions":[' + b",".join([b'{"x":1}'] * 50) + b"]}"
+    resp = json_response(_request("gzip, br"), body, headers={"ETag": '"recent-1-2"'}, min_size=100)
+    assert resp.headers["content-encoding"] == "br"
+    assert resp.headers["etag"] == '"recent-1-2-br"'
+    assert brotli.decompress(resp.body) == body
+    assert matching_etag(_request("br", '"recent-1-2-br"'), '"recent-1-2"') == '"recent-1-2-br"'
+    assert matching_etag(_request("gzip", '"recent-1-2-br"'), '"recent-1-2"') is None
+
+
+def test_foods_brotli_variant():
+    resp = client.get("/api/foods", headers={"Accept-Encoding": "br, gzip"})
+    assert resp.headers["content-encoding"] == "br"
+
+
+def test_cat_stage_table():
+    stages = client.get("/api/cat_stages").json()["stages"]
+    assert stages == [
+        {"stage": 1, "minScore": 0, "maxScore": 50},
+        {"stage": 2, "minScore": 51, "maxScore": 150},
+        {"stage": 3, "minScore": 151, "maxScore": 200},
+        {"stage": 4, "minScore": 201, "maxScore": None},
+    ]
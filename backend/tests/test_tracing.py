@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import json
+
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.main import app
+from backend.tracing import TraceRecorder, TracingMiddleware, get_trace_recorder, span, trace_engine
+from conftest import test_engine
+
+client = TestClient(app)
+trace_engine(test_engine)
+SECRET = "trace-secret"
+
+
+def _answer_flow() -> None:
+    user_id = client.post(
+        "/api/login",
+        json={"chinese_name": "追踪", "english_name": "Trace", "class_name": "T1"},
+    ).json()["userId"]
+    question = client.post(
+        "/api/generate_question",
+        json={"userId": user_id, "topic": "add_sub", "difficultyLevel": "basic"},
+    ).json()
+    client.post(
+        "/api/check_answer",
+        json={
+            "userId": user_id,
+            "questionId": question["questionId"],
+            "expressionText": question["expressionText"],
+            "topic": question["topic"],
+            "difficultyLevel": question["difficultyLevel"],
+            "userAnswer": "0",
+        },
+    )
+
+
+def test_sampled_requests_record_nested_spans(monkeypatch):
+    recorder = get_trace_recorder()
+    recorder.clear()
+    monkeypatch.setattr(recorder, "sample_rate", 1.0)
+    monkeypatch.setattr(recorder, "slow_ms", 60_000.0)
+    monkeypatch.setattr(main.settings, "profile_secret", SECRET)
+
+    _answer_flow()
+
+    # 调试接口与 profile 下载共用 PROFILE_SECRET，不带密钥时返回 404。
+    assert client.get("/api/debug/traces").status_code == 404
+    traces = client.get("/api/debug/traces", params={"limit": 10}, headers={"X-Profile": SECRET}).json()
+    by_route = {trace["route"]: trace for trace in traces}
+    generate = by_route["/api/generate_question"]
+    assert generate["reason"] == "sampled"
+    assert any(s["name"] == "generate_question.attempt" for s in generate["spans"])
+    assert any(s["name"] == "db.commit" for s in generate["spans"])
+
+    check = by_route["/api/check_answer"]
+    names = [s["name"] for s in check["spans"]]
+    assert names.count("normalize_expr") == 2
+    assert "compare_expressions" in names
+    assert any(s["name"] == "db.query" and "UPDATE" in s["attrs"]["statement"] for s in check["spans"])
+    assert all(s["duration_ms"] >= 0 for s in check["spans"])
+
+
+def test_unsampled_fast_requests_are_dropped(monkeypatch):
+    recorder = get_trace_recorder()
+    recorder.clear()
+    monkeypatch.setattr(recorder, "sample_rate", 0.0)
+    monkeypatch.setattr(recorder, "slow_ms", 60_000.0)
+
+    resp = client.get("/api/foods")
+    assert resp.headers["x-trace-id"]
+    assert recorder.recent() == []
+
+
+def test_slow_requests_are_always_kept_and_exported(tmp_path):
+    export = tmp_path / "traces.jsonl"
+    recorder = TraceRecorder(sample_rate=0.0, slow_ms=0.0, export_path=str(export))
+
+    async def endpoint(scope, receive, send):
+        with span("work", step=1):
+            with span("inner"):
+                pass
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    local = TestClient(TracingMiddleware(endpoint, recorder=recorder))
+    assert local.get("/slow").status_code == 204
+
+    [trace] = recorder.recent(slow_only=True)
+    assert trace["reason"] == "slow"
+    assert trace["status"] == 204
+    work, inner = trace["spans"]
+    assert work["attrs"] == {"step": 1}
+    assert inner["parent_id"] == work["span_id"]
+    assert json.loads(export.read_text())["trace_id"] == trace["trace_id"]
+
+
+def test_spans_outside_requests_are_noops():
+    with span("orphan") as record:
+        assert record is None
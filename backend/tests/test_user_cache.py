@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+import backend.main as main
+from backend.main import app
+from backend.metrics import USER_CACHE_LOOKUPS
+from backend.models import User
+from backend.user_cache import UserCache, get_user_cache
+
+client = TestClient(app)
+
+
+def _login() -> int:
+    resp = client.post(
+        "/api/login",
+        json={"chinese_name": "缓存", "english_name": "Cache", "class_name": "U1"},
+    )
+    return resp.json()["userId"]
+
+
+def test_repeated_reads_hit_the_cache(monkeypatch):
+    monkeypatch.setattr(main.settings, "profile_secret", "cache-secret")
+    user_id = _login()
+    for _ in range(3):
+        assert client.get("/api/history", params={"user_id": user_id}).status_code == 200
+
+    for route in ("user_cache", "prefetch", "class_sets", "idempotency", "traces"):
+        assert client.get(f"/api/debug/{route}").status_code == 404
+    hits_before = USER_CACHE_LOOKUPS.value("hit")
+    stats = client.get("/api/debug/user_cache", headers={"X-Profile": "cache-secret"}).json()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 0
+    assert stats["hit_rate"] == 1.0
+
+    assert client.get("/api/history", params={"user_id": user_id}).status_code == 200
+    assert USER_CACHE_LOOKUPS.value("hit") == hits_before + 1
+    assert 'user_cache_lookups_total{outcome="hit"}' in client.get("/metrics").text
+
+
+def test_summary_detects_writes_from_another_worker(db_session):
+    user_id = _login()
+    assert client.get(f"/api/users/{user_id}/summary").json()["totalScore"] == 0
+
+    # Simulate another uvicorn worker: it bumps the version without touching our cache.
+    db_session.execute(
+        update(User).where(User.id == user_id).values(total_score=42, state_version=User.state_version + 1)
+    )
+    db_session.commit()
+
+    before = get_user_cache().stats()
+    stale_before = USER_CACHE_LOOKUPS.value("stale")
+    assert client.get(f"/api/users/{user_id}/summary").json()["totalScore"] == 42
+    after = get_user_cache().stats()
+    # 旧版本的缓存按未命中计。
+    assert after["stale"] == 1
+    assert (after["hits"], after["misses"]) == (before["hits"], before["misses"] + 1)
+    assert USER_CACHE_LOOKUPS.value("stale") == stale_before + 1
+
+
+def test_local_purchase_invalidates_entry(db_session):
+    user_id = _login()
+    db_session.execute(update(User).where(User.id == user_id).values(total_score=20))
+    db_session.commit()
+    get_user_cache().invalidate(user_id)
+
+    resp = client.post("/api/buy_food", json={"userId": user_id, "foodId": "basic-kibble"})
+    assert resp.json()["newTotalScore"] == 15
+    assert client.get(f"/api/users/{user_id}/summary").json()["totalScore"] == 15
+
+
+def test_ttl_and_lru_bounds(db_session):
+    cache = UserCache(ttl=0, max_entries=1)
+    user_id = _login()
+    assert cache.get(db_session, user_id) is not None
+    assert cache.get(db_session, user_id) is not None
+    assert cache.stats()["hits"] == 0
+
+    cache = UserCache(ttl=60, max_entries=1)
+    other_id = client.post(
+        "/api/login", json={"chinese_name": "另一", "english_name": "Other", "class_name": "U1"}
+    ).json()["userId"]
+    cache.get(db_session, user_id)
+    cache.get(db_session, other_id)
+    assert cache.stats()["size"] == 1
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import backend.main as main
+from backend import write_behind
+from backend.database import Base, get_db
+from backend.main import app
+from backend.models import QuestionAttempt
+from backend.write_behind import WriteBehindQueue
+
+from conftest import TestingSessionLocal
+
+
+def _attempt_values(i: int) -> dict:
+    return dict(
+        question_id=f"q-{i}",
+        user_id=1,
+        expression_text=f"x+{i}",
+        topic="add_sub",
+        difficulty_level="basic",
+        difficulty_score=5,
+        user_answer="x",
+        is_correct=False,
+        score_change=0,
+        attempt_index=1,
+        created_at=datetime.utcnow(),
+    )
+
+
+def _submit_committed(writer: WriteBehindQueue, *indexes: int) -> None:
+    with TestingSessionLocal() as db:
+        for i in indexes:
+            writer.submit(db, QuestionAttempt, _attempt_values(i))
+        db.commit()
+
+
+def test_flush_writes_batches(db_session):
+    writer = WriteBehindQueue(TestingSessionLocal, batch_size=4)
+    with TestingSessionLocal() as db:
+        for i in range(10):
+            writer.submit(db, QuestionAttempt, _attempt_values(i))
+        # 提交前不入队。
+        assert writer.pending() == 0
+        db.commit()
+
+    assert writer.pending() == 10
+    assert db_session.query(QuestionAttempt).count() == 0
+
+    assert writer.flush() == 10
+    assert writer.batches_written == 3
+    assert db_session.query(QuestionAttempt).count() == 10
+
+
+def test_full_queue_writes_synchronously(db_session):
+    writer = WriteBehindQueue(TestingSessionLocal, max_queue=2)
+    _submit_committed(writer, 0, 1, 2)
+
+    assert writer.overflow_writes == 1
+    assert db_session.query(QuestionAttempt).count() == 1
+    writer.stop()
+    assert db_session.query(QuestionAttempt).count() == 3
+
+
+def test_rolled_back_rows_are_not_written(db_session):
+    writer = WriteBehindQueue(TestingSessionLocal, max_queue=1)
+    with TestingSessionLocal() as db:
+        writer.submit(db, QuestionAttempt, _attempt_values(0))
+        db.rollback()
+    with TestingSessionLocal() as db:
+        writer.submit(db, QuestionAttempt, _attempt_values(1))
+    # 回滚、未提交就关闭的行都不写，也不再占用队列容量。
+    _submit_committed(writer, 2)
+    assert writer.overflow_writes == 0
+    writer.stop()
+    assert [a.question_id for a in db_session.query(QuestionAttempt)] == ["q-2"]
+
+
+def test_failed_batch_is_retried_row_by_row(db_session, monkeypatch):
+    writer = WriteBehindQueue(TestingSessionLocal)
+    _submit_committed(writer, 0, 1)
+    original = writer._write
+
+    def failing_write(rows):
+        monkeypatch.setattr(writer, "_write", original)
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(writer, "_write", failing_write)
+    assert writer.flush() == 2
+    assert writer.failed_batches == 1 and writer.pending() == 0
+    assert db_session.query(QuestionAttempt).count() == 2
+
+
+def test_bad_row_is_dropped_without_blocking_the_rest(db_session):
+    writer = WriteBehindQueue(TestingSessionLocal)
+    with TestingSessionLocal() as db:
+        writer.submit(db, QuestionAttempt, _attempt_values(0))
+        writer.submit(db, QuestionAttempt, _attempt_values(1) | {"user_answer": None})
+        writer.submit(db, QuestionAttempt, _attempt_values(2))
+        db.commit()
+
+    assert writer.flush() == 2
+    assert sorted(a.question_id for a in db_session.query(QuestionAttempt)) == ["q-0", "q-2"]
+    # 坏行单独重试，达到上限后丢弃。
+    assert writer.pending() == 1
+    for _ in range(write_behind.MAX_ROW_ATTEMPTS - 1):
+        _submit_committed(writer, 3)
+        writer.flush()
+    assert writer.pending() == 0 and writer.dropped_rows == 1
+    assert db_session.query(QuestionAttempt).count() == 2 + write_behind.MAX_ROW_ATTEMPTS - 1
+
+
+def test_overflow_inside_grading_transaction(tmp_path, monkeypatch):
+    # 文件库：溢出时若另开连接写入，会等待评分事务自己持有的写锁。
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'overflow.db'}", connect_args={"check_same_thread": False, "timeout": 1}
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    writer = WriteBehindQueue(factory, max_queue=1)
+    monkeypatch.setattr(write_behind, "_writer", writer)
+    with factory() as db:
+        writer.submit(db, QuestionAttempt, _attempt_values(0))
+        db.commit()
+
+    client = TestClient(app)
+    user_id = client.post(
+        "/api/login", json={"chinese_name": "溢出", "english_name": "Overflow", "class_name": "Q1"}
+    ).json()["userId"]
+    question_id = client.post(
+        "/api/generate_question", json={"userId": user_id, "topic": "add_sub", "difficultyLevel": "basic"}
+    ).json()["questionId"]
+    resp = client.post(
+        "/api/check_answer",
+        json={
+            "userId": user_id,
+            "questionId": question_id,
+            "expressionText": "",
+            "topic": "add_sub",
+            "difficultyLevel": "basic",
+            "userAnswer": "0",
+        },
+    )
+    assert resp.status_code == 200
+    assert writer.overflow_writes == 1
+    with factory() as db:
+        assert db.query(QuestionAttempt).filter_by(user_id=user_id).count() == 1
+    writer.stop()
+    with factory() as db:
+        assert db.query(QuestionAttempt).count() == 2
+    engine.dispose()
+
+
+@pytest.fixture
+def queued_writer(monkeypatch):
+    writer = WriteBehindQueue(TestingSessionLocal)
+    monkeypatch.setattr(write_behind, "_writer", writer)
+    yield writer
+    writer.stop()
+
+
+def test_answers_and_history_are_queued_until_flush(queued_writer, db_session):
+    client = TestClient(app)
+    user_id = client.post(
+        "/api/login",
+        json={"chinese_name": "排队", "english_name": "Queue", "class_name": "Q1"},
+    ).json()["userId"]
+    question_id = client.post(
+        "/api/generate_question",
+        json={"userId": user_id, "topic": "add_sub", "difficultyLevel": "basic"},
+    ).json()["questionId"]
+
+    resp = client.post(
+        "/api/check_answer",
+        json={
+            "userId": user_id,
+            "questionId": question_id,
+            "expressionText": "",
+            "topic": "add_sub",
+            "difficultyLevel": "basic",
+            "userAnswer": "0",
+        },
+    )
+    assert resp.status_code == 200
+    assert resp.json()["attemptCount"] == 1
+
+    resp = client.post(
+        "/api/history",
+        json={"user_id": user_id, "question_text": "x+1", "user_answer": "0", "score": 0},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["id"] is None
+
+    # 请求路径上不 flush：答题与历史记录都还在队列里。
+    assert queued_writer.pending() == 2
+    assert db_session.query(QuestionAttempt).filter_by(user_id=user_id).count() == 0
+
+    # 与仍在排队的答题记录相同的历史记录不再重复写入。
+    attempt = queued_writer.queued(QuestionAttempt)[0]
+    resp = client.post(
+        "/api/history",
+        json={
+            "user_id": user_id,
+            "question_text": attempt["expression_text"],
+            "user_answer": "0",
+            "score": attempt["score_change"],
+        },
+    )
+    assert resp.status_code == 200 and resp.json()["question_text"] == attempt["expression_text"]
+    assert queued_writer.pending() == 2
+    queued_writer.stop()
+    assert db_session.query(QuestionAttempt).filter_by(user_id=user_id).count() == 2
+
+
+def test_failed_shutdown_step_does_not_skip_the_rest(monkeypatch):
+    closed = []
+
+    def broken_stop():
+        raise RuntimeError("database is locked")
+
+    async def close_ark_client():
+        closed.append("ark")
+
+    monkeypatch.setattr(main, "stop_write_behind", broken_stop)
+    monkeypatch.setattr(main, "close_ark_client", close_ark_client)
+    with TestClient(app):
+        pass
+    assert closed == ["ark"]
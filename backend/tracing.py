@@ -0,0 +1,281 @@
+"""Lightweight per-request trace spans.
+
+Every request collects its spans in memory; when it finishes the trace is kept
+if it was sampled (``trace_sample_rate``) or ran longer than ``trace_slow_ms``.
+Kept traces go to an in-memory ring buffer (``GET /api/debug/traces``) and,
+optionally, to a JSON-lines file. Spans opened outside a request are no-ops.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Iterator, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# SQL 语句写进 span 时截断，避免大批量 IN (...) 撑大缓冲区。
+MAX_STATEMENT_LENGTH = 200
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class SpanRecord:
+    span_id: int
+    parent_id: int | None
+    name: str
+    start_ms: float
+    duration_ms: float = 0.0
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    method: str
+    route: str
+    path: str
+    started_at: str
+    status: int = 500
+    duration_ms: float = 0.0
+    reason: str = ""
+    spans: list[SpanRecord] = field(default_factory=list)
+    _origin: float = field(default_factory=time.perf_counter, repr=False)
+    _next_id: int = field(default=0, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def open_span(self, name: str, parent_id: int | None, attrs: dict[str, Any]) -> SpanRecord:
+        # 同一请求的 span 可能来自线程池，分配编号时加锁。
+        with self._lock:
+            self._next_id += 1
+            record = SpanRecord(
+                span_id=self._next_id,
+                parent_id=parent_id,
+                name=name,
+                start_ms=(time.perf_counter() - self._origin) * 1000,
+                attrs=attrs,
+            )
+            self.spans.append(record)
+        return record
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._origin) * 1000
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "route": self.route,
+            "path": self.path,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 3),
+            "reason": self.reason,
+            "spans": [asdict(record) for record in self.spans],
+        }
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[int | None] = ContextVar("current_span", default=None)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[SpanRecord | None]:
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    record = trace.open_span(name, _current_span.get(), attrs)
+    token = _current_span.set(record.span_id)
+    try:
+        yield record
+    except BaseException as exc:
+        record.attrs["error"] = type(exc).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        record.duration_ms = trace.elapsed_ms() - record.start_ms
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator form of :func:`span` for whole functions."""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+class TraceRecorder:
+    """Decides which finished traces to keep and exports them."""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        slow_ms: float = 500.0,
+        buffer_size: int = 200,
+        export_path: str | None = None,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.export_path = export_path
+        self._buffer: deque[dict[str, Any]] = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+
+    def finish(self, trace: Trace) -> dict[str, Any] | None:
+        """Buffer ``trace`` if it is sampled or slow; returns the kept record, else None."""
+
+        if trace.duration_ms >= self.slow_ms:
+            trace.reason = "slow"
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            trace.reason = "sampled"
+        else:
+            return None
+        data = trace.to_dict()
+        with self._lock:
+            self._buffer.append(data)
+        return data
+
+    def export(self, data: dict[str, Any]) -> None:
+        """Append a kept trace to ``export_path``; blocking, so call it from a worker thread."""
+
+        if not self.export_path:
+            return
+        line = json.dumps(data, ensure_ascii=False, default=str) + "\n"
+        with self._export_lock, open(self.export_path, "a", encoding="utf-8") as fh:
+            fh.write(line)
+
+    def recent(self, limit: int = 20, slow_only: bool = False) -> list[dict[str, Any]]:
+        with self._lock:
+            traces = [t for t in reversed(self._buffer) if not slow_only or t["reason"] == "slow"]
+        return traces[:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buffer.clear()
+
+
+@lru_cache
+def get_trace_recorder() -> TraceRecorder:
+    from .config import get_settings
+
+    settings = get_settings()
+    return TraceRecorder(
+        sample_rate=settings.trace_sample_rate,
+        slow_ms=settings.trace_slow_ms,
+        buffer_size=settings.trace_buffer_size,
+        export_path=settings.trace_export_path,
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is None or _current_trace.get() is None:
+        return
+    statement_span = span("db.query", statement=statement[:MAX_STATEMENT_LENGTH], executemany=executemany)
+    statement_span.__enter__()
+    # 挂在本次执行上而不是连接上：连接可能被多个线程共用（StaticPool），也会被连接池复用。
+    context._trace_span = statement_span
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    statement_span = getattr(context, "_trace_span", None)
+    if statement_span is not None:
+        context._trace_span = None
+        statement_span.__exit__(None, None, None)
+
+
+def _handle_error(exception_context) -> None:
+    context = exception_context.execution_context
+    statement_span = getattr(context, "_trace_span", None)
+    if statement_span is not None:
+        context._trace_span = None
+        error = exception_context.original_exception
+        statement_span.__exit__(type(error), error, error.__traceback__)
+
+
+def trace_engine(target: Engine) -> None:
+    """Emit a ``db.query`` span per statement and a ``db.commit`` span per commit."""
+
+    if event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+    event.listen(target, "handle_error", _handle_error)
+
+    do_commit = target.dialect.do_commit
+
+    def traced_do_commit(dbapi_connection) -> None:
+        with span("db.commit"):
+            do_commit(dbapi_connection)
+
+    target.dialect.do_commit = traced_do_commit
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening one trace per HTTP request."""
+
+    def __init__(self, app: ASGIApp, recorder: TraceRecorder | None = None) -> None:
+        self.app = app
+        self._recorder = recorder
+
+    @property
+    def recorder(self) -> TraceRecorder:
+        return self._recorder or get_trace_recorder()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(
+            trace_id=uuid.uuid4().hex,
+            method=scope["method"],
+            route="unmatched",
+            path=scope["path"],
+            started_at=datetime.utcnow().isoformat(),
+        )
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            trace.duration_ms = trace.elapsed_ms()
+            route = scope.get("route")
+            trace.route = getattr(route, "path", None) or "unmatched"
+            recorder = self.recorder
+            data = recorder.finish(trace)
+            if data is not None and recorder.export_path:
+                # 文件写入放到线程池，不在事件循环上做磁盘 I/O。
+                await run_in_threadpool(recorder.export, data)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .metrics import USER_CACHE_LOOKUPS
+from .models import User
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    chinese_name: str
+    english_name: str
+    class_name: str
+    total_score: int
+    state_version: int
+    updated_at: datetime | None
+
+
+_USER_COLUMNS = (
+    User.id,
+    User.chinese_name,
+    User.english_name,
+    User.class_name,
+    User.total_score,
+    User.state_version,
+    User.updated_at,
+)
+
+
+class UserCache:
+    """TTL-bounded LRU cache of user rows keyed by id.
+
+    Writes in this process invalidate their entry directly. Other uvicorn
+    workers never see that invalidation, so reads that expose mutable fields
+    read :meth:`current_version` and call :meth:`get_at_version`, which only
+    returns a cached copy carrying that ``users.state_version``; plain
+    :meth:`get` is only trusted for up to ``ttl`` seconds. A cached copy at an
+    older version counts as a miss (and as ``stale``).
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 10_000) -> None:
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[float, CachedUser]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, db: Session, user_id: int) -> CachedUser | None:
+        cached = self._lookup(user_id)
+        if cached is not None:
+            return cached
+        return self._load(db, user_id)
+
+    def current_version(self, db: Session, user_id: int) -> int | None:
+        """Read only ``users.state_version``; ``None`` means the user does not exist."""
+
+        version = db.scalar(select(User.state_version).where(User.id == user_id))
+        if version is None:
+            self.invalidate(user_id)
+        return version
+
+    def get_at_version(self, db: Session, user_id: int, version: int) -> CachedUser | None:
+        cached = self._lookup(user_id, version)
+        if cached is not None:
+            return cached
+        return self._load(db, user_id)
+
+    def store(self, user: CachedUser) -> None:
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self._ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.stale = self.evictions = 0
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _lookup(self, user_id: int, version: int | None = None) -> CachedUser | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                USER_CACHE_LOOKUPS.inc("miss")
+                return None
+            if version is not None and entry[1].state_version != version:
+                # 其他 worker 已写入新版本：按未命中计，另记一次 stale。
+                self.misses += 1
+                self.stale += 1
+                USER_CACHE_LOOKUPS.inc("stale")
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            USER_CACHE_LOOKUPS.inc("hit")
+            return entry[1]
+
+    def _load(self, db: Session, user_id: int) -> CachedUser | None:
+        row = db.execute(select(*_USER_COLUMNS).where(User.id == user_id)).first()
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        self.store(user)
+        return user
+
+
+@lru_cache
+def get_user_cache() -> UserCache:
+    settings = get_settings()
+    return UserCache(ttl=settings.user_cache_ttl_seconds, max_entries=settings.user_cache_max_entries)
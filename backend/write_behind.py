@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from collections import defaultdict
+from typing import Any, Callable
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from .config import Settings
+
+logger = logging.getLogger(__name__)
+
+PendingRow = tuple[type, dict[str, Any]]
+# 调用方事务里登记、提交后才入队的行，存放在 Session.info 中。
+_SESSION_KEY = "write_behind_rows"
+# 单独写入仍失败的行最多再尝试这么多次（每次 flush 一次），之后记日志丢弃，不再阻塞队列。
+MAX_ROW_ATTEMPTS = 3
+
+
+class WriteBehindQueue:
+    """Batch append-only inserts into multi-row transactions.
+
+    Rows are flushed by a background thread every ``flush_interval`` seconds,
+    or earlier once ``batch_size`` rows are waiting. A row submitted inside the
+    caller's transaction is only queued once that transaction commits, and is
+    dropped if it rolls back. The queue is bounded: when it is full the row is
+    added to the caller's own session instead (a second connection would wait
+    on the write lock that session already holds). A batch that fails to write
+    is retried row by row; a row that keeps failing on its own is logged and
+    dropped after ``MAX_ROW_ATTEMPTS`` flushes, so one bad row cannot hold up
+    the rest.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        *,
+        max_queue: int = 10_000,
+        batch_size: int = 200,
+        flush_interval: float = 0.05,
+    ) -> None:
+        self._session_factory = session_factory
+        self._queue: queue.Queue[PendingRow] = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._flush_lock = threading.Lock()
+        # 单独写入失败、等下次 flush 再试的行，连同已失败的次数。
+        self._retry: list[tuple[PendingRow, int]] = []
+        # 已出队、正在写入的批次：queued() 仍能看到它们。
+        self._writing: list[PendingRow] = []
+        # 已登记在未提交事务里的行也占用队列容量，提交后入队时才不会超出。
+        self._reserved = 0
+        self._reserve_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.rows_written = 0
+        self.batches_written = 0
+        self.overflow_writes = 0
+        self.failed_batches = 0
+        self.dropped_rows = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and flush everything still queued."""
+
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def submit(self, db: Session, model: type, values: dict[str, Any]) -> None:
+        """Write ``values`` once ``db`` commits; the caller still has to commit."""
+
+        with self._reserve_lock:
+            full = self._queue.qsize() + self._reserved >= self._queue.maxsize
+            if not full:
+                self._reserved += 1
+        if full:
+            self.overflow_writes += 1
+            db.add(model(**values))
+            return
+        if not db.in_transaction():
+            # 先开启事务：没有事务的回滚和关闭不会触发 after_transaction_end。
+            db.begin()
+        if _SESSION_KEY not in db.info:
+            db.info[_SESSION_KEY] = []
+            event.listen(db, "after_commit", self._enqueue_committed)
+            event.listen(db, "after_transaction_end", self._discard_uncommitted)
+        db.info[_SESSION_KEY].append((model, values))
+
+    def _enqueue_committed(self, db: Session) -> None:
+        rows, db.info[_SESSION_KEY] = db.info[_SESSION_KEY], []
+        if not rows:
+            return
+        with self._reserve_lock:
+            for row in rows:
+                self._queue.put_nowait(row)
+            self._reserved -= len(rows)
+        if self._queue.qsize() >= self._batch_size:
+            self._wake.set()
+
+    def _discard_uncommitted(self, db: Session, transaction: Any) -> None:
+        if transaction.parent is not None:
+            return
+        # 回滚或未提交就关闭：这些行不写，释放占用的容量。
+        rows, db.info[_SESSION_KEY] = db.info[_SESSION_KEY], []
+        if rows:
+            with self._reserve_lock:
+                self._reserved -= len(rows)
+
+    def pending(self) -> int:
+        return self._queue.qsize() + len(self._retry)
+
+    def queued(self, model: type) -> list[dict[str, Any]]:
+        """Values of ``model`` rows committed by callers but not yet written."""
+
+        with self._queue.mutex:
+            rows = list(self._queue.queue)
+        rows += self._writing + [row for row, _ in self._retry]
+        return [values for row_model, values in rows if row_model is model]
+
+    def flush(self) -> int:
+        """Write every queued row; returns the number of rows written."""
+
+        written = 0
+        with self._flush_lock:
+            retry, self._retry = self._retry, []
+            for row, failures in retry:
+                written += self._write_row(row, failures)
+            while True:
+                batch = self._writing = []
+                while len(batch) < self._batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return written
+                try:
+                    self._write(batch)
+                except Exception:
+                    self.failed_batches += 1
+                    logger.warning("write-behind batch of %d rows failed; retrying row by row", len(batch))
+                    batch_written = sum(self._write_row(row, 0) for row in batch)
+                    written += batch_written
+                    if not batch_written:
+                        # 整批逐行都失败，多半是数据库本身不可用：其余的行留在队列里等下一次。
+                        return written
+                else:
+                    written += len(batch)
+                finally:
+                    self._writing = []
+
+    def _write_row(self, row: PendingRow, failures: int) -> int:
+        try:
+            self._write([row])
+        except Exception:
+            failures += 1
+            if failures < MAX_ROW_ATTEMPTS:
+                self._retry.append((row, failures))
+            else:
+                self.dropped_rows += 1
+                model, values = row
+                logger.exception(
+                    "write-behind dropped a %s row after %d attempts: %r", model.__name__, failures, values
+                )
+            return 0
+        return 1
+
+    def _write(self, rows: list[PendingRow]) -> None:
+        grouped: dict[type, list[dict[str, Any]]] = defaultdict(list)
+        for model, values in rows:
+            grouped[model].append(values)
+        with self._session_factory() as db:
+            for model, values in grouped.items():
+                db.execute(insert(model), values)
+            db.commit()
+        self.rows_written += len(rows)
+        self.batches_written += 1
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("write-behind flush failed")
+
+
+_writer: WriteBehindQueue | None = None
+
+
+def get_write_behind() -> WriteBehindQueue | None:
+    return _writer
+
+
+def start_write_behind(session_factory: Callable[[], Session], settings: Settings) -> WriteBehindQueue:
+    global _writer
+    if _writer is None:
+        _writer = WriteBehindQueue(
+            session_factory,
+            max_queue=settings.write_behind_max_queue,
+            batch_size=settings.write_behind_batch_size,
+            flush_interval=settings.write_behind_flush_interval_ms / 1000,
+        )
+        _writer.start()
+    return _writer
+
+
+def stop_write_behind() -> None:
+    global _writer
+    if _writer is not None:
+        try:
+            _writer.stop()
+        finally:
+            _writer = None
@@ -1,6 +1,6 @@
 import { useCallback, useEffect, useState } from "react";
 
-import { apiGet, apiPost } from "@/lib/api";
+import { apiGet, apiPostIdempotent } from "@/lib/api";
 import { StoredUser } from "@/lib/userStorage";
 
 export type FoodItem = {
@@ -82,7 +82,7 @@ export function useCatData({ user, onScoreUpdate }: Params) {
       setBuyingId(foodId);
       setError(null);
       try {
-        const payload = await apiPost<BuyResponse>("/api/buy_food", {
+        const payload = await apiPostIdempotent<BuyResponse>("/api/buy_food", {
           userId,
           foodId,
         });
@@ -1,6 +1,6 @@
-import { useCallback, useState } from "react";
+import { useCallback, useRef, useState } from "react";
 
-import { apiPost } from "@/lib/api";
+import { apiPost, apiPostIdempotent } from "@/lib/api";
 
 export type PracticeStatus = "idle" | "correct" | "exhausted";
 
@@ -20,6 +20,7 @@ export type PracticeAnswerResult = {
   newTotalScore: number;
   attemptCount: number;
   solutionExpression?: string;
+  nextQuestion?: PracticeQuestion | null;
 };
 
 type UserShape = {
@@ -51,6 +52,8 @@ export function usePracticeSession({
   const [previousScore, setPreviousScore] = useState<number | null>(null);
   const [solutionExpression, setSolutionExpression] = useState<string | null>(null);
   const [recentRefreshKey, setRecentRefreshKey] = useState(0);
+  // 判题接口在本题结束时顺带返回的下一题，点"下一题"时直接使用。
+  const nextQuestionRef = useRef<PracticeQuestion | null>(null);
 
   const fetchQuestion = useCallback(async () => {
     if (!user?.userId) return false;
@@ -63,12 +66,17 @@ export function usePracticeSession({
     setPreviousScore(null);
     setSolutionExpression(null);
 
+    const stashed = nextQuestionRef.current;
+    nextQuestionRef.current = null;
     try {
-      const payload = await apiPost<PracticeQuestion>("/api/generate_question", {
-        userId: user.userId,
-        topic,
-        difficultyLevel: difficulty,
-      });
+      const payload =
+        stashed && stashed.topic === topic && stashed.difficultyLevel === difficulty
+          ? stashed
+          : await apiPost<PracticeQuestion>("/api/practice/next", {
+              userId: user.userId,
+              topic,
+              difficultyLevel: difficulty,
+            });
       setQuestion(payload);
       setRecentRefreshKey((prev) => prev + 1);
       return true;
@@ -88,7 +96,7 @@ export function usePracticeSession({
       setPreviousScore(user.total_score);
 
       try {
-        const result = await apiPost<PracticeAnswerResult>("/api/check_answer", {
+        const result = await apiPostIdempotent<PracticeAnswerResult>("/api/practice/answer", {
           userId: user.userId,
           questionId: question.questionId,
           expressionText: question.expressionText,
@@ -119,20 +127,9 @@ export function usePracticeSession({
         } else if (result.attemptCount >= 3) {
           setStatus("exhausted");
         }
+        nextQuestionRef.current = result.nextQuestion ?? null;
         onScoreUpdate(result.newTotalScore);
 
-        try {
-          await apiPost("/api/history", {
-            user_id: user.userId,
-            question_text: question.expressionText,
-            user_answer: answer,
-            score: result.scoreChange,
-            correct_answer: result.solutionExpression || null,
-          });
-        } catch (historyErr) {
-          console.error("Failed to save history", historyErr);
-        }
-
         return result;
       } catch (err) {
         setError(err instanceof Error ? err.message : "提交失败，请稍后再试");
@@ -7,7 +7,8 @@ async function request<T>(path: string, options: RequestInit): Promise<T> {
       "Content-Type": "application/json",
       ...(options.headers || {}),
     },
-    cache: "no-store",
+    // GET 允许浏览器缓存但每次都带 If-None-Match 回源校验，未变化时服务端返回 304。
+    cache: options.method === "GET" ? "no-cache" : "no-store",
   });
 
   if (!response.ok) {
@@ -30,6 +31,24 @@ export async function apiPost<T>(path: string, body: unknown): Promise<T> {
   });
 }
 
+// 判题、购买等有副作用的请求：网络中断时自动重试，整个过程共用一个 Idempotency-Key，服务端只执行一次。
+export async function apiPostIdempotent<T>(path: string, body: unknown, retries = 2): Promise<T> {
+  const key = crypto.randomUUID();
+  for (let attempt = 0; ; attempt += 1) {
+    try {
+      return await request<T>(path, {
+        method: "POST",
+        body: JSON.stringify(body),
+        headers: { "Idempotency-Key": key },
+      });
+    } catch (err) {
+      // fetch 只在网络错误时抛 TypeError；服务端返回的错误不重试。
+      if (!(err instanceof TypeError) || attempt >= retries) throw err;
+      await new Promise((resolve) => setTimeout(resolve, 500 * (attempt + 1)));
+    }
+  }
+}
+
 export async function apiGet<T>(path: string): Promise<T> {
   return request<T>(path, {
     method: "GET",